@@ -1,87 +1,313 @@
 import json
 import os
-from openai import OpenAI
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from dotenv import load_dotenv
-load_dotenv()
+import local_classifier
+from metrics import observe_model_call
+from category_cache import CategoryCache, make_key
+from prompt_registry import estimate_tokens, get_prompt, register
 
-# Load API key
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Templates in prompts/ and the placeholders each one fills
+CATEGORISATION_PROMPT = register("ai_categorisation_prompt.txt", ("note", "amount", "date", "description"))
+BATCH_CATEGORISATION_PROMPT = register("ai_batch_categorisation_prompt.txt", ("EXPENSES",))
+INSIGHTS_PROMPT = register("ai_insights_prompt.txt", ("SUMMARY",))
 
-# Paths must be relative to /web/main.py
-CATEGORISATION_PROMPT = "../prompts/ai_categorisation_prompt.txt"
-INSIGHTS_PROMPT = "../prompts/ai_insights_prompt.txt"
+# Batch categorisation settings
+BATCH_SIZE = 50          # expenses per model call
+MAX_CONCURRENT_CALLS = 4
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 0.5   # seconds, doubled on each retry
 
 
-def load_prompt(path):
-    """Loads a prompt template from the given path."""
-    with open(path, "r") as f:
-        return f.read()
+# Created on first use: importing the OpenAI SDK takes most of a second,
+# which every short-lived worker would otherwise pay at startup
+_client = None
+_client_lock = threading.Lock()
 
 
-# -----------------------------
-#  AI CATEGORY PREDICTION
-# -----------------------------
-def get_category_from_ai(note, amount, date, description=""):
-    """Call OpenAI to predict the category."""
+def get_client():
+    """The model client. The first call loads .env and builds the OpenAI client."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from dotenv import load_dotenv
+                from openai import OpenAI
+
+                load_dotenv()
+                _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _client
+
 
-    template = load_prompt(CATEGORISATION_PROMPT)
+def set_client(new_client):
+    """Swap the model client, e.g. for ai_stub.StubClient in benchmarks."""
+    global _client
+    _client = new_client
 
-    final_prompt = (
-        template
-        .replace("<note>", note)
-        .replace("<amount>", str(amount))
-        .replace("<date>", date)
-        .replace("<description>", description or "")
-    )
 
+def complete(call, system, prompt, model="gpt-4o-mini"):
+    """One chat completion, timed and counted under `call` in metrics."""
+    started = time.perf_counter()
+    completion = None
     try:
-        completion = client.chat.completions.create(
-            model="gpt-4o-mini",
+        completion = get_client().chat.completions.create(
+            model=model,
             messages=[
-                {"role": "system", "content": "You are an expense categorisation AI."},
-                {"role": "user", "content": final_prompt}
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
             ]
         )
+        return completion
+    finally:
+        observe_model_call(call, time.perf_counter() - started, completion)
+
+
+def to_json(value):
+    """Compact JSON for prompts: no spaces, and non-ASCII text left as is
+    rather than escaped, both of which cost tokens."""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+# Shared by every categorisation call; see category_cache.py
+category_cache = CategoryCache()
+
+
+# -----------------------------
+#  AI CATEGORY PREDICTION
+# -----------------------------
+def get_category_from_ai(note, amount, date, description="", user_id=None):
+    """Call OpenAI to predict the category.
+
+    The local classifier is tried first (the user's own naive Bayes model
+    when user_id is given, then merchant rules); only notes it is unsure
+    about reach the API. Answers are cached by normalised note/description
+    and prompt version, so repeat merchants don't hit the API.
+    """
+    local = local_classifier.classify(note, description, user_id)
+    if local is not None:
+        return local
+
+    template = get_prompt(CATEGORISATION_PROMPT)
+
+    # None when the note has nothing to key on; such notes skip the cache
+    cache_key = make_key(note, description, template.version)
+    cached = category_cache.get(cache_key) if cache_key is not None else None
+    if cached is not None:
+        return cached
+
+    final_prompt = template.render(note=note, amount=amount, date=date, description=description)
+
+    try:
+        completion = complete("categorise", "You are an expense categorisation AI.", final_prompt)
 
         ai_text = completion.choices[0].message.content.strip()
         parsed = json.loads(ai_text)
 
-        return parsed.get("category", "Miscellaneous")
+        category = parsed.get("category")
+        # Like the batch path, only approved categories are used or cached;
+        # the cache is shared by every user for TTL_SECONDS
+        if category not in load_categories():
+            return "Miscellaneous"
+
+        if cache_key is not None:
+            category_cache.put(cache_key, category)
+        return category
 
     except Exception as e:
         print("AI Error:", e)
         return "Miscellaneous"
 
 
+# -----------------------------
+#  BATCH CATEGORISATION
+# -----------------------------
+def load_categories(name=CATEGORISATION_PROMPT):
+    """The approved category list, read from the prompt's CATEGORY LIST section."""
+    return get_prompt(name).section("CATEGORY LIST")
+
+
+def categorise_batch(expenses, batch_size=BATCH_SIZE, max_workers=MAX_CONCURRENT_CALLS, user_id=None):
+    """Categorise many expenses with as few model calls as possible.
+
+    expenses is a list of dicts with "note" and optionally "description",
+    "amount" and "date". Returns a list of categories in the same order.
+
+    The local classifier answers what it is confident about (see
+    get_category_from_ai), then cached answers are used. The remaining
+    expenses are de-duplicated by cache key (one "Uber" answer covers
+    every Uber line), packed batch_size to a prompt, and sent with at most
+    max_workers calls in flight. Failed batches are retried with
+    exponential backoff. Anything still unanswered falls back to
+    "Miscellaneous".
+    """
+    version = get_prompt(CATEGORISATION_PROMPT).version
+    keys = [make_key(e.get("note"), e.get("description"), version) for e in expenses]
+    # Expenses with nothing to key on are neither cached nor merged with
+    # each other: each gets its position as its own key
+    keys = [i if key is None else key for i, key in enumerate(keys)]
+    model = local_classifier.get_model(user_id) if user_id is not None else None
+
+    results = {}
+    pending = {}  # cache key -> first expense with that key
+    for key, expense in zip(keys, expenses):
+        if key in results or key in pending:
+            continue
+        local = local_classifier.classify(expense.get("note"), expense.get("description"), model=model)
+        if local is not None:
+            results[key] = local
+            continue
+        cached = category_cache.get(key) if isinstance(key, str) else None
+        if cached is not None:
+            results[key] = cached
+        else:
+            pending[key] = expense
+
+    pending_keys = list(pending)
+    chunks = [pending_keys[i:i + batch_size] for i in range(0, len(pending_keys), batch_size)]
+
+    if chunks:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            answers = pool.map(lambda chunk: _categorise_chunk([pending[k] for k in chunk]), chunks)
+            for chunk, categories in zip(chunks, answers):
+                for key, category in zip(chunk, categories):
+                    if category is not None:
+                        if isinstance(key, str):
+                            category_cache.put(key, category)
+                        results[key] = category
+
+    return [results.get(key, "Miscellaneous") for key in keys]
+
+
+def _categorise_chunk(expenses):
+    """One model call for a list of expenses. Returns a category (or None) per expense."""
+    allowed = set(load_categories())
+    items = []
+    for i, e in enumerate(expenses):
+        item = {"id": i, "note": e.get("note") or ""}
+        for field in ("description", "amount", "date"):
+            if e.get(field):
+                item[field] = e[field]
+        items.append(item)
+
+    prompt = get_prompt(BATCH_CATEGORISATION_PROMPT).render(EXPENSES=to_json(items))
+
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            completion = complete(
+                "categorise_batch",
+                "You are an expense categorisation AI. You categorise expenses in batches.",
+                prompt,
+            )
+            parsed = json.loads(completion.choices[0].message.content.strip())
+
+            answers = [None] * len(expenses)
+            for entry in parsed:
+                i = entry.get("id")
+                category = entry.get("category")
+                if isinstance(i, int) and 0 <= i < len(expenses) and category in allowed:
+                    answers[i] = category
+            return answers
+
+        except Exception as e:
+            if attempt == MAX_RETRIES:
+                print("AI Batch Error:", e)
+                return [None] * len(expenses)
+            time.sleep(RETRY_BASE_DELAY * 2 ** attempt * (1 + random.random()))
+
+
+def backfill_categories(user_id, rows, batch_size=BATCH_SIZE, max_workers=MAX_CONCURRENT_CALLS):
+    """Categorise a user's existing transactions and save the results in one write.
+
+    rows are db.Transaction records. Returns the number of rows updated.
+    """
+    from db import update_categories
+
+    expenses = [row.as_dict("note", "amount", "date") for row in rows]
+    categories = categorise_batch(expenses, batch_size, max_workers, user_id)
+    update_categories(user_id, ((category, row.id) for category, row in zip(categories, rows)))
+    return len(rows)
+
+
 # -----------------------------
 #  AI INSIGHTS GENERATION
 # -----------------------------
-def generate_insights(transactions):
-    """Generate financial insights from transaction list."""
+# Shown when the model call fails
+INSIGHTS_FALLBACK = {
+    "summary": "Unable to generate insights.",
+    "top_categories": [],
+    "highest_transaction": {},
+    "recommendation": "Try again later."
+}
 
-    template = load_prompt(INSIGHTS_PROMPT)
-    formatted_json = json.dumps(transactions, indent=2)
 
-    prompt = template.replace("<TRANSACTIONS>", formatted_json)
+# Estimated tokens for the whole insights prompt, template included.
+# The summary is trimmed to fit; see fit_summary().
+INSIGHTS_TOKEN_BUDGET = 1200
 
-    try:
-        completion = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a financial insights assistant."},
-                {"role": "user", "content": prompt}
-            ]
-        )
+# Longest note kept on the largest transaction once trimming starts
+TRIMMED_NOTE_CHARS = 80
 
-        ai_text = completion.choices[0].message.content.strip()
-        return json.loads(ai_text)
+
+def _trimmed_summaries(summary):
+    """The summary, then smaller and smaller copies of it.
+
+    Least useful detail goes first: the older half of monthly_totals
+    (repeatedly, down to 3 months), then long notes and the smaller top
+    categories, then the monthly history altogether.
+    """
+    yield summary
+
+    summary = dict(summary)
+    months = list((summary.get("monthly_totals") or {}).items())
+    while len(months) > 3:
+        months = months[len(months) // 2:]
+        summary["monthly_totals"] = dict(months)
+        yield summary
+
+    largest = summary.get("largest_transaction")
+    if largest and len(largest.get("note") or "") > TRIMMED_NOTE_CHARS:
+        summary["largest_transaction"] = {**largest, "note": largest["note"][:TRIMMED_NOTE_CHARS]}
+    summary["top_categories"] = (summary.get("top_categories") or [])[:3]
+    yield summary
+
+    summary.pop("monthly_totals", None)
+    yield summary
+
+
+def fit_summary(summary, budget=INSIGHTS_TOKEN_BUDGET):
+    """Compact JSON of the largest version of summary whose insights prompt
+    fits in budget estimated tokens (or the smallest version, if none does)."""
+    base_tokens = get_prompt(INSIGHTS_PROMPT).base_tokens
+    for candidate in _trimmed_summaries(summary):
+        payload = to_json(candidate)
+        if base_tokens + estimate_tokens(payload) <= budget:
+            break
+    return payload
+
+
+def generate_insights(summary):
+    """Generate financial insights from a spending summary.
+
+    summary comes from analysis.get_insights_summary(), so the prompt stays
+    small however many transactions the user has, and it is trimmed to
+    INSIGHTS_TOKEN_BUDGET before sending.
+    """
+    try:
+        return request_insights(summary)
 
     except Exception as e:
         print("AI Insights Error:", e)
-        return {
-            "summary": "Unable to generate insights.",
-            "top_categories": [],
-            "highest_transaction": {},
-            "recommendation": "Try again later."
-        }
+        return dict(INSIGHTS_FALLBACK)
+
+
+def request_insights(summary):
+    """Like generate_insights(), but raises instead of returning the fallback."""
+    prompt = get_prompt(INSIGHTS_PROMPT).render(SUMMARY=fit_summary(summary))
+
+    completion = complete("insights", "You are a financial insights assistant.", prompt)
+
+    ai_text = completion.choices[0].message.content.strip()
+    return json.loads(ai_text)
@@ -0,0 +1,125 @@
+"""Offline stand-in for the OpenAI client.
+
+Mimics client.chat.completions.create() closely enough for ai_service to
+run without network access or an API key: categorisation (single and
+batch) gets keyword-based answers, insights echo the figures from the
+summary in the prompt.
+Use it through ai_service.set_client(StubClient(...)).
+"""
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+KEYWORDS = {
+    "Food": ["pizza", "domino", "mcdonald", "kfc", "cafe", "coffee", "lunch", "dinner", "restaurant", "snack"],
+    "Groceries": ["coles", "woolworths", "aldi", "iga", "grocery", "supermarket"],
+    "Transport": ["uber", "taxi", "train", "bus", "petrol", "fuel", "shell", "parking", "opal", "myki"],
+    "Shopping": ["ikea", "kmart", "target", "amazon", "chair", "jb hi"],
+    "Health": ["chemist", "pharmacy", "doctor", "dentist", "medical"],
+    "Entertainment": ["netflix", "spotify", "movie", "cinema", "concert"],
+    "Bills": ["electricity", "energy", "water", "internet", "phone", "bill", "rent"],
+    "Education": ["course", "book", "tuition", "school fee"],
+    "Travel": ["flight", "hotel", "airbnb", "qantas", "virgin"],
+    "Gifts": ["gift", "present"],
+    "Kids": ["toy", "daycare", "nappies"],
+    "Fitness": ["gym", "yoga", "fitness"],
+}
+
+
+def guess_category(text):
+    text = (text or "").lower()
+    for category, words in KEYWORDS.items():
+        if any(word in text for word in words):
+            return category
+    return "Miscellaneous"
+
+
+class StubClient:
+    """Fake OpenAI client.
+
+    latency: seconds to sleep per call, to simulate network/model time.
+    failure_rate: fraction of calls that raise, to exercise retries.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, **kwargs):
+        with self._lock:
+            self.calls += 1
+            fail = self._random.random() < self.failure_rate
+
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            raise RuntimeError("stub: simulated API failure")
+
+        system = messages[0]["content"]
+        prompt = messages[-1]["content"]
+
+        if "in batches" in system:
+            content = self._batch_categories(prompt)
+        elif "categorisation" in system:
+            note = _field(prompt, "Note")
+            description = _field(prompt, "Description")
+            content = json.dumps({"category": guess_category(note + " " + description)})
+        else:
+            content = json.dumps(self._insights(prompt))
+
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+            ),
+        )
+
+    def _batch_categories(self, prompt):
+        section = prompt.split("## EXPENSES", 1)[1].split("## OUTPUT FORMAT", 1)[0]
+        items = json.loads(section.strip())
+        return json.dumps([
+            {"id": item["id"],
+             "category": guess_category(item.get("note", "") + " " + item.get("description", ""))}
+            for item in items
+        ])
+
+    def _insights(self, prompt):
+        """Echo the summary's own figures back in the insights format."""
+        summary = _summary(prompt)
+        top = [c["category"] for c in summary.get("top_categories", [])[:3]]
+        largest = summary.get("largest_transaction") or {}
+        return {
+            "summary": (f"Stub insights: total spending of ${summary.get('total_spent', 0)} "
+                        f"across {summary.get('transaction_count', 0)} transactions."),
+            "top_categories": top,
+            "highest_transaction": {k: largest[k] for k in ("note", "amount", "date") if k in largest},
+            "recommendation": "This is a stub response."
+        }
+
+
+def _summary(prompt):
+    """The first line of the prompt that is a JSON object, or {}."""
+    for line in prompt.splitlines():
+        line = line.strip()
+        if line.startswith("{") and line.endswith("}"):
+            try:
+                return json.loads(line)
+            except ValueError:
+                continue
+    return {}
+
+
+def _field(prompt, name):
+    match = re.search(rf"^{name}: (.*)$", prompt, re.MULTILINE)
+    return match.group(1) if match else ""
@@ -1,34 +1,478 @@
-import sqlite3
+import calendar
+from datetime import date, timedelta
 
-DB_NAME = "/Users/sujeethkumartuniki/Desktop/Coding/waist-app/waist_app.db"
+import numpy as np
 
-def get_total_spent_this_month():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+from db import (
+    check_date,
+    get_dashboard_snapshot,
+    get_category_stats,
+    get_daily_totals,
+    get_largest_transaction,
+    get_transaction_columns,
+    utc_today,
+    Transaction,
+)
+from user_state import UserStates
 
-    cursor.execute("""
-        SELECT SUM(amount)
-        FROM transactions
-        WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now')
-    """)
 
-    result = cursor.fetchone()[0]
-    conn.close()
+def get_total_spent_this_month(user_id):
+    return get_dashboard_snapshot(user_id).total_month
 
-    return result if result else 0
 
+def get_category_wise_spending(user_id):
+    return get_dashboard_snapshot(user_id).categories
 
-def get_category_wise_spending():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
 
-    cursor.execute("""
-        SELECT category, SUM(amount)
-        FROM transactions
-        GROUP BY category
-    """)
+# ----------------------------
+# INSIGHTS SUMMARY
+# ----------------------------
 
-    rows = cursor.fetchall()
-    conn.close()
+# What the insights model gets instead of raw rows. The summary stays the
+# same size however long the history is.
 
-    return rows
+TOP_CATEGORIES = 5
+
+# Calendar months of totals in the summary, ending with the current one.
+# ai_service trims this further if the prompt would go over its token budget.
+HISTORY_MONTHS = 24
+
+
+class SummaryState:
+    """Running aggregates the insights summary is built from.
+
+    Everything here can be merged, so new rows can be folded in without
+    re-reading the rows already counted.
+    """
+
+    def __init__(self):
+        self.last_id = 0
+        self.rewrites = 0
+        self.categories = {}  # category -> [count, total, sum of squares]
+        self.daily = {}       # 'YYYY-MM-DD' -> total
+        self.largest = None   # db.Transaction
+
+    def add_category_stats(self, rows):
+        for category, count, total, sum_squares in rows:
+            stats = self.categories.setdefault(category, [0, 0.0, 0.0])
+            stats[0] += count
+            stats[1] += total
+            stats[2] += sum_squares
+
+    def add_daily_totals(self, rows):
+        for day, total in rows:
+            if not _is_iso_date(day):
+                # Stored before dates were checked on write; the summary's
+                # date arithmetic cannot place it
+                continue
+            self.daily[day] = self.daily.get(day, 0.0) + total
+
+    def add_largest(self, row):
+        if row is not None and (self.largest is None or row.amount > self.largest.amount):
+            self.largest = row
+
+    def fold_from_db(self, user_id, up_to_id):
+        """Add the aggregates of every transaction of the user with last_id < id <= up_to_id."""
+        self.add_category_stats(get_category_stats(user_id, self.last_id, up_to_id))
+        self.add_daily_totals(get_daily_totals(user_id, self.last_id, up_to_id))
+        self.add_largest(get_largest_transaction(user_id, self.last_id, up_to_id))
+        self.last_id = up_to_id
+
+
+def _is_iso_date(day):
+    try:
+        check_date(day)
+    except ValueError:
+        return False
+    return True
+
+
+_summaries = UserStates(SummaryState)
+
+
+def get_insights_summary(user_id, today=None):
+    """Compact spending summary of one user for the insights prompt.
+
+    The aggregates are cached. When only new transactions have arrived,
+    just those rows are read and folded in. An edit or delete anywhere
+    (seen through the rewrites counter) triggers a full rebuild.
+    """
+    with _summaries.current(user_id) as state:
+        return build_summary(state, today or utc_today())
+
+
+def summarise_transactions(transactions, today=None):
+    """Same summary as get_insights_summary(), from a list of dicts with
+    date/amount/category/note (e.g. eval fixtures) instead of the database."""
+    state = SummaryState()
+    categories = {}
+    daily = {}
+
+    for i, t in enumerate(transactions, start=1):
+        amount = float(t["amount"])
+        stats = categories.setdefault(t["category"], [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += amount
+        stats[2] += amount * amount
+        daily[t["date"]] = daily.get(t["date"], 0.0) + amount
+        state.add_largest(Transaction(t.get("id", i), t["date"], amount, t["category"], t.get("note", "")))
+
+    state.add_category_stats((c, s[0], s[1], s[2]) for c, s in categories.items())
+    state.add_daily_totals(daily.items())
+
+    if today is None:
+        today = date.fromisoformat(max(state.daily)) if state.daily else utc_today()
+    return build_summary(state, today)
+
+
+def build_summary(state, today):
+    count = sum(s[0] for s in state.categories.values())
+    total = sum(s[1] for s in state.categories.values())
+
+    ranked = sorted(state.categories.items(), key=lambda item: item[1][1], reverse=True)
+    top_categories = [
+        {
+            "category": category,
+            "total": round(stats[1], 2),
+            "count": stats[0],
+            "share": round(stats[1] / total, 3) if total else 0,
+            "average": round(stats[1] / stats[0], 2),
+        }
+        for category, stats in ranked[:TOP_CATEGORIES]
+    ]
+
+    largest = None
+    if state.largest is not None:
+        largest = state.largest.as_dict("date", "amount", "category", "note")
+
+    return {
+        "as_of": today.isoformat(),
+        "transaction_count": count,
+        "total_spent": round(total, 2),
+        "first_date": min(state.daily) if state.daily else None,
+        "last_date": max(state.daily) if state.daily else None,
+        "top_categories": top_categories,
+        "largest_transaction": largest,
+        "week_over_week": _week_over_week(state.daily, today),
+        "month_over_month": _month_over_month(state.daily, today),
+        "monthly_totals": _monthly_totals(state.daily, today),
+    }
+
+
+def _monthly_totals(daily, today, months=HISTORY_MONTHS):
+    """{'YYYY-MM': total} for the last `months` calendar months up to today,
+    oldest first. Months inside the user's history with no spending are 0;
+    months before their first transaction are left out."""
+    if not daily:
+        return {}
+    first_day = date.fromisoformat(min(daily))
+    index = today.year * 12 + today.month - 1
+    start = max(index - months + 1, first_day.year * 12 + first_day.month - 1)
+    keys = [f"{i // 12:04d}-{i % 12 + 1:02d}" for i in range(start, index + 1)]
+    if not keys:
+        return {}
+    totals = dict.fromkeys(keys, 0.0)
+    first, last = keys[0], today.isoformat()
+    for day, total in daily.items():
+        if first <= day <= last:
+            totals[day[:7]] += total
+    return {month: round(total, 2) for month, total in totals.items()}
+
+
+def _sum_days(daily, start, end):
+    """Total spent from start to end inclusive."""
+    total = 0.0
+    day = start
+    while day <= end:
+        total += daily.get(day.isoformat(), 0.0)
+        day += timedelta(days=1)
+    return total
+
+
+def _change(current, previous):
+    return round((current - previous) / previous * 100, 1) if previous else None
+
+
+def _week_over_week(daily, today):
+    this_week = _sum_days(daily, today - timedelta(days=6), today)
+    last_week = _sum_days(daily, today - timedelta(days=13), today - timedelta(days=7))
+    return {
+        "last_7_days": round(this_week, 2),
+        "previous_7_days": round(last_week, 2),
+        "change_pct": _change(this_week, last_week),
+    }
+
+
+def _month_over_month(daily, today):
+    """This month to date vs the same number of days at the start of last month."""
+    month_start = today.replace(day=1)
+    last_month_end = month_start - timedelta(days=1)
+    last_month_start = last_month_end.replace(day=1)
+    same_point_last_month = min(last_month_start + (today - month_start), last_month_end)
+
+    this_month = _sum_days(daily, month_start, today)
+    last_month = _sum_days(daily, last_month_start, same_point_last_month)
+    return {
+        "this_month_to_date": round(this_month, 2),
+        "last_month_same_period": round(last_month, 2),
+        "last_month_total": round(_sum_days(daily, last_month_start, last_month_end), 2),
+        "change_pct": _change(this_month, last_month),
+    }
+
+
+# ----------------------------
+# DASHBOARD ANALYTICS
+# ----------------------------
+
+# Richer dashboard numbers, computed with NumPy over a columnar copy of the
+# user's transactions. The columns are loaded once per data version and
+# every statistic below is a handful of array operations, whatever the
+# number of rows.
+
+EPOCH = date(1970, 1, 1)
+ROLLING_DAYS = 90        # length of the rolling average chart
+ROLLING_WINDOWS = (7, 30)
+PERCENTILES = (50, 75, 90, 95, 99)
+TREND_MONTHS = 6         # full months used for per-category trends
+BUDGET_BASELINE_MONTHS = 3
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+MONTH_NAMES = ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
+               "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+# Reports kept per data version (one per distinct today/budget asked for)
+MAX_REPORTS_PER_VERSION = 16
+
+
+def epoch_day(day):
+    return (day - EPOCH).days
+
+
+def _month_index(days):
+    """Months since 1970-01 for an array of epoch days."""
+    return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+
+
+class TransactionFrame:
+    """A user's transactions as parallel NumPy columns.
+
+    days holds epoch days (int64), amounts the amounts (float64) and codes
+    an index into categories for each row. New rows can be appended with
+    extend(), so a frame only has to be reloaded after an edit or delete.
+    """
+
+    def __init__(self):
+        self.last_id = 0
+        self.rewrites = 0
+        self.days = np.empty(0, np.int64)
+        self.amounts = np.empty(0, np.float64)
+        self.codes = np.empty(0, np.int64)
+        self.months = np.empty(0, np.int64)
+        self.categories = []
+        self._category_index = {}
+        # get_analytics() reports built from these rows, by (today, budget)
+        self.reports = {}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from (epoch day, amount, category) rows."""
+        frame = cls()
+        frame.extend(rows)
+        return frame
+
+    def extend(self, rows):
+        """Append (epoch day, amount, category) rows."""
+        if not rows:
+            return
+        self.reports.clear()
+        table = np.fromiter(rows, count=len(rows), dtype=[
+            ("day", np.int64), ("amount", np.float64), ("category", object)])
+
+        index = self._category_index
+        for name in set(table["category"]) - index.keys():
+            index[name] = len(self.categories)
+            self.categories.append(name)
+        codes = np.fromiter(map(index.__getitem__, table["category"]), np.int64, count=len(rows))
+
+        self.days = np.concatenate((self.days, table["day"]))
+        self.amounts = np.concatenate((self.amounts, table["amount"]))
+        self.codes = np.concatenate((self.codes, codes))
+        self.months = np.concatenate((self.months, _month_index(table["day"])))
+
+    def fold_from_db(self, user_id, up_to_id):
+        """Append the user's transactions with last_id < id <= up_to_id."""
+        self.extend(get_transaction_columns(user_id, self.last_id, up_to_id))
+        self.last_id = up_to_id
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def daily_totals(self, start, end):
+        """Total spent on each epoch day from start to end inclusive."""
+        if end < start:
+            return np.zeros(0)
+        mask = (self.days >= start) & (self.days <= end)
+        return np.bincount(self.days[mask] - start, weights=self.amounts[mask],
+                           minlength=end - start + 1)
+
+    def rolling_averages(self, end, days, windows=ROLLING_WINDOWS):
+        """Daily totals for the `days` days up to end, with a trailing
+        average for each window length."""
+        widest = max(windows)
+        series = self.daily_totals(end - days - widest + 2, end)
+        sums = np.concatenate(([0.0], np.cumsum(series)))
+        averages = {}
+        for window in windows:
+            trailing = (sums[window:] - sums[:-window]) / window
+            averages[window] = trailing[-days:]
+        return series[-days:], averages
+
+    def percentiles(self, qs=PERCENTILES):
+        if not len(self):
+            return {}
+        return dict(zip(qs, np.percentile(self.amounts, qs)))
+
+    def monthly_matrix(self, first_month, last_month):
+        """Category x month totals for month indexes first_month..last_month."""
+        width = last_month - first_month + 1
+        if width <= 0 or not self.categories:
+            return np.zeros((len(self.categories), max(width, 0)))
+        mask = (self.months >= first_month) & (self.months <= last_month)
+        cells = self.codes[mask] * width + (self.months[mask] - first_month)
+        return np.bincount(cells, weights=self.amounts[mask],
+                           minlength=len(self.categories) * width).reshape(-1, width)
+
+    def category_trends(self, this_month, months=TREND_MONTHS):
+        """Per-category totals, monthly average and linear trend over the
+        last `months` full months, plus this month so far."""
+        matrix = self.monthly_matrix(this_month - months, this_month)
+        history, current = matrix[:, :-1], matrix[:, -1]
+
+        # Least-squares slope of each row against month number
+        x = np.arange(months) - (months - 1) / 2
+        average = history.mean(axis=1)
+        slope = (history - average[:, None]) @ x / (x @ x)
+
+        order = np.argsort(-(history.sum(axis=1) + current))
+        return [
+            {
+                "category": self.categories[i],
+                "total": round(float(history[i].sum()), 2),
+                "monthly_average": round(float(average[i]), 2),
+                "trend_per_month": round(float(slope[i]), 2),
+                "trend_pct": round(float(slope[i] / average[i] * 100), 1) if average[i] else None,
+                "this_month": round(float(current[i]), 2),
+            }
+            for i in order
+            if history[i].any() or current[i]
+        ]
+
+    def weekday_profile(self, end):
+        """Average spent on each weekday (Mon..Sun) from the first transaction to end."""
+        if not len(self):
+            return np.zeros(7)
+        start = int(self.days.min())
+        # 1970-01-01 was a Thursday, so (day + 3) % 7 puts Monday at 0
+        totals = np.bincount((self.days + 3) % 7, weights=self.amounts, minlength=7)
+        counts = np.bincount((np.arange(start, max(end, start) + 1) + 3) % 7, minlength=7)
+        return np.divide(totals, counts, out=np.zeros(7), where=counts > 0)
+
+    def seasonality(self, this_month):
+        """Average monthly total for each calendar month (Jan..Dec), over
+        full months only. NaN where there is no such month yet."""
+        if not len(self):
+            return np.full(12, np.nan)
+        first = int(self.months.min())
+        totals = self.monthly_matrix(first, this_month - 1).sum(axis=0)
+        calendar_month = np.arange(first, this_month) % 12
+        sums = np.bincount(calendar_month, weights=totals, minlength=12)
+        counts = np.bincount(calendar_month, minlength=12)
+        return np.divide(sums, counts, out=np.full(12, np.nan), where=counts > 0)
+
+    def running_budget(self, today, budget=None):
+        """Spend so far this month against a monthly budget.
+
+        Without a budget, the average of the last few full months is used.
+        """
+        this_month = int(_month_index(np.array([epoch_day(today)]))[0])
+        if budget is None:
+            previous = self.monthly_matrix(this_month - BUDGET_BASELINE_MONTHS, this_month - 1).sum(axis=0)
+            previous = previous[previous > 0]
+            budget = float(previous.mean()) if len(previous) else None
+
+        month_start = today.replace(day=1)
+        days_in_month = calendar.monthrange(today.year, today.month)[1]
+        spent = np.cumsum(self.daily_totals(epoch_day(month_start), epoch_day(today)))
+        spent_so_far = float(spent[-1]) if len(spent) else 0.0
+        days_left = days_in_month - today.day
+
+        report = {
+            "budget": round(budget, 2) if budget else None,
+            "spent": round(spent_so_far, 2),
+            "projected": round(spent_so_far / today.day * days_in_month, 2),
+            "cumulative": [round(float(v), 2) for v in spent],
+            "pace": None,
+            "remaining": None,
+            "used_pct": None,
+            "daily_allowance": None,
+        }
+        if budget:
+            pace = budget * np.arange(1, days_in_month + 1) / days_in_month
+            report["pace"] = [round(float(v), 2) for v in pace]
+            report["remaining"] = round(budget - spent_so_far, 2)
+            report["used_pct"] = round(spent_so_far / budget * 100, 1)
+            if days_left:
+                report["daily_allowance"] = round(max(budget - spent_so_far, 0) / days_left, 2)
+        return report
+
+
+def build_analytics(frame, today, budget=None):
+    """Everything the analytics dashboard shows beyond the rollup totals."""
+    end = epoch_day(today)
+    this_month = int(_month_index(np.array([end]))[0])
+
+    series, averages = frame.rolling_averages(end, ROLLING_DAYS)
+    first = today - timedelta(days=ROLLING_DAYS - 1)
+
+    return {
+        "as_of": today.isoformat(),
+        "transaction_count": len(frame),
+        "rolling": {
+            "labels": [(first + timedelta(days=i)).isoformat() for i in range(ROLLING_DAYS)],
+            "daily": [round(float(v), 2) for v in series],
+            "averages": {w: [round(float(v), 2) for v in a] for w, a in averages.items()},
+        },
+        "percentiles": {q: round(float(v), 2) for q, v in frame.percentiles().items()},
+        "category_trends": frame.category_trends(this_month),
+        "weekday_profile": dict(zip(WEEKDAYS, (round(float(v), 2) for v in frame.weekday_profile(end)))),
+        "seasonality": {
+            name: None if np.isnan(v) else round(float(v), 2)
+            for name, v in zip(MONTH_NAMES, frame.seasonality(this_month))
+        },
+        "budget": frame.running_budget(today, budget),
+    }
+
+
+# Frames hold each user's whole history (about 32 bytes a row), so fewer are kept
+FRAME_USERS = 64
+
+_frames = UserStates(TransactionFrame, FRAME_USERS)
+
+
+def get_analytics(user_id, today=None, budget=None):
+    """Dashboard analytics for a user, memoised until their data changes.
+
+    Like get_insights_summary(), new transactions are appended to the
+    cached columns and an edit or delete triggers a full reload. Reports
+    for the same (today, budget) are served from memory until the data
+    version moves.
+    """
+    today = today or utc_today()
+
+    with _frames.current(user_id) as frame:
+        key = (today, budget)
+        report = frame.reports.get(key)
+        if report is None:
+            if len(frame.reports) >= MAX_REPORTS_PER_VERSION:
+                frame.reports.clear()
+            report = frame.reports[key] = build_analytics(frame, today, budget)
+        return report
@@ -0,0 +1,108 @@
+"""Deterministic detection of unusually large transactions.
+
+Each user has, per category, an exponentially weighted moving average
+(EWMA) and variance of transaction amounts. Transactions are streamed
+through it in the order they were added, and one whose amount is far
+above its category's running average (by z-score) is flagged.
+
+The state is folded forward from an id watermark (see user_state.py), so
+only transactions added since the last call are read. An edit or delete
+anywhere rebuilds it.
+"""
+import math
+from collections import deque
+
+from db import get_transactions_after
+from user_state import UserStates
+
+# Weight of the newest transaction in the running average; 0.1 roughly
+# means "the last 10-20 transactions in this category"
+EWMA_ALPHA = 0.1
+Z_THRESHOLD = 3.0
+
+# A category needs this many earlier transactions before anything in it is flagged
+MIN_HISTORY = 5
+
+# Floor on the standard deviation so a run of identical amounts (e.g. a
+# subscription) does not flag a small price change
+MIN_STD_FRACTION = 0.25
+MIN_STD = 1.0
+
+# Most recent flagged transactions kept per user
+MAX_FLAGGED = 200
+
+
+class CategoryStats:
+    """EWMA mean and variance of one category's amounts."""
+
+    __slots__ = ("count", "mean", "variance")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.variance = 0.0
+
+    def score(self, amount):
+        """z-score of amount against the current state, or None if there is
+        not enough history yet."""
+        if self.count < MIN_HISTORY:
+            return None
+        std = max(math.sqrt(self.variance), MIN_STD_FRACTION * abs(self.mean), MIN_STD)
+        return (amount - self.mean) / std
+
+    def update(self, amount):
+        self.count += 1
+        if self.count == 1:
+            self.mean = amount
+            return
+        diff = amount - self.mean
+        increment = EWMA_ALPHA * diff
+        self.mean += increment
+        self.variance = (1 - EWMA_ALPHA) * (self.variance + diff * increment)
+
+
+class AnomalyState:
+    """Per-category stats and the flagged transactions of one user."""
+
+    def __init__(self):
+        self.last_id = 0
+        self.rewrites = 0
+        self.categories = {}
+        self.flagged = deque(maxlen=MAX_FLAGGED)
+
+    def add(self, expense_id, day, amount, category, note):
+        """Score one transaction, flag it if unusual, then fold it in."""
+        stats = self.categories.get(category)
+        if stats is None:
+            stats = self.categories[category] = CategoryStats()
+
+        z = stats.score(amount)
+        if z is not None and z >= Z_THRESHOLD:
+            self.flagged.append({
+                "id": expense_id,
+                "date": day,
+                "amount": amount,
+                "category": category,
+                "note": note,
+                "typical": round(stats.mean, 2),
+                "zscore": round(z, 1),
+            })
+        stats.update(amount)
+
+    def fold_from_db(self, user_id, up_to_id):
+        for row in get_transactions_after(user_id, self.last_id, up_to_id):
+            self.add(*row)
+        self.last_id = up_to_id
+
+
+_states = UserStates(AnomalyState)
+
+
+def get_anomalies(user_id, limit=20):
+    """The user's most recent unusual transactions, newest first.
+
+    Each is a dict with id, date, amount, category, note, typical (the
+    category's running average when it happened) and zscore.
+    """
+    with _states.current(user_id) as state:
+        return list(state.flagged)[::-1][:limit]
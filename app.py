@@ -1,6 +1,9 @@
 import re
+from functools import partial
+from getpass import getpass
 
-from db import add_transaction, get_all_transactions, get_expenses_by_category, get_expenses_by_date, get_expenses_by_month, get_expenses_min_amount, get_expenses_max_amount, delete_expense, update_expense, get_total_spent_today, get_total_spent_this_month, get_total_by_category, get_highest_spending_category ,get_average_daily_spend_this_month
+from auth import RateLimited, verify_user
+from db import add_transaction, get_transactions_page, get_expense_by_id, get_transaction_count, iter_transactions_for_export, query_transactions, period_range, TransactionFilter, delete_expense, update_expense, get_dashboard_snapshot, search_transactions, migrate
 from tabulate import tabulate
 from datetime import datetime
 
@@ -17,6 +20,9 @@ RESET = "\033[0m"
 def pause():
     input(YELLOW + "\nPress ENTER to continue..." + RESET)
 
+# Id of the logged-in user; every query below is scoped to it
+current_user_id = None
+
 # ---------------------------------------
 # VALIDATION FUNCTIONS
 # ---------------------------------------
@@ -47,17 +53,73 @@ def validate_category(category_str):
 # TABLE DISPLAY HELPER
 # ---------------------------------------
 
+TABLE_HEADERS = ["ID", "Date", "Amount", "Category", "Note"]
+
 def display_table(rows):
     if not rows:
         print("No matching expenses found.")
         return
 
-    table = []
-    for r in rows:
-        table.append([r[0], r[1], r[2], r[3], r[4]])
+    # Rows are db.Transaction records, so the fields come out in this order
+    print("\n" + tabulate(rows, TABLE_HEADERS, tablefmt="grid"))
+
+
+CLI_PAGE_SIZE = 20
+
+def display_paged(fetch_page, page_size=CLI_PAGE_SIZE):
+    """Show rows one page at a time, fetching each page only when asked for.
+
+    fetch_page(limit, after) must return a db.TransactionPage.
+    Returns False if there were no rows at all.
+    """
+    after = None
+    page_number = 1
+
+    while True:
+        page = fetch_page(page_size, after)
+        rows = list(page)
+
+        if not rows:
+            return False
+
+        display_table(rows)
+
+        if page.next_cursor is None:
+            return True
+
+        more = input(CYAN + f"Page {page_number}. ENTER for next page, 'q' to stop: " + RESET)
+        if more.strip().lower() == "q":
+            return True
+
+        after = page.next_cursor
+        page_number += 1
+
+
+def display_search(query, page_size=CLI_PAGE_SIZE):
+    """Show note search results, best match first, one page at a time.
+
+    Returns False if nothing matched.
+    """
+    offset = 0
+    page_number = 1
+
+    while True:
+        results = search_transactions(current_user_id, query, limit=page_size, offset=offset)
+
+        if not results.rows:
+            return offset > 0
+
+        display_table(results.rows)
 
-    headers = ["ID", "Date", "Category", "Amount", "Note"]
-    print("\n" + tabulate(table, headers, tablefmt="grid"))
+        if results.next_offset is None:
+            return True
+
+        more = input(CYAN + f"Page {page_number}. ENTER for next page, 'q' to stop: " + RESET)
+        if more.strip().lower() == "q":
+            return True
+
+        offset = results.next_offset
+        page_number += 1
 
 
 # ---------------------------------------
@@ -105,7 +167,7 @@ def handle_add_expense():
     # Note (optional)
     note = input("Note: ")
 
-    add_transaction(date, category, amount, note)
+    add_transaction(current_user_id, date, category, amount, note)
     print(GREEN + "✅ Expense added successfully!" + RESET)
     pause()
 
@@ -118,8 +180,8 @@ def handle_view_expenses():
     choice = input("Choose an option (1-3): ").strip()
 
     if choice == "1":
-        rows = get_all_transactions()
-        display_table(rows)
+        if not display_paged(partial(get_transactions_page, current_user_id)):
+            print("No matching expenses found.")
         pause()
 
     elif choice == "2":
@@ -132,78 +194,113 @@ def handle_view_expenses():
         print(RED + "❌ Invalid choice!" + RESET)
         pause()
 
-def handle_filter_menu():
-    while True:
-        print(BLUE + "\n--- Filter Expenses ---" + RESET)
-        print(CYAN + "1. Filter by Category" + RESET)
-        print(CYAN + "2. Filter by Date (YYYY-MM-DD)" + RESET)
-        print(CYAN + "3. Filter by Month (YYYY-MM)" + RESET)
-        print(CYAN + "4. Filter by Minimum Amount" + RESET)
-        print(CYAN + "5. Filter by Maximum Amount" + RESET)
-        print(CYAN + "6. Back" + RESET)
-
-        choice = input("Choose an option (1-6): ").strip()
+def describe_filters(filters):
+    """One line summary of a db.TransactionFilter for the filter menu."""
+    parts = []
+    if filters.category is not None:
+        parts.append(f"category {filters.category}")
+    if filters.start is not None:
+        parts.append(f"from {filters.start}")
+    if filters.end is not None:
+        parts.append(f"before {filters.end}")
+    if filters.min_amount is not None:
+        parts.append(f"amount >= {filters.min_amount:g}")
+    if filters.max_amount is not None:
+        parts.append(f"amount <= {filters.max_amount:g}")
+    if filters.text is not None:
+        parts.append(f"note has '{filters.text}'")
+    return ", ".join(parts) or "none"
+
+
+def read_amount(prompt):
+    try:
+        return float(input(prompt).strip())
+    except ValueError:
+        print(RED + "❌ Invalid amount." + RESET)
+        pause()
+        return None
 
-        if choice == "1":
-            category = input("Enter category: ").strip()
-            rows = get_expenses_by_category(category)
-            display_table(rows)
-            pause()
 
-        elif choice == "2":
-            date = input("Enter date (YYYY-MM-DD): ").strip()
-            rows = get_expenses_by_date(date)
-            display_table(rows)
-            pause()
+def handle_filter_menu():
+    """Build up any combination of filters, then show the matching rows.
 
-        elif choice == "3":
-            month = input("Enter month (YYYY-MM): ").strip()
-            rows = get_expenses_by_month(month)
-            display_table(rows)
-            pause()
+    All the filters run together as one query (see db.query_transactions).
+    """
+    filters = TransactionFilter()
 
-        elif choice == "4":
-            try:
-                amount = float(input("Enter minimum amount: ").strip())
-            except ValueError:
-                print(RED + "❌ Invalid amount." + RESET)
+    while True:
+        print(BLUE + "\n--- Filter Expenses ---" + RESET)
+        print(YELLOW + f"Current filters: {describe_filters(filters)}" + RESET)
+        print(CYAN + "1. Category" + RESET)
+        print(CYAN + "2. Date (YYYY-MM-DD)" + RESET)
+        print(CYAN + "3. Month (YYYY-MM)" + RESET)
+        print(CYAN + "4. Minimum Amount" + RESET)
+        print(CYAN + "5. Maximum Amount" + RESET)
+        print(CYAN + "6. Words in Note" + RESET)
+        print(CYAN + "7. Show Matching Expenses" + RESET)
+        print(CYAN + "8. Clear Filters" + RESET)
+        print(CYAN + "9. Search Notes (best match first)" + RESET)
+        print(CYAN + "10. Back" + RESET)
+
+        choice = input("Choose an option (1-10): ").strip()
+
+        try:
+            if choice == "1":
+                filters = filters.narrow(category=input("Enter category: ").strip() or None)
+
+            elif choice in ("2", "3"):
+                value = input("Enter date (YYYY-MM-DD): " if choice == "2" else "Enter month (YYYY-MM): ").strip()
+                valid = validate_date(value) if choice == "2" else re.match(r"^\d{4}-\d{2}$", value)
+                if not valid:
+                    print(RED + "❌ Invalid date." + RESET)
+                    pause()
+                    continue
+                start, end = period_range(value)
+                filters = filters.narrow(start=start, end=end)
+
+            elif choice == "4":
+                filters = filters.narrow(min_amount=read_amount("Enter minimum amount: "))
+
+            elif choice == "5":
+                filters = filters.narrow(max_amount=read_amount("Enter maximum amount: "))
+
+            elif choice == "6":
+                filters = filters.narrow(text=input("Words in note: ").strip() or None)
+
+            elif choice == "7":
+                if not display_paged(partial(query_transactions, current_user_id, filters)):
+                    print("No matching expenses found.")
                 pause()
-                continue
-            rows = get_expenses_min_amount(amount)
-            display_table(rows)
-            pause()
 
-        elif choice == "5":
-            try:
-                amount = float(input("Enter maximum amount: ").strip())
-            except ValueError:
-                print(RED + "❌ Invalid amount." + RESET)
+            elif choice == "8":
+                filters = TransactionFilter()
+
+            elif choice == "9":
+                query = input("Search notes (e.g. coles, uber eat): ").strip()
+                if not display_search(query):
+                    print("No matching expenses found.")
                 pause()
-                continue
-            rows = get_expenses_max_amount(amount)
-            display_table(rows)
-            pause()
 
-        elif choice == "6":
-            return
+            elif choice == "10":
+                return
 
-        else:
-            print(RED + "❌ Invalid choice!" + RESET)
+            else:
+                print(RED + "❌ Invalid choice!" + RESET)
+                pause()
+
+        except ValueError as e:
+            print(RED + f"❌ {e}" + RESET)
             pause()
 
 
 def handle_delete_expense():
     print(BLUE + "\n--- Delete Expense ---" + RESET)
 
-    rows = get_all_transactions()
-
-    if not rows:
+    if not display_paged(partial(get_transactions_page, current_user_id)):
         print(RED + "❌ No expenses found to delete." + RESET)
         pause()
         return
 
-    display_table(rows)
-
     print(CYAN + "\nEnter the ID of the expense to delete." + RESET)
     print(CYAN + "Or type 'b' to go back." + RESET)
 
@@ -222,7 +319,7 @@ def handle_delete_expense():
     confirm = input(YELLOW + f"Are you sure you want to delete expense ID {expense_id}? (y/n): " + RESET).lower()
 
     if confirm == "y":
-        delete_expense(expense_id)
+        delete_expense(current_user_id, expense_id)
         print(GREEN + "✅ Expense deleted successfully!" + RESET)
     else:
         print(YELLOW + "⚠️ Deletion cancelled." + RESET)
@@ -233,15 +330,11 @@ def handle_delete_expense():
 def handle_edit_expense():
     print(BLUE + "\n--- Edit Expense ---" + RESET)
 
-    rows = get_all_transactions()
-
-    if not rows:
+    if not display_paged(partial(get_transactions_page, current_user_id)):
         print(RED + "❌ No expenses found to edit." + RESET)
         pause()
         return
 
-    display_table(rows)
-
     print(CYAN + "\nEnter the ID of the expense to edit." + RESET)
     print(CYAN + "Or type 'b' to go back." + RESET)
 
@@ -257,11 +350,7 @@ def handle_edit_expense():
         pause()
         return
 
-    existing = None
-    for r in rows:
-        if r[0] == expense_id:
-            existing = r
-            break
+    existing = get_expense_by_id(current_user_id, expense_id)
 
     if not existing:
         print(RED + "❌ Expense ID not found." + RESET)
@@ -270,15 +359,19 @@ def handle_edit_expense():
 
     print(YELLOW + "\nPress ENTER to keep the existing value." + RESET)
 
-    new_date = input(f"New date (current: {existing[1]}): ").strip() or existing[1]
-    new_category = input(f"New category (current: {existing[2]}): ").strip() or existing[2]
+    new_date = input(f"New date (current: {existing.date}): ").strip() or existing.date
+    while not validate_date(new_date):
+        print(RED + "❌ Invalid date. Please enter a valid date (e.g., 2025-11-12)." + RESET)
+        new_date = input("New date (YYYY-MM-DD): ").strip()
+    new_category = input(f"New category (current: {existing.category}): ").strip() or existing.category
 
-    new_amount_str = input(f"New amount (current: {existing[3]}): ").strip()
-    new_amount = float(new_amount_str) if new_amount_str else existing[3]
+    new_amount_str = input(f"New amount (current: {existing.amount}): ").strip()
+    new_amount = float(new_amount_str) if new_amount_str else existing.amount
 
-    new_notes = input(f"New note (current: {existing[4]}): ").strip() or existing[4]
+    new_notes = input(f"New note (current: {existing.note}): ").strip() or existing.note
 
-    update_expense(expense_id, new_date, new_category, new_amount, new_notes)
+    update_expense(current_user_id, expense_id, amount=new_amount, category=new_category,
+                   note=new_notes, date=new_date)
 
     print(GREEN + "✅ Expense updated successfully!" + RESET)
     pause()
@@ -296,41 +389,40 @@ def handle_analytics_menu():
 
         choice = input("Choose an option (1-6): ").strip()
 
+        if choice == "6":
+            return
+
+        if choice not in ("1", "2", "3", "4", "5"):
+            print(RED + "❌ Invalid choice!" + RESET)
+            pause()
+            continue
+
+        snapshot = get_dashboard_snapshot(current_user_id)
+
         if choice == "1":
-            total = get_total_spent_today()
-            print(GREEN + f"\n💰 Total Spent Today: ${total:.2f}" + RESET)
+            print(GREEN + f"\n💰 Total Spent Today: ${snapshot.total_today:.2f}" + RESET)
             pause()
 
         elif choice == "2":
-            total = get_total_spent_this_month()
-            print(GREEN + f"\n📅 Total Spent This Month: ${total:.2f}" + RESET)
+            print(GREEN + f"\n📅 Total Spent This Month: ${snapshot.total_month:.2f}" + RESET)
             pause()
 
         elif choice == "3":
             category = input("Enter category: ").strip()
-            total = get_total_by_category(category)
+            total = dict(snapshot.categories).get(category, 0)
             print(GREEN + f"\n📂 Total Spent in '{category}': ${total:.2f}" + RESET)
             pause()
 
         elif choice == "4":
-            result = get_highest_spending_category()
-            if result:
-                category, total = result
+            if snapshot.highest:
+                category, total = snapshot.highest
                 print(GREEN + f"\n🏆 Highest Spending Category: '{category}' → ${total:.2f}" + RESET)
             else:
                 print(RED + "\nNo expenses recorded yet." + RESET)
             pause()
 
         elif choice == "5":
-            avg = get_average_daily_spend_this_month()
-            print(GREEN + f"\n📊 Average Daily Spend (This Month): ${avg:.2f}" + RESET)
-            pause()
-
-        elif choice == "6":
-            return
-
-        else:
-            print(RED + "❌ Invalid choice!" + RESET)
+            print(GREEN + f"\n📊 Average Daily Spend (This Month): ${snapshot.avg_daily:.2f}" + RESET)
             pause()
 
 
@@ -340,13 +432,13 @@ def handle_analytics_menu():
 
 import csv
 
+from export import EXPORT_HEADER
+
 def handle_export_csv():
     print("\n--- Export Expenses to CSV ---")
     pause()
 
-    rows = get_all_transactions()
-
-    if not rows:
+    if get_transaction_count(current_user_id) == 0:
         print(RED + "❌ No expenses to export." + RESET)
         pause()
         return
@@ -358,8 +450,8 @@ def handle_export_csv():
     try:
         with open(filename, "w", newline="") as f:
             writer = csv.writer(f)
-            writer.writerow(["ID", "Date", "Category", "Amount", "Note"])
-            writer.writerows(rows)
+            writer.writerow(EXPORT_HEADER)
+            writer.writerows(iter_transactions_for_export(current_user_id))
 
         print(GREEN + f"✅ Exported successfully to '{filename}'" + RESET)
         pause()
@@ -373,7 +465,25 @@ def handle_export_csv():
 # MAIN LOOP
 # ---------------------------------------
 
+def login():
+    """Ask for a web account's username and password until they match."""
+    global current_user_id
+
+    while current_user_id is None:
+        username = input("Username: ").strip()
+        try:
+            current_user_id = verify_user(username, getpass("Password: "))
+        except RateLimited as e:
+            print(RED + str(e) + RESET)
+            continue
+        if current_user_id is None:
+            print(RED + "Invalid username or password" + RESET)
+
+
 def main():
+    migrate()
+    login()
+
     while True:
         show_menu()
         choice = input("Choose an option (1-5): ")
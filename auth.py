@@ -0,0 +1,274 @@
+"""Password hashing, login checks and rate limiting.
+
+Hashing is CPU-bound and deliberately slow, so it runs on a small
+bounded thread pool (hashlib releases the GIL while it hashes). A burst
+of logins then uses at most HASH_WORKERS cores, and requests that would
+queue for longer than HASH_WAIT_SECONDS are turned away instead of
+piling up behind it. Every other route keeps its share of the CPU.
+
+The hash method comes from WAIST_PASSWORD_HASH (any werkzeug method
+string, default scrypt:32768:8:1). A stored hash made with different
+parameters is replaced with a fresh one the next time its owner logs in.
+
+Login attempts are limited per username and per client IP by token
+buckets held in the process, so under several worker processes each
+enforces its own limits. Checks run before any hashing, so a throttled
+attempt costs almost nothing.
+
+(id, hash) lookups are cached for USER_CACHE_SECONDS. A password change
+in another process therefore takes up to that long to reach this one.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import db
+from metrics import Counter, Histogram
+
+HASH_METHOD = os.getenv("WAIST_PASSWORD_HASH", "scrypt:32768:8:1")
+
+# Hashes computed at once, and how many more may wait for a worker
+HASH_WORKERS = int(os.getenv("WAIST_HASH_WORKERS", "2"))
+HASH_QUEUE = 16
+# A request that cannot get into the queue within this time is rejected
+HASH_WAIT_SECONDS = 2.0
+
+# Token buckets: (burst, tokens refilled per second)
+USER_LIMIT = (10, 1 / 6)   # 10 at once, then one every 6 s
+IP_LIMIT = (50, 1.0)       # generous: many users can share one address
+
+USER_CACHE_SIZE = 1024
+USER_CACHE_SECONDS = 30
+
+HASH_SECONDS = Histogram(
+    "waist_password_hash_duration_seconds", "Time to hash or check a password.",
+    ("op",), (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+THROTTLED = Counter(
+    "waist_auth_throttled_total", "Auth attempts turned away, by reason.",
+    ("reason",),
+)
+
+
+class RateLimited(Exception):
+    """Too many attempts, or the hash pool is full. Retry after retry_after seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too many attempts. Try again in {retry_after} seconds.")
+        self.retry_after = retry_after
+
+
+# ----------------------------
+# RATE LIMITING
+# ----------------------------
+
+class RateLimiter:
+    """Token buckets, one per key.
+
+    Each key starts with `burst` tokens and regains `per_second` of them
+    per second; an attempt takes one. Keys whose bucket has refilled are
+    dropped once there are more than max_keys.
+    """
+
+    def __init__(self, burst, per_second, max_keys=10_000):
+        self.burst = burst
+        self.per_second = per_second
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> [tokens, updated_at]
+        self._lock = threading.Lock()
+
+    def take(self, key, now=None):
+        """Take a token for key. Returns 0 if allowed, otherwise the
+        number of seconds until a token is available."""
+        now = time.monotonic() if now is None else now
+
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._prune(now)
+                bucket = self._buckets[key] = [self.burst, now]
+
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.per_second)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                return (1 - tokens) / self.per_second
+            bucket[0] = tokens - 1
+            return 0
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def _prune(self, now):
+        full = [key for key, (tokens, updated) in self._buckets.items()
+                if tokens + (now - updated) * self.per_second >= self.burst]
+        for key in full:
+            del self._buckets[key]
+
+
+_user_limiter = RateLimiter(*USER_LIMIT)
+_ip_limiter = RateLimiter(*IP_LIMIT)
+
+
+def check_rate(username=None, ip=None):
+    """Take one attempt from the username's and the IP's allowance.
+
+    Raises RateLimited if either is used up.
+    """
+    for limiter, key, reason in ((_ip_limiter, ip, "ip"), (_user_limiter, username, "user")):
+        if key is None:
+            continue
+        wait = limiter.take(key)
+        if wait:
+            THROTTLED.inc(reason)
+            raise RateLimited(int(wait) + 1)
+
+
+# ----------------------------
+# HASHING
+# ----------------------------
+
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="waist-hash")
+_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE)
+
+
+def _in_pool(fn, *args):
+    """Run fn on the hash pool and wait for it. Raises RateLimited if the pool is full."""
+    if not _slots.acquire(timeout=HASH_WAIT_SECONDS):
+        THROTTLED.inc("busy")
+        raise RateLimited(1)
+    try:
+        return _executor.submit(fn, *args).result()
+    finally:
+        _slots.release()
+
+
+def _hash(password):
+    started = time.perf_counter()
+    hashed = generate_password_hash(password, method=HASH_METHOD)
+    HASH_SECONDS.observe(time.perf_counter() - started, "hash")
+    return hashed
+
+
+def _check(hashed, password):
+    """(matches, new hash if the stored one should be upgraded, else None)."""
+    started = time.perf_counter()
+    ok = check_password_hash(hashed, password)
+    HASH_SECONDS.observe(time.perf_counter() - started, "check")
+    if ok and needs_rehash(hashed):
+        return True, _hash(password)
+    return ok, None
+
+
+def hash_password(password):
+    """Hash a password with the current HASH_METHOD, on the hash pool."""
+    return _in_pool(_hash, password)
+
+
+def _method_prefix(method):
+    """The method part werkzeug stores for `method`, defaults filled in
+    ('scrypt' -> 'scrypt:32768:8:1')."""
+    return generate_password_hash("x", method=method).split("$", 1)[0]
+
+
+# Worked out once: comparing with HASH_METHOD itself would flag every hash
+# when it is given without parameters
+_HASH_PREFIX = _method_prefix(HASH_METHOD)
+
+
+def needs_rehash(hashed):
+    """True if hashed was made with parameters other than HASH_METHOD."""
+    return hashed.split("$", 1)[0] != _HASH_PREFIX
+
+
+# ----------------------------
+# USER LOOKUPS
+# ----------------------------
+
+_users = OrderedDict()  # username -> (id, hash, fetched_at)
+_users_lock = threading.Lock()
+
+
+def _credentials(username):
+    """(id, hash) for username, or None. Cached for USER_CACHE_SECONDS."""
+    now = time.monotonic()
+    with _users_lock:
+        entry = _users.get(username)
+        if entry is not None and entry[2] > now - USER_CACHE_SECONDS:
+            _users.move_to_end(username)
+            return entry[:2]
+
+    row = db.get_user_credentials(username)
+    if row is not None:
+        _remember(username, *row)
+    return row
+
+
+def _remember(username, user_id, hashed):
+    with _users_lock:
+        _users[username] = (user_id, hashed, time.monotonic())
+        _users.move_to_end(username)
+        while len(_users) > USER_CACHE_SIZE:
+            _users.popitem(last=False)
+
+
+def _forget(username):
+    with _users_lock:
+        _users.pop(username, None)
+
+
+def get_user_id(username):
+    """The id of the user with this username, or None."""
+    row = _credentials(username)
+    return row[0] if row is not None else None
+
+
+# ----------------------------
+# ACCOUNTS
+# ----------------------------
+
+def create_user(username, password):
+    """Create a user. Returns the new id; sqlite3.IntegrityError if the name is taken."""
+    user_id = db.insert_user(username, hash_password(password))
+    _forget(username)
+    return user_id
+
+
+def verify_user(username, password, ip=None):
+    """Return the user's id if the password is right, else None.
+
+    Raises RateLimited when the username or ip has made too many
+    attempts. A hash made with old parameters is upgraded on success.
+    """
+    check_rate(username, ip)
+
+    row = _credentials(username)
+    if row is None:
+        return None
+
+    user_id, hashed = row
+    ok, upgraded = _in_pool(_check, hashed, password)
+    if not ok:
+        return None
+
+    if upgraded is not None:
+        db.set_password_hash(user_id, upgraded)
+        _remember(username, user_id, upgraded)
+    # A successful login clears the username's failed attempts
+    _user_limiter.reset(username)
+    return user_id
+
+
+def update_password(username, new_password):
+    """Set a new password for username."""
+    user_id = get_user_id(username)
+    if user_id is None:
+        return
+    db.set_password_hash(user_id, hash_password(new_password))
+    _forget(username)
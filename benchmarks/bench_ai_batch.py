@@ -0,0 +1,91 @@
+"""Batch categorisation vs one model call per expense, fully offline.
+
+Uses ai_stub.StubClient with a simulated per-call latency, so the numbers
+show call counts and wall time, not model quality. The local classifier is
+switched off for the model-path timings (the synthetic notes are all
+known merchants, so it would answer every one) and measured on its own
+at the end.
+
+Usage: python benchmarks/bench_ai_batch.py [expenses] [latency_seconds]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+import db
+import ai_service
+import local_classifier
+from ai_stub import StubClient, KEYWORDS
+
+# Time this many single calls and extrapolate, the full serial run is too slow
+SERIAL_SAMPLE = 20
+
+
+def make_expenses(n, merchants=1000):
+    words = [w for ws in KEYWORDS.values() for w in ws]
+    suburbs = ["Parramatta", "Bondi", "Newtown", "Chatswood", "Manly", "Ryde", "Epping",
+               "Strathfield", "Burwood", "Hornsby", "Penrith", "Liverpool", "Kogarah"]
+    names = list({f"{random.choice(words).title()} {random.choice(suburbs)} {random.choice(suburbs)}"
+                  for _ in range(merchants)})
+    return [{"note": random.choice(names), "amount": round(random.uniform(2, 200), 2),
+             "date": "2025-02-01"} for _ in range(n)]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    expenses = make_expenses(n)
+
+    db.configure(db_name=os.path.join(tempfile.mkdtemp(), "bench.db"))
+    db.migrate()
+
+    stub = StubClient(latency=latency)
+    ai_service.set_client(stub)
+    local_classifier.ENABLED = False
+
+    started = time.perf_counter()
+    for e in expenses[:SERIAL_SAMPLE]:
+        ai_service.get_category_from_ai(e["note"] + " serial", e["amount"], e["date"])
+    per_call = (time.perf_counter() - started) / SERIAL_SAMPLE
+    print(f"one call per expense: ~{per_call * n:8.1f} s for {n:,} expenses "
+          f"(extrapolated from {SERIAL_SAMPLE})")
+
+    stub.calls = 0
+    started = time.perf_counter()
+    ai_service.categorise_batch(expenses)
+    print(f"batched, cold cache:   {time.perf_counter() - started:8.1f} s, {stub.calls} model calls")
+
+    stub.calls = 0
+    started = time.perf_counter()
+    ai_service.categorise_batch(expenses)
+    print(f"batched, warm cache:   {time.perf_counter() - started:8.3f} s, {stub.calls} model calls")
+
+    flaky = StubClient(latency=latency, failure_rate=0.3, seed=1)
+    ai_service.set_client(flaky)
+    ai_service.category_cache.clear()
+    started = time.perf_counter()
+    categories = ai_service.categorise_batch(expenses)
+    unanswered = categories.count("Miscellaneous")
+    print(f"batched, 30% failures: {time.perf_counter() - started:8.1f} s, {flaky.calls} model calls, "
+          f"{unanswered} Miscellaneous")
+
+    local_classifier.ENABLED = True
+    ai_service.set_client(stub)
+    ai_service.category_cache.clear()
+    stub.calls = 0
+    started = time.perf_counter()
+    ai_service.categorise_batch(expenses)
+    print(f"local classifier:      {time.perf_counter() - started:8.3f} s, {stub.calls} model calls")
+
+    path = db.DB_NAME
+    db.close_all_connections()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
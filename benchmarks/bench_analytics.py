@@ -0,0 +1,101 @@
+"""Dashboard analytics: Python loops over rows vs NumPy columns.
+
+Fills a throwaway database with N transactions for one user (default
+1,000,000) and times the weekday profile, per-category monthly totals and
+amount percentiles computed row by row in Python against
+analysis.TransactionFrame, plus a memoised get_analytics() call.
+
+Usage: python benchmarks/bench_analytics.py [rows]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+# Allow imports from parent folder (so we can import db.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth
+import db
+import analysis
+
+CATEGORIES = ["Food", "Groceries", "Transport", "Shopping", "Health",
+              "Entertainment", "Bills", "Education", "Travel"]
+TODAY = date(2025, 6, 15)
+
+
+def fill(user_id, rows):
+    start = TODAY - timedelta(days=5 * 365)
+    conn = db.get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO transactions (user_id, date, category, amount, note) VALUES (?, ?, ?, ?, ?)",
+            ((user_id, (start + timedelta(days=random.randrange(5 * 365))).isoformat(),
+              random.choice(CATEGORIES), round(random.uniform(1, 500), 2), "bench")
+             for _ in range(rows)),
+        )
+
+
+def python_loops(user_id):
+    rows = db.get_connection().execute(
+        "SELECT date, amount, category FROM transactions WHERE user_id = ?", (user_id,)
+    ).fetchall()
+    weekdays = [0.0] * 7
+    monthly = defaultdict(float)
+    amounts = []
+    for day, amount, category in rows:
+        weekdays[date.fromisoformat(day).weekday()] += amount
+        monthly[(category, day[:7])] += amount
+        amounts.append(amount)
+    amounts.sort()
+    return [amounts[int(len(amounts) * q / 100)] for q in analysis.PERCENTILES]
+
+
+def load_frame(user_id):
+    return analysis.TransactionFrame.from_rows(db.get_transaction_columns(user_id))
+
+
+def numpy_frame(user_id):
+    frame = load_frame(user_id)
+    end = analysis.epoch_day(TODAY)
+    frame.weekday_profile(end)
+    frame.monthly_matrix(int(frame.months.min()), int(frame.months.max()))
+    return frame.percentiles()
+
+
+def timed(label, fn):
+    started = time.perf_counter()
+    fn()
+    print(f"{label:28} {(time.perf_counter() - started) * 1000:10.1f} ms")
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    db.configure(db_name=os.path.join(tempfile.mkdtemp(), "bench.db"))
+    db.migrate()
+    user_id = auth.create_user("bench", "bench")
+    fill(user_id, rows)
+    print(f"{rows:,} transactions\n")
+
+    timed("python loops", lambda: python_loops(user_id))
+    timed("numpy frame", lambda: numpy_frame(user_id))
+
+    frame = load_frame(user_id)
+    timed("  of which compute only", lambda: analysis.build_analytics(frame, TODAY))
+    timed("get_analytics, cold", lambda: analysis.get_analytics(user_id, TODAY))
+    timed("get_analytics, memoised", lambda: analysis.get_analytics(user_id, TODAY))
+    db.add_transaction(user_id, TODAY.isoformat(), "Food", 12.5, "bench")
+    timed("get_analytics, 1 new row", lambda: analysis.get_analytics(user_id, TODAY))
+
+    path = db.DB_NAME
+    db.close_all_connections()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
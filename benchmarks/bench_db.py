@@ -0,0 +1,241 @@
+"""Micro-benchmarks for every query function in db.py.
+
+Runs each function repeatedly against the most active user of a
+synthetic database (see populate_db.py) and reports the median and p99
+time per call and the rows it returned. Lazy results (cursors, pages,
+generators) are read to the end inside the timing. Functions that write
+are run on rows the benchmark adds itself.
+
+Save a run with --json and compare a later one with --baseline; the
+script exits non-zero if any median got more than --tolerance slower
+(default 50%, ignoring changes under 0.1 ms).
+
+Usage:
+    python benchmarks/bench_db.py                       # 50 users, 500,000 rows
+    python benchmarks/bench_db.py --users 200 --transactions 2000000
+    python benchmarks/bench_db.py --db /tmp/load.db     # an existing database
+    python benchmarks/bench_db.py --json before.json
+    python benchmarks/bench_db.py --baseline before.json
+"""
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+import db
+import populate_db
+import results as bench_results
+
+# Per function: stop after this many calls or this much time, whichever comes first
+MAX_CALLS = 200
+MAX_SECONDS = 1.0
+
+# Timings from separate runs vary a lot on a busy machine; a median has to
+# be this much (and MIN_CHANGE_MS) slower than the baseline to count
+TOLERANCE = 0.5
+MIN_CHANGE_MS = 0.1
+
+
+def consume(result):
+    """Read a lazy result to the end. Returns the row count, or None."""
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, (tuple, str, int, float, type(None))) or not hasattr(result, "__iter__"):
+        return None
+    return sum(1 for _ in result)
+
+
+def cases(user_id, username):
+    """(name, callable) for every db.py query function."""
+    month = db.get_connection().execute(
+        "SELECT MAX(substr(date, 1, 7)) FROM transactions WHERE user_id = ?", (user_id,)
+    ).fetchone()[0]
+    day = db.get_connection().execute(
+        "SELECT MAX(date) FROM transactions WHERE user_id = ?", (user_id,)
+    ).fetchone()[0]
+    max_id = db.get_data_version(user_id).max_id
+    # Halfway down the newest-first list, for a deep page
+    middle = db.get_connection().execute("""
+        SELECT date, id FROM transactions WHERE user_id = ?
+        ORDER BY date DESC, id DESC LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM transactions WHERE user_id = ?)
+    """, (user_id, user_id)).fetchone()
+
+    day_start, day_end = db.period_range(day)
+    month_start, month_end = db.period_range(month)
+
+    def query(**conditions):
+        return db.query_transactions(user_id, db.TransactionFilter(**conditions))
+
+    # Rows the write benchmarks add, change and delete
+    counter = itertools.count()
+    added = []
+
+    def add():
+        db.add_transaction(user_id, day, "Food", 9.5, "bench")
+        added.append(db.get_data_version(user_id).max_id)
+
+    def update():
+        db.update_expense(user_id, added[-1], 10.5, "Food", "bench", day)
+
+    def delete():
+        db.delete_expense(user_id, added.pop())
+
+    def import_batch():
+        return db.import_transactions(
+            user_id, ((f"bench-{i}", day, "Food", 4.0 + next(counter) % 7, "bench import") for i in range(50))
+        )
+
+    def bulk_batch():
+        return db.bulk_insert_transactions(
+            ((user_id, day, "Food", 3.0, "bench bulk") for _ in range(50)), rebuild_indexes=False
+        )
+
+    job_id = db.create_job("bench", "bench:1", time.time())
+
+    return [
+        # reads
+        ("get_all_transactions", lambda: db.get_all_transactions(user_id)),
+        ("get_transactions_page", lambda: db.get_transactions_page(user_id, 50)),
+        ("get_transactions_page deep", lambda: db.get_transactions_page(user_id, 50, middle)),
+        ("query_transactions category", lambda: query(category="Travel")),
+        ("query_transactions day", lambda: query(start=day_start, end=day_end)),
+        ("query_transactions month", lambda: query(start=month_start, end=month_end)),
+        ("query_transactions min amount", lambda: query(min_amount=1000)),
+        ("query_transactions max amount", lambda: query(max_amount=1)),
+        ("query_transactions combined", lambda: query(category="Food", start=month_start, end=month_end,
+                                                      min_amount=50)),
+        ("query_transactions text+amount", lambda: query(text="uber", min_amount=40)),
+        ("get_expense_by_id", lambda: db.get_expense_by_id(user_id, max_id)),
+        ("get_total_spent_today", lambda: db.get_total_spent_today(user_id)),
+        ("get_total_spent_this_month", lambda: db.get_total_spent_this_month(user_id)),
+        ("get_total_by_category", lambda: db.get_total_by_category(user_id, "Food")),
+        ("get_highest_spending_category", lambda: db.get_highest_spending_category(user_id)),
+        ("get_average_daily_spend_this_month", lambda: db.get_average_daily_spend_this_month(user_id)),
+        ("get_transaction_count", lambda: db.get_transaction_count(user_id)),
+        ("get_category_wise_spending", lambda: db.get_category_wise_spending(user_id)),
+        ("get_dashboard_snapshot", lambda: db.get_dashboard_snapshot(user_id)),
+        ("get_data_version", lambda: db.get_data_version(user_id)),
+        ("get_category_stats", lambda: db.get_category_stats(user_id, 0, max_id)),
+        ("get_daily_totals", lambda: db.get_daily_totals(user_id, 0, max_id)),
+        ("get_largest_transaction", lambda: db.get_largest_transaction(user_id, 0, max_id)),
+        ("get_transactions_after", lambda: db.get_transactions_after(user_id, 0, max_id)),
+        ("get_transactions_after new", lambda: db.get_transactions_after(user_id, max_id - 10, max_id)),
+        ("get_transaction_columns", lambda: db.get_transaction_columns(user_id)),
+        ("iter_transactions_for_export", lambda: db.iter_transactions_for_export(user_id)),
+        ("search_transactions", lambda: db.search_transactions(user_id, "coles", 20)),
+        ("search_transactions prefix", lambda: db.search_transactions(user_id, "wo", 20)),
+        ("search_transactions newest", lambda: db.search_transactions(user_id, "coles", 20, ranked=False)),
+        ("get_user_id", lambda: db.get_user_id(username)),
+        ("get_user_credentials", lambda: db.get_user_credentials(username)),
+        # writes
+        ("add_transaction", add),
+        ("update_expense", update),
+        ("update_categories", lambda: db.update_categories(user_id, [("Food", i) for i in added[:50]])),
+        ("delete_expense", delete),
+        ("import_transactions 50", import_batch),
+        ("bulk_insert_transactions 50", bulk_batch),
+        # category cache and jobs
+        ("put_cached_category", lambda: db.put_cached_category(f"k{next(counter)}", "Food", time.time())),
+        ("get_cached_category", lambda: db.get_cached_category("k1", 0)),
+        ("touch_cached_category", lambda: db.touch_cached_category("k1", time.time())),
+        ("evict_cached_categories", lambda: db.evict_cached_categories(0, 10_000)),
+        ("create_job", lambda: db.create_job("bench", f"bench:{next(counter)}", time.time())),
+        ("get_job", lambda: db.get_job(job_id)),
+        ("find_job", lambda: db.find_job("bench", "bench:1", ("pending", "running"))),
+        ("update_job", lambda: db.update_job(job_id, "pending", time.time())),
+        ("delete_finished_jobs", lambda: db.delete_finished_jobs("bench", "bench:", job_id)),
+        ("clear_cached_categories", db.clear_cached_categories),
+    ]
+
+
+def run(fn):
+    times = []
+    rows = None
+    budget_end = time.perf_counter() + MAX_SECONDS
+    for _ in range(MAX_CALLS):
+        started = time.perf_counter()
+        rows = consume(fn())
+        times.append(time.perf_counter() - started)
+        if time.perf_counter() > budget_end:
+            break
+    return {
+        "calls": len(times),
+        "p50_ms": bench_results.percentile(times, 50) * 1000,
+        "p99_ms": bench_results.percentile(times, 99) * 1000,
+        "rows": rows,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every db.py query function.")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--transactions", type=int, default=500_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", help="use this existing database (its users need the default password)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare with results saved by --json")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    temporary = args.db is None
+    if temporary:
+        db.configure(db_name=os.path.join(tempfile.mkdtemp(), "bench.db"))
+        started = time.perf_counter()
+        populate_db.populate(args.users, args.transactions, seed=args.seed)
+        print(f"Generated {args.transactions:,} rows for {args.users} users "
+              f"in {time.perf_counter() - started:.1f} s")
+    else:
+        db.configure(db_name=args.db)
+        db.migrate()
+
+    user_id, count = db.get_connection().execute("""
+        SELECT user_id, COUNT(*) FROM transactions WHERE user_id IS NOT NULL
+        GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1
+    """).fetchone()
+    username = db.get_connection().execute("SELECT username FROM users WHERE id = ?", (user_id,)).fetchone()[0]
+    print(f"Most active user: {username} with {count:,} transactions\n")
+
+    # The slow-query log would only repeat what this prints
+    import metrics
+    metrics.SLOW_QUERY_SECONDS = float("inf")
+
+    results = {}
+    print(f"{'function':36} {'calls':>6} {'p50 ms':>9} {'p99 ms':>9} {'rows':>8}")
+    for name, fn in cases(user_id, username):
+        r = results[name] = run(fn)
+        rows = "" if r["rows"] is None else f"{r['rows']:,}"
+        print(f"{name:36} {r['calls']:6} {r['p50_ms']:9.3f} {r['p99_ms']:9.3f} {rows:>8}")
+
+    # Flag query functions added to db.py without a case here
+    covered = {name.split()[0] for name in results}
+    public = {name for name, fn in vars(db).items()
+              if hasattr(fn, "__wrapped__") and not name.startswith("_")}
+    missing = sorted(public - covered)
+    if missing:
+        print(f"\nnot benchmarked: {', '.join(missing)}")
+
+    if args.json:
+        bench_results.save(args.json, results)
+
+    regressions = []
+    if args.baseline:
+        regressions = bench_results.compare(results, args.baseline, {"p50_ms": False},
+                                            args.tolerance, MIN_CHANGE_MS)
+
+    if temporary:
+        path = db.DB_NAME
+        db.close_all_connections()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""CSV export: fetchall + StringIO vs streamed fetchmany chunks.
+
+Fills a throwaway database with N transactions (default 1,000,000) and
+reports time to first byte, total time and peak Python memory for both
+export paths.
+
+Usage: python benchmarks/bench_export.py [rows]
+"""
+import csv
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Allow imports from parent folder (so we can import db.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+from export import EXPORT_HEADER, iter_csv, iter_gzip
+
+
+USER_ID = 1
+
+
+def fill(rows):
+    conn = db.get_connection()
+    conn.executemany(
+        "INSERT INTO transactions (user_id, date, category, amount, note) VALUES (?, ?, ?, ?, ?)",
+        ((USER_ID, f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}", "Food", i % 500 + 0.99, f"note {i}")
+         for i in range(rows)),
+    )
+    conn.commit()
+
+
+def export_fetchall():
+    """The old /export: load every row, build the whole CSV, then send it."""
+    rows = db.get_connection().execute(
+        "SELECT id, date, amount, category, note FROM transactions WHERE user_id = ? ORDER BY date DESC",
+        (USER_ID,),
+    ).fetchall()
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(EXPORT_HEADER)
+    for r in rows:
+        writer.writerow(r)
+    yield output.getvalue()
+
+
+def export_streamed():
+    return iter_csv(db.iter_transactions_for_export(USER_ID))
+
+
+def export_streamed_gzip():
+    return iter_gzip(iter_csv(db.iter_transactions_for_export(USER_ID)))
+
+
+def measure(name, make_body):
+    tracemalloc.start()
+    started = time.perf_counter()
+    first_byte = None
+    size = 0
+
+    for chunk in make_body():
+        if first_byte is None:
+            first_byte = time.perf_counter() - started
+        size += len(chunk)
+
+    total = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print(f"{name:18} first byte {first_byte * 1000:8.1f} ms   total {total:6.2f} s   "
+          f"peak {peak / 1024 / 1024:7.1f} MB   output {size / 1024 / 1024:6.1f} MB")
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    db.configure(db_name=os.path.join(tempfile.mkdtemp(), "bench.db"))
+    db.migrate()
+    fill(rows)
+    print(f"Exporting {rows:,} rows\n")
+
+    measure("fetchall", export_fetchall)
+    measure("streamed", export_streamed)
+    measure("streamed + gzip", export_streamed_gzip)
+
+    path = db.DB_NAME
+    db.close_all_connections()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Bulk statement import throughput.
+
+Writes a synthetic statement CSV with N lines (default 1,000,000), imports
+it into a throwaway database, then imports it again to time the
+dedup/upsert path. Both the default batched mode and the
+--rebuild-indexes mode are measured.
+
+Usage: python benchmarks/bench_import.py [rows]
+"""
+import csv
+import os
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+# Allow imports from parent folder (so we can import db.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth
+import db
+from importer import import_file
+
+MERCHANTS = [("Coles", "Groceries"), ("Woolworths", "Groceries"), ("Uber", "Transport"),
+             ("Shell", "Transport"), ("Netflix", "Entertainment"), ("Origin Energy", "Bills"),
+             ("Domino's", "Food"), ("Chemist Warehouse", "Health")]
+
+
+def write_statement(path, rows):
+    start = date(2020, 1, 1)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["ID", "Date", "Category", "Amount", "Notes"])
+        for i in range(rows):
+            merchant, category = random.choice(MERCHANTS)
+            day = start + timedelta(days=random.randrange(5 * 365))
+            writer.writerow([i, day.isoformat(), category, round(random.uniform(2, 300), 2), merchant])
+
+
+def report(label, result):
+    rate = result.read / result.seconds
+    print(f"{label:16} {result.read:>10,} rows   {result.seconds:6.2f} s   "
+          f"{rate:>10,.0f} rows/s   written {result.written:,}")
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    workdir = tempfile.mkdtemp()
+    statement = os.path.join(workdir, "statement.csv")
+
+    write_statement(statement, rows)
+    db.configure(db_name=os.path.join(workdir, "bench.db"))
+    db.migrate()
+    user_id = auth.create_user("bench", "bench")
+
+    report("batched", import_file(user_id, statement, source="bench"))
+    report("re-import", import_file(user_id, statement, source="bench"))
+
+    db.close_all_connections()
+    os.remove(db.DB_NAME)
+    db.migrate()
+    user_id = auth.create_user("bench", "bench")
+    report("rebuild indexes", import_file(user_id, statement, source="bench", rebuild_indexes=True))
+    report("re-import", import_file(user_id, statement, source="bench", rebuild_indexes=True))
+
+    db.close_all_connections()
+    for name in os.listdir(workdir):
+        os.remove(os.path.join(workdir, name))
+    os.rmdir(workdir)
+
+
+if __name__ == "__main__":
+    main()
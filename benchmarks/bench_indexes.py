@@ -0,0 +1,105 @@
+"""Scan vs seek: month/day filters before and after the date indexes.
+
+Builds a throwaway database with N transactions (default 1,000,000),
+times the old function-wrapped filters against the new range filters,
+then repeats with the migration indexes in place.
+
+Usage: python benchmarks/bench_indexes.py [rows]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+# Allow imports from parent folder (so we can import db.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import MIGRATIONS, month_range, day_range
+
+CATEGORIES = ["Food", "Groceries", "Transport", "Shopping", "Health",
+              "Entertainment", "Bills", "Education", "Travel"]
+MONTH = "2024-06"
+DAY = "2024-06-15"
+
+QUERIES = [
+    ("month total, strftime()",
+     "SELECT SUM(amount) FROM transactions WHERE strftime('%Y-%m', date) = ?",
+     (MONTH,)),
+    ("month rows, substr()",
+     "SELECT id, date, amount, category, note FROM transactions WHERE substr(date, 1, 7) = ?",
+     (MONTH,)),
+    ("month total, range",
+     "SELECT SUM(amount) FROM transactions WHERE date >= ? AND date < ?",
+     month_range(MONTH)),
+    ("month rows, range",
+     "SELECT id, date, amount, category, note FROM transactions WHERE date >= ? AND date < ?",
+     month_range(MONTH)),
+    ("day total, range",
+     "SELECT SUM(amount) FROM transactions WHERE date >= ? AND date < ?",
+     day_range(DAY)),
+    ("category + month, range",
+     "SELECT SUM(amount) FROM transactions WHERE category = ? AND date >= ? AND date < ?",
+     ("Food",) + month_range(MONTH)),
+    ("amount >= 450",
+     "SELECT id, date, amount, category, note FROM transactions WHERE amount >= ? ORDER BY amount DESC",
+     (450,)),
+]
+
+
+def generate_rows(n):
+    start = date(2020, 1, 1)
+    for _ in range(n):
+        day = start + timedelta(days=random.randrange(5 * 365))
+        yield (day.isoformat(), random.choice(CATEGORIES),
+               round(random.uniform(1, 500), 2), "bench")
+
+
+def time_query(conn, sql, params, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def run(conn, label):
+    print(f"\n== {label} ==")
+    for name, sql, params in QUERIES:
+        plan = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        detail = "; ".join(row[-1] for row in plan)
+        print(f"{name:28} {time_query(conn, sql, params):9.2f} ms   {detail}")
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    conn = sqlite3.connect(path)
+
+    conn.executescript(MIGRATIONS[0])
+    started = time.perf_counter()
+    conn.executemany(
+        "INSERT INTO transactions (date, category, amount, note) VALUES (?, ?, ?, ?)",
+        generate_rows(rows),
+    )
+    conn.commit()
+    print(f"Inserted {rows:,} rows in {time.perf_counter() - started:.1f}s ({path})")
+
+    run(conn, "no indexes")
+
+    started = time.perf_counter()
+    conn.executescript(MIGRATIONS[1])
+    conn.execute("ANALYZE")
+    print(f"\nBuilt indexes in {time.perf_counter() - started:.1f}s")
+
+    run(conn, "with indexes")
+
+    conn.close()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Insights prompt size and build time as a user's history grows.
+
+Fills throwaway databases with N transactions for one user spread over
+five years, then times the summary (cold, and with one new row folded
+in) and reports the estimated tokens of the prompt that would be sent,
+for the default and a tighter token budget. Prompt size should stay flat
+however many rows there are. Offline: no model is called.
+
+Usage: python benchmarks/bench_insights.py [rows ...]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+# Allow imports from parent folder (so we can import db.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth
+import db
+import ai_service
+from analysis import get_insights_summary
+from prompt_registry import estimate_tokens, get_prompt
+
+CATEGORIES = ["Food", "Groceries", "Transport", "Shopping", "Health",
+              "Entertainment", "Bills", "Education", "Travel"]
+TODAY = date(2025, 6, 15)
+TIGHT_BUDGET = 700
+
+
+def fill(user_id, rows):
+    start = TODAY - timedelta(days=5 * 365)
+    conn = db.get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO transactions (user_id, date, category, amount, note) VALUES (?, ?, ?, ?, ?)",
+            ((user_id, (start + timedelta(days=random.randrange(5 * 365 + 1))).isoformat(),
+              random.choice(CATEGORIES), round(random.uniform(1, 500), 2), "bench " * 30)
+             for _ in range(rows)),
+        )
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - started) * 1000
+
+
+def prompt_tokens(summary, budget):
+    payload = ai_service.fit_summary(summary, budget)
+    return get_prompt(ai_service.INSIGHTS_PROMPT).base_tokens + estimate_tokens(payload)
+
+
+def main():
+    totals = [int(n) for n in sys.argv[1:]] or [1_000, 10_000, 100_000, 1_000_000]
+
+    print(f"{'rows':>10} {'cold ms':>9} {'+1 row ms':>10} {'fit ms':>7} "
+          f"{'full tok':>9} {'sent tok':>9} {'tight tok':>10}")
+    for total in totals:
+        db.configure(db_name=os.path.join(tempfile.mkdtemp(), "bench.db"))
+        db.migrate()
+        user_id = auth.create_user("bench", "bench")
+        fill(user_id, total)
+
+        summary, cold = timed(lambda: get_insights_summary(user_id, TODAY))
+        db.add_transaction(user_id, TODAY.isoformat(), "Food", 12.5, "bench")
+        summary, warm = timed(lambda: get_insights_summary(user_id, TODAY))
+
+        full = get_prompt(ai_service.INSIGHTS_PROMPT).base_tokens + estimate_tokens(ai_service.to_json(summary))
+        sent, fit = timed(lambda: prompt_tokens(summary, ai_service.INSIGHTS_TOKEN_BUDGET))
+        tight = prompt_tokens(summary, TIGHT_BUDGET)
+        print(f"{total:>10,} {cold:9.1f} {warm:10.2f} {fit:7.2f} {full:9} {sent:9} {tight:10}")
+
+        path = db.DB_NAME
+        db.close_all_connections()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    print(f"\nbudgets: default {ai_service.INSIGHTS_TOKEN_BUDGET}, tight {TIGHT_BUDGET} estimated tokens")
+
+
+if __name__ == "__main__":
+    main()
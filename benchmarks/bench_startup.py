@@ -0,0 +1,96 @@
+"""Web app startup cost: imports, create_app() and the first request.
+
+Runs `import main; main.create_app()` in a fresh interpreter under
+`python -X importtime`, prints the total and the slowest imports it
+pulls in, then times a cold process up to its first answered request.
+Exits non-zero if the import total is over IMPORT_BUDGET_MS or if the
+OpenAI SDK was imported at startup.
+
+Usage: python benchmarks/bench_startup.py [runs]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEB_DIR = os.path.join(ROOT, "web")
+
+# Budget for `import main` plus create_app(), in milliseconds
+IMPORT_BUDGET_MS = 600
+
+# Imports that should only happen on the first model call
+LAZY_MODULES = ("openai",)
+
+TOP = 10
+
+STARTUP = "import main; main.create_app()"
+
+FIRST_REQUEST = """
+import time
+started = time.perf_counter()
+import main
+app = main.create_app()
+status = app.test_client().get("/login").status_code
+print(status, (time.perf_counter() - started) * 1000)
+"""
+
+
+def run(code, db_path, importtime=False):
+    args = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    env = dict(os.environ, WAIST_DB=db_path)
+    return subprocess.run(args, cwd=WEB_DIR, env=env, capture_output=True, text=True, check=True)
+
+
+def parse_importtime(stderr):
+    """(module, cumulative microseconds, depth) for each line of -X importtime output."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(cumulative), depth))
+    return modules
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+    # Warm up once so the migrations and .pyc files are not counted
+    run(STARTUP, db_path)
+
+    totals = []
+    for _ in range(runs):
+        modules = parse_importtime(run(STARTUP, db_path, importtime=True).stderr)
+        top_level = [m for m in modules if m[2] == 0]
+        totals.append(sum(us for _, us, _ in top_level) / 1000)
+
+    print(f"import main + create_app, best of {runs}: {min(totals):.1f} ms "
+          f"(budget {IMPORT_BUDGET_MS} ms)\n")
+    print("slowest imports one level down (last run):")
+    nested = [m for m in modules if m[2] == 1]
+    for name, us, _ in sorted(nested, key=lambda m: m[1], reverse=True)[:TOP]:
+        print(f"  {name:30} {us / 1000:8.1f} ms")
+
+    first = []
+    for _ in range(runs):
+        status, ms = run(FIRST_REQUEST, db_path).stdout.split()
+        first.append(float(ms))
+    print(f"\ncold start to first request (status {status}), best of {runs}: {min(first):.1f} ms")
+
+    loaded = {name for name, _, _ in modules}
+    eager = [name for name in LAZY_MODULES if name in loaded]
+    if eager:
+        print(f"\nimported at startup but should be lazy: {', '.join(eager)}")
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    return 1 if eager or min(totals) > IMPORT_BUDGET_MS else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
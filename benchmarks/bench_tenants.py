@@ -0,0 +1,111 @@
+"""Per-user query cost as the whole app grows.
+
+Fills throwaway databases where one user owns a fixed number of
+transactions (default 2,000) and everyone else owns the rest, then times
+that user's requests. With the user_id-led indexes the times should stay
+flat as the total grows; with only the old date/category indexes they grow
+with the total.
+
+Usage: python benchmarks/bench_tenants.py [user_rows] [total_rows ...]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+# Allow imports from parent folder (so we can import db.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+CATEGORIES = ["Food", "Groceries", "Transport", "Shopping", "Health",
+              "Entertainment", "Bills", "Education", "Travel"]
+OTHER_USERS = 1000
+USER_ID = 1
+MONTH = "2024-06"
+
+# The indexes from before user_id existed, for comparison
+OLD_INDEXES = """
+    CREATE INDEX idx_old_date ON transactions (date);
+    CREATE INDEX idx_old_category_date ON transactions (category, date);
+"""
+
+
+def generate_rows(user_rows, total_rows):
+    start = date(2020, 1, 1)
+    for i in range(total_rows):
+        user_id = USER_ID if i % (total_rows // user_rows) == 0 else random.randint(2, OTHER_USERS + 1)
+        day = start + timedelta(days=random.randrange(5 * 365))
+        yield (user_id, day.isoformat(), random.choice(CATEGORIES),
+               round(random.uniform(1, 500), 2), "bench")
+
+
+def time_call(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        if hasattr(result, "__iter__") and not isinstance(result, (tuple, str)):
+            list(result)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+REQUESTS = [
+    ("first page", lambda: db.get_transactions_page(USER_ID, limit=50)),
+    ("month filter", lambda: db.query_transactions(USER_ID, db.TransactionFilter(*db.period_range(MONTH)))),
+    ("category filter", lambda: db.query_transactions(USER_ID, db.TransactionFilter(category="Food"))),
+    ("dashboard", lambda: db.get_dashboard_snapshot(USER_ID)),
+    ("data version", lambda: db.get_data_version(USER_ID)),
+    ("new-row fold", lambda: db.get_category_stats(USER_ID, 0)),
+]
+
+
+def run(label):
+    cells = [f"{time_call(fn):9.2f}" for _, fn in REQUESTS]
+    print(f"{label:28}" + " ".join(cells))
+
+
+def main():
+    user_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000
+    totals = [int(n) for n in sys.argv[2:]] or [100_000, 1_000_000]
+
+    print(f"{'':28}" + " ".join(f"{name[:9]:>9}" for name, _ in REQUESTS) + "   (ms)")
+
+    for total in totals:
+        db.configure(db_name=os.path.join(tempfile.mkdtemp(), "bench.db"))
+        db.migrate()
+        conn = db.get_connection()
+        with conn:
+            conn.executemany(
+                "INSERT INTO transactions (user_id, date, category, amount, note) VALUES (?, ?, ?, ?, ?)",
+                generate_rows(user_rows, total),
+            )
+        conn.execute("ANALYZE")
+
+        run(f"{total:>9,} rows, user_id")
+
+        # Same data with only the pre-user_id indexes
+        indexes = conn.execute("""
+            SELECT name FROM sqlite_master
+            WHERE type = 'index' AND tbl_name = 'transactions'
+              AND name != 'idx_transactions_user_import_id'
+        """).fetchall()
+        for (name,) in indexes:
+            conn.execute(f"DROP INDEX {name}")
+        conn.executescript(OLD_INDEXES)
+        conn.execute("ANALYZE")
+
+        run(f"{total:>9,} rows, date only")
+
+        path = db.DB_NAME
+        db.close_all_connections()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
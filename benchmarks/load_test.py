@@ -0,0 +1,244 @@
+"""HTTP load test of the web app.
+
+Generates a synthetic database (see populate_db.py), starts the app on
+a local port in a separate process with the model replaced by
+ai_stub.StubClient, and has N concurrent clients log in as different
+users and request a weighted mix of pages for a fixed time. Reports
+requests, errors, throughput and p50/p99 latency per route, then the
+server's costliest queries from /metrics.
+
+Save a run with --json and compare a later one with --baseline; the
+script exits non-zero if throughput or latency got more than
+--tolerance worse.
+
+The app runs on Werkzeug's threaded development server, so absolute
+numbers are lower than under a production WSGI server. They are meant
+for comparing runs on the same machine.
+
+Usage:
+    python benchmarks/load_test.py                          # 8 clients, 20 s
+    python benchmarks/load_test.py --clients 32 --duration 60 --transactions 2000000
+    python benchmarks/load_test.py --json before.json
+    python benchmarks/load_test.py --baseline before.json
+    python benchmarks/load_test.py --url http://127.0.0.1:5000 --users 10   # a running server
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+import results as bench_results
+
+# (path, weight) of the request mix
+ROUTES = [
+    ("/transactions", 40),
+    ("/analysis", 25),
+    ("/insights", 20),
+    ("/insights/anomalies", 10),
+    ("/export", 5),
+]
+
+# Simulated model latency, seconds
+MODEL_LATENCY = 0.5
+
+# Requests in the first WARMUP seconds fill caches and are not counted
+WARMUP = 3.0
+
+
+def serve(db_path, model_latency, port_pipe):
+    """Run the app on a free local port (in a child process)."""
+    sys.path.append(os.path.join(ROOT, "web"))
+    os.environ["WAIST_DB"] = db_path
+
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    import ai_service
+    import main
+    from ai_stub import StubClient
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args):
+            pass
+
+    app = main.create_app()
+    ai_service.set_client(StubClient(latency=model_latency))
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+    port_pipe.send(server.server_port)
+    server.serve_forever()
+
+
+class Client:
+    """One logged-in user session over http.client."""
+
+    def __init__(self, host, port, username, password):
+        self.conn = http.client.HTTPConnection(host, port, timeout=60)
+        self.cookie = ""
+        body = urllib.parse.urlencode({"username": username, "password": password})
+        status, _ = self.request("POST", "/login", body,
+                                 {"Content-Type": "application/x-www-form-urlencoded"})
+        if status != 302 or not self.cookie:
+            raise RuntimeError(f"login failed for {username} (status {status})")
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        self.conn.request(method, path, body, headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        cookie = response.getheader("Set-Cookie")
+        if cookie:
+            self.cookie = cookie.split(";", 1)[0]
+        if response.getheader("Connection", "").lower() == "close" or response.version == 10:
+            self.conn.close()
+        return response.status, data
+
+
+def worker(client, deadline, warm_after, seed, samples):
+    rng = random.Random(seed)
+    paths = [path for path, _ in ROUTES]
+    weights = [weight for _, weight in ROUTES]
+    while True:
+        path = rng.choices(paths, weights)[0]
+        started = time.perf_counter()
+        if started >= deadline:
+            return
+        try:
+            status, _ = client.request("GET", path)
+        except (OSError, http.client.HTTPException):
+            status = None
+            client.conn.close()
+        if started >= warm_after:
+            samples.append((path, time.perf_counter() - started, status))
+
+
+def summarise(samples, seconds):
+    results = {}
+    by_route = {}
+    for path, latency, status in samples:
+        by_route.setdefault(path, []).append((latency, status))
+    by_route["all"] = [(latency, status) for _, latency, status in samples]
+
+    for path, rows in by_route.items():
+        latencies = [latency for latency, _ in rows]
+        results[path] = {
+            "requests": len(rows),
+            "errors": sum(1 for _, status in rows if status is None or status >= 400),
+            "rps": len(rows) / seconds,
+            "p50_ms": bench_results.percentile(latencies, 50) * 1000,
+            "p99_ms": bench_results.percentile(latencies, 99) * 1000,
+        }
+    return results
+
+
+def top_queries(host, port, count=8):
+    """(query, calls, total seconds) of the server's costliest queries, from /metrics."""
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    conn.request("GET", "/metrics")
+    text = conn.getresponse().read().decode()
+    conn.close()
+
+    totals = {}
+    calls = {}
+    for name, query, value in re.findall(
+            r'^waist_db_query_duration_seconds_(sum|count)\{query="([^"]+)"\} (\S+)$', text, re.M):
+        (totals if name == "sum" else calls)[query] = float(value)
+    return sorted(((q, int(calls.get(q, 0)), s) for q, s in totals.items()),
+                  key=lambda row: row[2], reverse=True)[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the WAIST web app.")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent client sessions")
+    parser.add_argument("--duration", type=float, default=20, help="seconds, after the warm-up")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--transactions", type=int, default=500_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--model-latency", type=float, default=MODEL_LATENCY)
+    parser.add_argument("--url", help="test this running server instead; users user1..userN "
+                                      "must exist with the populate_db.py default password")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare with results saved by --json")
+    parser.add_argument("--tolerance", type=float, default=bench_results.TOLERANCE)
+    args = parser.parse_args(argv)
+
+    import populate_db
+
+    server = None
+    if args.url:
+        parsed = urllib.parse.urlsplit(args.url)
+        host, port = parsed.hostname, parsed.port or 80
+        usernames = [f"user{i}" for i in range(1, args.users + 1)]
+    else:
+        import db
+
+        db_path = os.path.join(tempfile.mkdtemp(), "load.db")
+        db.configure(db_name=db_path)
+        started = time.perf_counter()
+        user_ids = populate_db.populate(args.users, args.transactions, seed=args.seed)
+        usernames = [f"user{user_id}" for user_id in user_ids]
+        db.close_all_connections()
+        print(f"Generated {args.transactions:,} rows for {args.users} users "
+              f"in {time.perf_counter() - started:.1f} s")
+
+        receive, send = multiprocessing.get_context("spawn").Pipe(duplex=False)
+        # spawn, not fork: the server must not inherit this process's metrics
+        server = multiprocessing.get_context("spawn").Process(target=serve, args=(db_path, args.model_latency, send), daemon=True)
+        server.start()
+        host, port = "127.0.0.1", receive.recv()
+
+    try:
+        clients = [Client(host, port, usernames[i % len(usernames)], populate_db.DEFAULT_PASSWORD)
+                   for i in range(args.clients)]
+
+        print(f"{args.clients} clients, {WARMUP:.0f} s warm-up + {args.duration:.0f} s\n")
+        warm_after = time.perf_counter() + WARMUP
+        deadline = warm_after + args.duration
+        samples = []  # list.append is thread-safe
+        threads = [
+            threading.Thread(target=worker, args=(client, deadline, warm_after, args.seed + i, samples))
+            for i, client in enumerate(clients)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        results = summarise(samples, args.duration)
+        print(f"{'route':22} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9}")
+        for path, r in results.items():
+            print(f"{path:22} {r['requests']:9} {r['errors']:7} {r['rps']:8.1f} "
+                  f"{r['p50_ms']:9.1f} {r['p99_ms']:9.1f}")
+
+        print(f"\n{'costliest queries':36} {'calls':>8} {'total s':>9} {'mean ms':>9}")
+        for query, calls, seconds in top_queries(host, port):
+            print(f"{query:36} {calls:8} {seconds:9.2f} {seconds / max(calls, 1) * 1000:9.2f}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+
+    if args.json:
+        bench_results.save(args.json, results)
+
+    regressions = []
+    if args.baseline:
+        regressions = bench_results.compare(
+            results, args.baseline, {"rps": True, "p50_ms": False, "p99_ms": False}, args.tolerance
+        )
+
+    return 1 if regressions or results["all"]["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""Shared by bench_db.py and load_test.py: percentiles, saving results and
+comparing a run with a saved baseline."""
+import json
+import math
+
+# A metric this much worse than the baseline counts as a regression
+TOLERANCE = 0.2
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    index = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def save(path, results):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def compare(results, baseline_path, metrics, tolerance=TOLERANCE, floor=0.0):
+    """Print each metric of results next to the baseline's and return the
+    regressions as (name, metric, baseline, current) tuples.
+
+    results and the baseline file are {name: {metric: value}}. metrics maps
+    each compared metric to True if higher is better (e.g. throughput),
+    False if lower is better (e.g. latency). Changes smaller than floor,
+    in the metric's own units, are never regressions; tiny timings are
+    mostly noise.
+    """
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)
+
+    regressions = []
+    print(f"\n{'vs baseline':32} {'metric':>12} {'before':>10} {'after':>10} {'change':>8}")
+    for name, current in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for metric, higher_is_better in metrics.items():
+            if metric not in current or not before.get(metric):
+                continue
+            old, new = before[metric], current[metric]
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = "  REGRESSION" if worse > tolerance and abs(new - old) > floor else ""
+            print(f"{name:32} {metric:>12} {old:10.3f} {new:10.3f} {change:+8.1%}{flag}")
+            if flag:
+                regressions.append((name, metric, old, new))
+    return regressions
@@ -0,0 +1,131 @@
+"""Two-tier cache for AI categorisation results.
+
+Tier 1 is an in-process LRU. Tier 2 is the category_cache table in SQLite,
+so results survive restarts and are shared between worker processes.
+Entries expire after a TTL, and the table is trimmed to a maximum size.
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from db import (
+    get_cached_category,
+    touch_cached_category,
+    put_cached_category,
+    evict_cached_categories,
+    clear_cached_categories,
+)
+
+MEMORY_ENTRIES = 2048
+DISK_ENTRIES = 100_000
+TTL_SECONDS = 30 * 24 * 3600
+
+# Run eviction on the table once every this many writes
+EVICT_EVERY = 200
+
+# Runs of anything but letters (in any script) collapse to one space
+_NON_LETTERS = re.compile(r"[\W\d_]+")
+
+
+def normalise_text(text):
+    """'  Uber Ride #4821 ' -> 'uber ride', 'Café Crème' -> 'café crème'.
+
+    Digits and punctuation are dropped so receipt numbers and dates don't
+    defeat the cache. Letters of every script are kept, case-folded and
+    in composed (NFKC) form.
+    """
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    return _NON_LETTERS.sub(" ", text).strip()
+
+
+def make_key(note, description, prompt_version):
+    """Cache key for one expense under one version of the prompt, or None
+    if neither note nor description has any letters to key on.
+
+    Amount and date are deliberately left out: the same merchant note maps
+    to the same category whatever was spent.
+    """
+    note, description = normalise_text(note), normalise_text(description)
+    if not note and not description:
+        return None
+    raw = f"{prompt_version}|{note}|{description}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class CategoryCache:
+    def __init__(self, memory_entries=MEMORY_ENTRIES, disk_entries=DISK_ENTRIES,
+                 ttl_seconds=TTL_SECONDS):
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._memory = OrderedDict()  # key -> (category, created_at)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def get(self, key):
+        """Return the cached category for key, or None."""
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] >= now - self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return entry[0]
+
+        row = get_cached_category(key, now - self.ttl_seconds)
+        if row is None:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+
+        category, created_at = row
+        touch_cached_category(key, now)
+        with self._lock:
+            self._stats["disk_hits"] += 1
+            self._remember(key, category, created_at)
+        return category
+
+    def put(self, key, category):
+        now = time.time()
+        put_cached_category(key, category, now)
+
+        with self._lock:
+            self._remember(key, category, now)
+            self._stats["writes"] += 1
+            self._writes += 1
+            evict = self._writes % EVICT_EVERY == 0
+
+        if evict:
+            self.evict()
+
+    def evict(self):
+        removed = evict_cached_categories(time.time() - self.ttl_seconds, self.disk_entries)
+        with self._lock:
+            self._stats["evictions"] += removed
+        return removed
+
+    def clear(self):
+        clear_cached_categories()
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        """Hit/miss counters plus the current memory tier size."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_size"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (lookups - stats["misses"]) / lookups if lookups else 0.0
+        return stats
+
+    def _remember(self, key, category, created_at):
+        self._memory[key] = (category, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
@@ -1,321 +1,1586 @@
+import calendar
+import functools
+import os
+import queue
+import re
 import sqlite3
-from werkzeug.security import generate_password_hash, check_password_hash
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
 
-# Use your actual DB file
-DB_NAME = "/Users/sujeethkumartuniki/Desktop/Coding/waist-app/waist_app.db"
+from metrics import timed_query
+
+# Database file. Override with the WAIST_DB environment variable or configure().
+DB_NAME = os.getenv(
+    "WAIST_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "waist_app.db"),
+)
+
+# Applied to every new connection.
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -16000,  # negative = KiB, so ~16 MB
+    "temp_store": "MEMORY",
+}
+
+# How many compiled statements each connection keeps around.
+STATEMENT_CACHE_SIZE = 128
+
+# How many idle connections we keep for reuse.
+POOL_SIZE = 8
+
+# How long migrate() waits for another process's migration to finish.
+MIGRATION_WAIT_SECONDS = 600
+
+_local = threading.local()
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+
+
+# ----------------------------
+# CONNECTION MANAGEMENT
+# ----------------------------
+
+def configure(db_name=None, pragmas=None, pool_size=None, statement_cache_size=None):
+    """Change the database path or connection settings.
+
+    Idle pooled connections are closed so the next get_connection()
+    picks up the new settings.
+    """
+    global DB_NAME, STATEMENT_CACHE_SIZE, POOL_SIZE, _pool
+
+    if db_name is not None:
+        DB_NAME = db_name
+    if pragmas is not None:
+        PRAGMAS.update(pragmas)
+    if statement_cache_size is not None:
+        STATEMENT_CACHE_SIZE = statement_cache_size
+
+    close_all_connections()
+
+    if pool_size is not None:
+        POOL_SIZE = pool_size
+        _pool = queue.LifoQueue(maxsize=POOL_SIZE)
+
+
+def _open_connection():
+    conn = sqlite3.connect(
+        DB_NAME,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=False,  # pooled connections move between threads
+    )
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
 
 
 def get_connection():
-    """Create and return a database connection."""
-    return sqlite3.connect(DB_NAME)
+    """Return this thread's database connection.
+
+    The connection is reused for every call on the same thread until
+    release_connection() hands it back to the pool. Callers must not
+    close it.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            conn = _open_connection()
+        _local.conn = conn
+    return conn
+
+
+def release_connection(exc=None):
+    """Return this thread's connection to the pool (Flask teardown hook)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        return
+    _local.conn = None
+    _return_connection(conn)
+
+
+def _detach_connection():
+    """Take this thread's connection away from the thread.
+
+    For results streamed after the request: Flask's teardown calls
+    release_connection() before a streamed body is read, and a connection
+    with an open cursor must not be handed to another thread meanwhile.
+    The caller gives it back with _return_connection() when done.
+    """
+    conn = get_connection()
+    _local.conn = None
+    return conn
+
+
+def _return_connection(conn):
+    if conn.in_transaction:
+        conn.rollback()
+
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+
+def close_all_connections():
+    """Close this thread's connection and every idle pooled connection."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _local.conn = None
+        conn.close()
+
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            break
 
 
 # ----------------------------
-# TRANSACTIONS CRUD FUNCTIONS
+# SCHEMA MIGRATIONS
 # ----------------------------
 
-def add_transaction(date, category, amount, note):
-    """Insert a new transaction. Column name is 'note' (not 'notes')."""
+# Each entry upgrades the schema by one version (tracked in PRAGMA user_version).
+# Only ever append to this list.
+MIGRATIONS = [
+    # 1: base tables
+    """
+    CREATE TABLE IF NOT EXISTS transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL,
+        category TEXT NOT NULL,
+        amount REAL NOT NULL,
+        note TEXT
+    );
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE,
+        password TEXT NOT NULL
+    );
+    """,
+    # 2: indexes for date, category and amount filters
+    """
+    CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date);
+    CREATE INDEX IF NOT EXISTS idx_transactions_category_date ON transactions (category, date);
+    CREATE INDEX IF NOT EXISTS idx_transactions_amount ON transactions (amount);
+    """,
+    # 3: natural key for imported statement lines (NULL for hand-entered rows)
+    """
+    ALTER TABLE transactions ADD COLUMN import_id TEXT;
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_import_id
+        ON transactions (import_id) WHERE import_id IS NOT NULL;
+    """,
+    # 4: persistent tier of the AI categorisation cache
+    """
+    CREATE TABLE IF NOT EXISTS category_cache (
+        key TEXT PRIMARY KEY,
+        category TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        last_used_at REAL NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_category_cache_last_used
+        ON category_cache (last_used_at);
+    """,
+    # 5: change counter so caches can tell when existing rows were edited/deleted
+    #    (new rows are detected by MAX(id), AUTOINCREMENT never reuses ids)
+    """
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO meta (key, value) VALUES ('transactions_rewrites', 0);
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_update_version
+    AFTER UPDATE ON transactions
+    BEGIN
+        UPDATE meta SET value = value + 1 WHERE key = 'transactions_rewrites';
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_delete_version
+    AFTER DELETE ON transactions
+    BEGIN
+        UPDATE meta SET value = value + 1 WHERE key = 'transactions_rewrites';
+    END;
+    """,
+    # 6: background jobs and their cached results
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        key TEXT NOT NULL,
+        status TEXT NOT NULL,
+        result TEXT,
+        error TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_kind_key ON jobs (kind, key);
+    """,
+    # 7: per-day and per-month category totals, kept current by triggers
+    #    (rows whose count drops to zero are removed)
+    """
+    CREATE TABLE IF NOT EXISTS daily_rollup (
+        day TEXT NOT NULL,
+        category TEXT NOT NULL,
+        total REAL NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (day, category)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS monthly_rollup (
+        month TEXT NOT NULL,
+        category TEXT NOT NULL,
+        total REAL NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (month, category)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_insert
+    AFTER INSERT ON transactions
+    BEGIN
+        INSERT INTO daily_rollup (day, category, total, count)
+        VALUES (NEW.date, NEW.category, NEW.amount, 1)
+        ON CONFLICT (day, category) DO UPDATE
+        SET total = total + excluded.total, count = count + 1;
+
+        INSERT INTO monthly_rollup (month, category, total, count)
+        VALUES (substr(NEW.date, 1, 7), NEW.category, NEW.amount, 1)
+        ON CONFLICT (month, category) DO UPDATE
+        SET total = total + excluded.total, count = count + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_delete
+    AFTER DELETE ON transactions
+    BEGIN
+        UPDATE daily_rollup SET total = total - OLD.amount, count = count - 1
+        WHERE day = OLD.date AND category = OLD.category;
+        DELETE FROM daily_rollup
+        WHERE day = OLD.date AND category = OLD.category AND count <= 0;
+
+        UPDATE monthly_rollup SET total = total - OLD.amount, count = count - 1
+        WHERE month = substr(OLD.date, 1, 7) AND category = OLD.category;
+        DELETE FROM monthly_rollup
+        WHERE month = substr(OLD.date, 1, 7) AND category = OLD.category AND count <= 0;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_update
+    AFTER UPDATE OF date, category, amount ON transactions
+    WHEN OLD.date IS NOT NEW.date
+      OR OLD.category IS NOT NEW.category
+      OR OLD.amount IS NOT NEW.amount
+    BEGIN
+        UPDATE daily_rollup SET total = total - OLD.amount, count = count - 1
+        WHERE day = OLD.date AND category = OLD.category;
+        DELETE FROM daily_rollup
+        WHERE day = OLD.date AND category = OLD.category AND count <= 0;
+
+        UPDATE monthly_rollup SET total = total - OLD.amount, count = count - 1
+        WHERE month = substr(OLD.date, 1, 7) AND category = OLD.category;
+        DELETE FROM monthly_rollup
+        WHERE month = substr(OLD.date, 1, 7) AND category = OLD.category AND count <= 0;
+
+        INSERT INTO daily_rollup (day, category, total, count)
+        VALUES (NEW.date, NEW.category, NEW.amount, 1)
+        ON CONFLICT (day, category) DO UPDATE
+        SET total = total + excluded.total, count = count + 1;
+
+        INSERT INTO monthly_rollup (month, category, total, count)
+        VALUES (substr(NEW.date, 1, 7), NEW.category, NEW.amount, 1)
+        ON CONFLICT (month, category) DO UPDATE
+        SET total = total + excluded.total, count = count + 1;
+    END;
+
+    INSERT INTO daily_rollup (day, category, total, count)
+        SELECT date, category, SUM(amount), COUNT(*)
+        FROM transactions GROUP BY date, category;
+    INSERT INTO monthly_rollup (month, category, total, count)
+        SELECT substr(day, 1, 7), category, SUM(total), SUM(count)
+        FROM daily_rollup GROUP BY substr(day, 1, 7), category;
+    """,
+    # 8: per-user data. Transactions get a user_id, every index and rollup is
+    #    led by it, and the change counter is kept per user. Existing rows are
+    #    given to the only user if there is exactly one; otherwise they stay
+    #    unowned (user_id NULL) and are not visible to anyone.
+    """
+    ALTER TABLE transactions ADD COLUMN user_id INTEGER REFERENCES users (id);
+    UPDATE transactions SET user_id = (SELECT MIN(id) FROM users)
+    WHERE user_id IS NULL AND (SELECT COUNT(*) FROM users) = 1;
+
+    DROP INDEX IF EXISTS idx_transactions_date;
+    DROP INDEX IF EXISTS idx_transactions_category_date;
+    DROP INDEX IF EXISTS idx_transactions_amount;
+    DROP INDEX IF EXISTS idx_transactions_import_id;
+    -- (user_id) alone is (user_id, id) in practice: used for per-user MAX(id)
+    -- and "new rows since id N" lookups
+    CREATE INDEX idx_transactions_user ON transactions (user_id);
+    CREATE INDEX idx_transactions_user_date ON transactions (user_id, date);
+    CREATE INDEX idx_transactions_user_category_date ON transactions (user_id, category, date);
+    CREATE INDEX idx_transactions_user_amount ON transactions (user_id, amount);
+    CREATE UNIQUE INDEX idx_transactions_user_import_id
+        ON transactions (user_id, import_id) WHERE import_id IS NOT NULL;
+
+    DROP TRIGGER IF EXISTS trg_transactions_update_version;
+    DROP TRIGGER IF EXISTS trg_transactions_delete_version;
+    DELETE FROM meta WHERE key = 'transactions_rewrites';
+    CREATE TRIGGER trg_transactions_update_version
+    AFTER UPDATE ON transactions
+    BEGIN
+        INSERT INTO meta (key, value) VALUES ('rewrites:' || COALESCE(OLD.user_id, 0), 1)
+        ON CONFLICT (key) DO UPDATE SET value = value + 1;
+        INSERT INTO meta (key, value) VALUES ('rewrites:' || COALESCE(NEW.user_id, 0), 1)
+        ON CONFLICT (key) DO UPDATE SET value = value + 1;
+    END;
+    CREATE TRIGGER trg_transactions_delete_version
+    AFTER DELETE ON transactions
+    BEGIN
+        INSERT INTO meta (key, value) VALUES ('rewrites:' || COALESCE(OLD.user_id, 0), 1)
+        ON CONFLICT (key) DO UPDATE SET value = value + 1;
+    END;
+
+    DROP TRIGGER IF EXISTS trg_rollup_insert;
+    DROP TRIGGER IF EXISTS trg_rollup_delete;
+    DROP TRIGGER IF EXISTS trg_rollup_update;
+    DROP TABLE IF EXISTS daily_rollup;
+    DROP TABLE IF EXISTS monthly_rollup;
+    CREATE TABLE daily_rollup (
+        user_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        category TEXT NOT NULL,
+        total REAL NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (user_id, day, category)
+    ) WITHOUT ROWID;
+    CREATE TABLE monthly_rollup (
+        user_id INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        category TEXT NOT NULL,
+        total REAL NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (user_id, month, category)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER trg_rollup_insert
+    AFTER INSERT ON transactions
+    WHEN NEW.user_id IS NOT NULL
+    BEGIN
+        INSERT INTO daily_rollup (user_id, day, category, total, count)
+        VALUES (NEW.user_id, NEW.date, NEW.category, NEW.amount, 1)
+        ON CONFLICT (user_id, day, category) DO UPDATE
+        SET total = total + excluded.total, count = count + 1;
+
+        INSERT INTO monthly_rollup (user_id, month, category, total, count)
+        VALUES (NEW.user_id, substr(NEW.date, 1, 7), NEW.category, NEW.amount, 1)
+        ON CONFLICT (user_id, month, category) DO UPDATE
+        SET total = total + excluded.total, count = count + 1;
+    END;
+
+    CREATE TRIGGER trg_rollup_delete
+    AFTER DELETE ON transactions
+    WHEN OLD.user_id IS NOT NULL
+    BEGIN
+        UPDATE daily_rollup SET total = total - OLD.amount, count = count - 1
+        WHERE user_id = OLD.user_id AND day = OLD.date AND category = OLD.category;
+        DELETE FROM daily_rollup
+        WHERE user_id = OLD.user_id AND day = OLD.date AND category = OLD.category
+          AND count <= 0;
+
+        UPDATE monthly_rollup SET total = total - OLD.amount, count = count - 1
+        WHERE user_id = OLD.user_id AND month = substr(OLD.date, 1, 7)
+          AND category = OLD.category;
+        DELETE FROM monthly_rollup
+        WHERE user_id = OLD.user_id AND month = substr(OLD.date, 1, 7)
+          AND category = OLD.category AND count <= 0;
+    END;
+
+    CREATE TRIGGER trg_rollup_update
+    AFTER UPDATE OF user_id, date, category, amount ON transactions
+    WHEN OLD.user_id IS NOT NEW.user_id
+      OR OLD.date IS NOT NEW.date
+      OR OLD.category IS NOT NEW.category
+      OR OLD.amount IS NOT NEW.amount
+    BEGIN
+        UPDATE daily_rollup SET total = total - OLD.amount, count = count - 1
+        WHERE user_id = OLD.user_id AND day = OLD.date AND category = OLD.category;
+        DELETE FROM daily_rollup
+        WHERE user_id = OLD.user_id AND day = OLD.date AND category = OLD.category
+          AND count <= 0;
+
+        UPDATE monthly_rollup SET total = total - OLD.amount, count = count - 1
+        WHERE user_id = OLD.user_id AND month = substr(OLD.date, 1, 7)
+          AND category = OLD.category;
+        DELETE FROM monthly_rollup
+        WHERE user_id = OLD.user_id AND month = substr(OLD.date, 1, 7)
+          AND category = OLD.category AND count <= 0;
+
+        INSERT INTO daily_rollup (user_id, day, category, total, count)
+        SELECT NEW.user_id, NEW.date, NEW.category, NEW.amount, 1
+        WHERE NEW.user_id IS NOT NULL
+        ON CONFLICT (user_id, day, category) DO UPDATE
+        SET total = total + excluded.total, count = count + 1;
+
+        INSERT INTO monthly_rollup (user_id, month, category, total, count)
+        SELECT NEW.user_id, substr(NEW.date, 1, 7), NEW.category, NEW.amount, 1
+        WHERE NEW.user_id IS NOT NULL
+        ON CONFLICT (user_id, month, category) DO UPDATE
+        SET total = total + excluded.total, count = count + 1;
+    END;
+
+    INSERT INTO daily_rollup (user_id, day, category, total, count)
+        SELECT user_id, date, category, SUM(amount), COUNT(*)
+        FROM transactions WHERE user_id IS NOT NULL
+        GROUP BY user_id, date, category;
+    INSERT INTO monthly_rollup (user_id, month, category, total, count)
+        SELECT user_id, substr(day, 1, 7), category, SUM(total), SUM(count)
+        FROM daily_rollup GROUP BY user_id, substr(day, 1, 7), category;
+
+    DELETE FROM jobs;
+    """,
+    # 9: full-text index over notes. External content, so the text is not
+    #    stored twice; the view adds an owner token ('u<user_id>') that a
+    #    search ANDs with its terms to stay inside one user's rows. Prefix
+    #    indexes make 2- and 3-letter prefix queries cheap.
+    """
+    CREATE VIEW transactions_fts_source AS
+        SELECT id, note, 'u' || user_id AS owner FROM transactions;
+    CREATE VIRTUAL TABLE transactions_fts USING fts5 (
+        note, owner,
+        content = 'transactions_fts_source', content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    );
+    -- rank by the note only; the owner token is in every row of the user
+    INSERT INTO transactions_fts (transactions_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)');
+
+    CREATE TRIGGER trg_fts_insert
+    AFTER INSERT ON transactions
+    BEGIN
+        INSERT INTO transactions_fts (rowid, note, owner)
+        VALUES (NEW.id, NEW.note, 'u' || NEW.user_id);
+    END;
+    CREATE TRIGGER trg_fts_delete
+    AFTER DELETE ON transactions
+    BEGIN
+        INSERT INTO transactions_fts (transactions_fts, rowid, note, owner)
+        VALUES ('delete', OLD.id, OLD.note, 'u' || OLD.user_id);
+    END;
+    CREATE TRIGGER trg_fts_update
+    AFTER UPDATE OF note, user_id ON transactions
+    WHEN OLD.note IS NOT NEW.note OR OLD.user_id IS NOT NEW.user_id
+    BEGIN
+        INSERT INTO transactions_fts (transactions_fts, rowid, note, owner)
+        VALUES ('delete', OLD.id, OLD.note, 'u' || OLD.user_id);
+        INSERT INTO transactions_fts (rowid, note, owner)
+        VALUES (NEW.id, NEW.note, 'u' || NEW.user_id);
+    END;
+
+    INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild');
+    """,
+]
+
+
+def migrate():
+    """Bring the database schema up to date. Safe to call on every start,
+    from any number of processes at once."""
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO transactions (date, category, amount, note)
-        VALUES (?, ?, ?, ?)
-    """, (date, category, amount, note))
+    # A large migration can hold the write lock for a while; wait it out
+    busy_timeout = conn.execute("PRAGMA busy_timeout").fetchone()[0]
+    conn.execute(f"PRAGMA busy_timeout = {MIGRATION_WAIT_SECONDS * 1000}")
+
+    try:
+        while _migrate_one(conn):
+            pass
+    finally:
+        conn.execute(f"PRAGMA busy_timeout = {busy_timeout}")
+
+    return len(MIGRATIONS)
+
+
+def _migrate_one(conn):
+    """Apply the next pending migration, if any. Returns whether it did."""
+    # Read the version under the write lock, so a process that waited for
+    # another one's migration sees it as applied and skips it
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < len(MIGRATIONS):
+            # executescript() would commit first, so run the statements one by one
+            for statement in _statements(MIGRATIONS[version]):
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+    except BaseException:
+        conn.rollback()
+        raise
     conn.commit()
-    conn.close()
+    return version < len(MIGRATIONS)
+
+
+def _statements(script):
+    """Split an SQL script into complete statements (trigger bodies included)."""
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ""
+
+
+# ----------------------------
+# DATE RANGE HELPERS
+# ----------------------------
+
+# Dates are stored as ISO 'YYYY-MM-DD' text, so they sort correctly and
+# "date >= start AND date < end" can seek on idx_transactions_date.
+
+def day_range(day):
+    """'YYYY-MM-DD' -> (day, next day) as ISO strings."""
+    start = datetime.strptime(day, "%Y-%m-%d").date()
+    return start.isoformat(), (start + timedelta(days=1)).isoformat()
+
 
+def month_range(month):
+    """'YYYY-MM' -> (first day of month, first day of next month) as ISO strings."""
+    start = datetime.strptime(month, "%Y-%m").date()
+    days_in_month = calendar.monthrange(start.year, start.month)[1]
+    return start.isoformat(), (start + timedelta(days=days_in_month)).isoformat()
 
-def get_all_transactions():
-    """Return all transactions ordered by date DESC.
 
-    Order of columns must match how templates use row indices:
-    id, date, amount, category, note
+def check_date(value):
+    """Return value if it is an ISO 'YYYY-MM-DD' date, else raise ValueError.
+
+    Range filters, rollups and analytics all read dates back in this form,
+    so it is checked before a date is written.
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT id, date, amount, category, note
-        FROM transactions
-        ORDER BY date DESC
-    """)
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
+    try:
+        valid = datetime.strptime(value, "%Y-%m-%d").date().isoformat() == value
+    except (TypeError, ValueError):
+        valid = False
+    if not valid:
+        raise ValueError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+    return value
+
+
+def utc_today():
+    """Today's date in UTC, matching SQLite's DATE('now')."""
+    return datetime.now(timezone.utc).date()
 
 
-def get_expenses_by_category(category):
+# ----------------------------
+# TRANSACTIONS CRUD FUNCTIONS
+# ----------------------------
+
+# Every transaction belongs to one user and every query below is scoped by
+# user_id. The indexes are all led by user_id, so the cost of a request
+# depends on that user's history, not on how many rows the whole app holds.
+#
+# Query functions are wrapped in metrics.timed_query, which records their
+# time and row counts for /metrics and prints the slow ones.
+
+
+class Transaction(NamedTuple):
+    """One transaction, as returned by every query below that reads rows.
+
+    Still a tuple (same size, no per-row dict), so positional unpacking
+    and the CSV writer keep working; use the field names everywhere else.
+    """
+    id: int
+    date: str
+    amount: float
+    category: str
+    note: Optional[str]
+
+    def as_dict(self, *fields):
+        """The record as a dict for JSON, limited to `fields` if given."""
+        if not fields:
+            return dict(zip(self._fields, self))
+        return {name: getattr(self, name) for name in fields}
+
+
+_new_tuple = tuple.__new__
+
+
+def _transaction_row(cursor, row):
+    # Row factory: builds the record straight from SQLite's row tuple
+    return _new_tuple(Transaction, row)
+
+
+def _transaction_cursor(conn=None):
+    """A cursor whose rows come back as Transaction records.
+
+    Every query run on it must select id, date, amount, category, note.
+    """
+    cursor = (conn or get_connection()).cursor()
+    cursor.row_factory = _transaction_row
+    return cursor
+
+@timed_query
+def add_transaction(user_id, date, category, amount, note):
+    """Insert a new transaction. Column name is 'note' (not 'notes').
+
+    Raises ValueError if date is not 'YYYY-MM-DD'.
+    """
+    check_date(date)
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("""
-        SELECT id, date, amount, category, note
-        FROM transactions
-        WHERE category = ?
-        ORDER BY date DESC
-    """, (category,))
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
+        INSERT INTO transactions (user_id, date, category, amount, note)
+        VALUES (?, ?, ?, ?, ?)
+    """, (user_id, date, category, amount, note))
+    conn.commit()
 
 
-def get_expenses_by_date(date):
-    conn = get_connection()
-    cursor = conn.cursor()
+@timed_query
+def get_all_transactions(user_id):
+    """Return all of a user's transactions (Transaction records) ordered by date DESC."""
+    cursor = _transaction_cursor()
     cursor.execute("""
         SELECT id, date, amount, category, note
         FROM transactions
-        WHERE date = ?
+        WHERE user_id = ?
         ORDER BY date DESC
-    """, (date,))
+    """, (user_id,))
     rows = cursor.fetchall()
-    conn.close()
     return rows
 
 
-def get_expenses_by_month(month):
-    """month in format 'YYYY-MM'."""
+class TransactionPage:
+    """One page of transactions, streamed lazily from an open cursor.
+
+    Iterate it once. When iteration finishes, next_cursor holds the
+    (date, id) to pass as `after` for the following page, or None if
+    this was the last page.
+    """
+
+    def __init__(self, cursor, limit):
+        self._cursor = cursor
+        self.limit = limit
+        self.next_cursor = None
+
+    def __iter__(self):
+        last = None
+        try:
+            for n, row in enumerate(self._cursor, start=1):
+                if n > self.limit:
+                    # We fetched one extra row, so there is another page
+                    self.next_cursor = (last.date, last.id)
+                    break
+                last = row
+                yield row
+        finally:
+            self._cursor.close()
+            _return_connection(self._cursor.connection)
+
+
+@timed_query
+def import_transactions(user_id, rows, rebuild_indexes=False):
+    """Bulk upsert (import_id, date, category, amount, note) rows for a user.
+
+    All rows go in with one executemany inside a single transaction. rows
+    may be a generator; it is consumed lazily. A row whose import_id
+    already exists for this user updates that transaction instead of
+    adding a duplicate.
+
+    With rebuild_indexes=True the secondary indexes and rollup triggers are
+    dropped for the load; indexes and rollups are rebuilt at the end,
+    inside the same transaction. That is much faster when the import is
+    large compared to the existing table.
+
+    Returns how many rows were inserted or changed.
+    """
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT id, date, amount, category, note
-        FROM transactions
-        WHERE substr(date, 1, 7) = ?
-        ORDER BY date DESC
-    """, (month,))
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
+
+    with conn:
+        dropped = _drop_indexes(conn) if rebuild_indexes else []
+
+        cursor = conn.executemany("""
+            INSERT INTO transactions (user_id, import_id, date, category, amount, note)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, import_id) WHERE import_id IS NOT NULL DO UPDATE
+            SET date = excluded.date,
+                category = excluded.category,
+                amount = excluded.amount,
+                note = excluded.note
+            WHERE date IS NOT excluded.date
+               OR category IS NOT excluded.category
+               OR amount IS NOT excluded.amount
+               OR note IS NOT excluded.note
+        """, ((user_id,) + tuple(row) for row in rows))
+        # rowcount excludes rows written by triggers
+        changed = cursor.rowcount
+
+        _restore_indexes(conn, dropped)
+
+    return changed
 
 
-def get_expenses_min_amount(min_amount):
+@timed_query
+def bulk_insert_transactions(rows, rebuild_indexes=True):
+    """Insert (user_id, date, category, amount, note) rows, for any users.
+
+    For generated or restored data: plain inserts, no upsert, all in one
+    transaction. With rebuild_indexes (the default) the indexes and rollup
+    triggers are dropped for the load and rebuilt at the end, as in
+    import_transactions(). Returns the number of rows inserted.
+    """
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT id, date, amount, category, note
-        FROM transactions
-        WHERE amount >= ?
-        ORDER BY amount DESC
-    """, (min_amount,))
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
 
+    with conn:
+        dropped = _drop_indexes(conn) if rebuild_indexes else []
+        cursor = conn.executemany(
+            "INSERT INTO transactions (user_id, date, category, amount, note) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        inserted = cursor.rowcount
+        _restore_indexes(conn, dropped)
+
+    return inserted
+
+
+def _drop_indexes(conn):
+    """Drop the transactions indexes, rollup triggers and full-text triggers
+    inside the caller's transaction. Returns them for _restore_indexes()."""
+    # sqlite3 only opens a transaction implicitly before INSERT/UPDATE/DELETE,
+    # so without this the drops would commit at once and outlive a failed load
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    # The import_id index backs ON CONFLICT, so it has to stay
+    dropped = conn.execute("""
+        SELECT type, name, sql FROM sqlite_master
+        WHERE tbl_name = 'transactions' AND sql IS NOT NULL
+          AND ((type = 'index' AND name != 'idx_transactions_user_import_id')
+               OR (type = 'trigger' AND (name LIKE 'trg_rollup_%' OR name LIKE 'trg_fts_%')))
+    """).fetchall()
+    for kind, name, _ in dropped:
+        conn.execute(f"DROP {kind.upper()} {name}")
+    return dropped
 
-def get_expenses_max_amount(max_amount):
+
+def _restore_indexes(conn, dropped):
+    """Recreate what _drop_indexes() dropped and recompute the rollups and
+    the full-text index."""
+    for _, _, sql in dropped:
+        conn.execute(sql)
+    if dropped:
+        _rebuild_rollups(conn)
+        conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')")
+
+
+@timed_query
+def update_categories(user_id, updates):
+    """Set many categories at once. updates is an iterable of (category, id)."""
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT id, date, amount, category, note
-        FROM transactions
-        WHERE amount <= ?
-        ORDER BY amount ASC
-    """, (max_amount,))
+    with conn:
+        conn.executemany(
+            "UPDATE transactions SET category = ? WHERE id = ? AND user_id = ?",
+            ((category, expense_id, user_id) for category, expense_id in updates),
+        )
+
+
+@timed_query
+def get_transactions_page(user_id, limit=50, after=None):
+    """Return a TransactionPage of up to `limit` rows, newest first.
+
+    Uses keyset pagination on (date, id): `after` is the next_cursor of the
+    previous page, so every page is an index seek no matter how deep it is.
+    Rows are Transaction records.
+
+    The page owns its connection until it has been iterated, since the
+    web app streams it after the request's own connection is released.
+    """
+    cursor = _transaction_cursor(_detach_connection())
+
+    if after is None:
+        cursor.execute("""
+            SELECT id, date, amount, category, note
+            FROM transactions
+            WHERE user_id = ?
+            ORDER BY date DESC, id DESC
+            LIMIT ?
+        """, (user_id, limit + 1))
+    else:
+        cursor.execute("""
+            SELECT id, date, amount, category, note
+            FROM transactions
+            WHERE user_id = ? AND (date, id) < (?, ?)
+            ORDER BY date DESC, id DESC
+            LIMIT ?
+        """, (user_id, after[0], after[1], limit + 1))
+
+    return TransactionPage(cursor, limit)
+
+
+# ----------------------------
+# COMBINED FILTERS
+# ----------------------------
+
+# Any mix of filters runs as one statement. The SQL depends only on which
+# filters are set (the filter's "shape"), so it is built once per shape
+# and every connection's statement cache reuses the prepared statement,
+# plan included. The user's indexes cover each predicate: category (+ date)
+# -> idx_transactions_user_category_date, dates -> idx_transactions_user_date,
+# amounts -> idx_transactions_user_amount, text -> transactions_fts.
+# SQLite picks between them using the ANALYZE statistics, except for
+# amount ranges: without histograms it cannot tell a range that holds a
+# dozen rows from one that holds them all, and walks the date index.
+# A bounded count on the amount index decides that instead.
+
+# An amount range with fewer of the user's rows than this is read through
+# the amount index
+AMOUNT_PROBE_ROWS = 1000
+
+# Print each filter shape's EXPLAIN QUERY PLAN the first time it runs
+EXPLAIN_QUERIES = os.getenv("WAIST_EXPLAIN_QUERIES") == "1"
+
+
+class TransactionFilter(NamedTuple):
+    """Conditions on a user's transactions; unset (None) ones are ignored.
+
+    start is inclusive and end exclusive, both 'YYYY-MM-DD' (see
+    period_range()). text matches note words as prefixes, like
+    search_transactions().
+    """
+    category: Optional[str] = None
+    start: Optional[str] = None
+    end: Optional[str] = None
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
+    text: Optional[str] = None
+
+    def narrow(self, **conditions):
+        """A filter matching rows that pass both this one and `conditions`.
+
+        Date and amount bounds keep the tighter of the two values, text
+        words are added to the existing ones. A different category than
+        the one already set raises ValueError.
+        """
+        tighter = {"start": max, "end": min, "min_amount": max, "max_amount": min}
+        values = self._asdict()
+        for name, value in conditions.items():
+            current = values[name]
+            if value is None or current is None:
+                values[name] = current if value is None else value
+            elif name in tighter:
+                values[name] = tighter[name](current, value)
+            elif name == "text":
+                values[name] = f"{current} {value}"
+            elif value != current:
+                raise ValueError(f"conflicting {name}: {current!r} and {value!r}")
+        return TransactionFilter(**values)
+
+    @property
+    def shape(self):
+        """Names of the conditions that are set."""
+        return tuple(name for name, value in zip(self._fields, self) if value is not None)
+
+
+def period_range(value):
+    """'YYYY-MM-DD' or 'YYYY-MM' -> (start, end) ISO dates, end exclusive.
+
+    Raises ValueError for anything else.
+    """
+    return day_range(value) if len(value) > 7 else month_range(value)
+
+
+_FILTER_PREDICATES = {
+    "category": "t.category = ?",
+    "start": "t.date >= ?",
+    "end": "t.date < ?",
+    "min_amount": "t.amount >= ?",
+    "max_amount": "t.amount <= ?",
+    "text": "t.id IN (SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH ?)",
+}
+
+
+@functools.lru_cache(maxsize=128)
+def _filter_sql(shape, keyset, index=None):
+    where = ["t.user_id = ?"] + [_FILTER_PREDICATES[name] for name in shape]
+    if keyset:
+        where.append("(t.date, t.id) < (?, ?)")
+    indexed_by = f" INDEXED BY {index}" if index else ""
+    return (
+        "SELECT t.id, t.date, t.amount, t.category, t.note\n"
+        f"FROM transactions AS t{indexed_by}\n"
+        "WHERE " + "\n  AND ".join(where) + "\n"
+        "ORDER BY t.date DESC, t.id DESC\n"
+        "LIMIT ?"
+    )
+
+
+def _filter_statement(user_id, filters, limit, after):
+    """(sql, params) for one page of filtered rows."""
+    params = [user_id]
+    shape = []
+    for name in filters.shape:
+        value = getattr(filters, name)
+        if name == "text":
+            value = fts_query(user_id, value)
+            if value is None:
+                continue  # nothing searchable typed: no text condition
+        shape.append(name)
+        params.append(value)
+    if after is not None:
+        params.extend(after)
+    params.append(limit + 1)
+
+    index = None
+    if "text" not in shape and _few_in_amount_range(user_id, filters.min_amount, filters.max_amount):
+        index = "idx_transactions_user_amount"
+    return _filter_sql(tuple(shape), after is not None, index), params
+
+
+def _few_in_amount_range(user_id, min_amount, max_amount):
+    """True if the user has fewer than AMOUNT_PROBE_ROWS rows in the range.
+
+    Reads at most that many entries of the amount index.
+    """
+    if min_amount is None and max_amount is None:
+        return False
+    count = get_connection().execute("""
+        SELECT COUNT(*) FROM (
+            SELECT 1 FROM transactions INDEXED BY idx_transactions_user_amount
+            WHERE user_id = ? AND amount >= ? AND amount <= ?
+            LIMIT ?
+        )
+    """, (
+        user_id,
+        min_amount if min_amount is not None else float("-inf"),
+        max_amount if max_amount is not None else float("inf"),
+        AMOUNT_PROBE_ROWS,
+    )).fetchone()[0]
+    return count < AMOUNT_PROBE_ROWS
+
+
+_explained = set()
+
+
+@timed_query
+def query_transactions(user_id, filters=TransactionFilter(), limit=50, after=None):
+    """Return a TransactionPage of a user's rows matching every condition in
+    filters, newest first, with the same keyset paging as get_transactions_page()."""
+    sql, params = _filter_statement(user_id, filters, limit, after)
+
+    if EXPLAIN_QUERIES and sql not in _explained:
+        _explained.add(sql)
+        plan = "\n  ".join(explain_transactions(user_id, filters, limit, after))
+        print(f"Query plan for filters {filters.shape or '(none)'}:\n  {plan}", file=sys.stderr)
+
+    cursor = _transaction_cursor(_detach_connection())
+    cursor.execute(sql, params)
+    return TransactionPage(cursor, limit)
+
+
+def explain_transactions(user_id, filters=TransactionFilter(), limit=50, after=None):
+    """SQLite's EXPLAIN QUERY PLAN lines for query_transactions() with these arguments."""
+    sql, params = _filter_statement(user_id, filters, limit, after)
+    rows = get_connection().execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    return [detail for _, _, _, detail in rows]
+
+
+# Words of a search; each becomes a prefix term, all of which must match
+_SEARCH_WORDS = re.compile(r"\w+")
+MAX_SEARCH_TERMS = 8
+
+
+def fts_query(user_id, text):
+    """FTS5 MATCH expression for a search box's text, or None if it has no words.
+
+    'Coles exp' -> owner : "u7" AND note : ("coles" * "exp" *). Words are
+    quoted, so FTS5 syntax typed by the user is matched as plain text.
+    """
+    words = _SEARCH_WORDS.findall(text.lower())[:MAX_SEARCH_TERMS]
+    if not words:
+        return None
+    terms = " ".join(f'"{word}" *' for word in words)
+    return f'owner : "u{user_id}" AND note : ({terms})'
+
+
+class SearchResults(NamedTuple):
+    rows: list                   # Transaction records, best match first
+    next_offset: Optional[int]   # offset of the next page, None on the last
+
+
+@timed_query
+def search_transactions(user_id, text, limit=50, offset=0, ranked=True):
+    """Search a user's notes for every word of text, as prefixes.
+
+    ranked=True orders by bm25 relevance, which scores every match: a few
+    ms for a few hundred matches, tens of ms for a common word in a
+    100k-row history. ranked=False returns the newest first, which FTS5
+    reads straight off its index, stopping after one page (a few ms at
+    most). Either way the cost depends on the user's matches, not on the
+    size of the table.
+    """
+    match = fts_query(user_id, text)
+    if match is None:
+        return SearchResults([], None)
+
+    # Selecting rank at all makes FTS5 score every match, so only when ranked
+    if ranked:
+        columns, order, outer_order = "rowid, rank", "rank", "f.rank"
+    else:
+        columns, order, outer_order = "rowid", "rowid DESC", "t.id DESC"
+
+    cursor = _transaction_cursor()
+    cursor.execute(f"""
+        SELECT t.id, t.date, t.amount, t.category, t.note
+        FROM (
+            SELECT {columns} FROM transactions_fts
+            WHERE transactions_fts MATCH ?
+            ORDER BY {order}
+            LIMIT ? OFFSET ?
+        ) AS f
+        JOIN transactions AS t ON t.id = f.rowid
+        WHERE t.user_id = ?
+        ORDER BY {outer_order}
+    """, (match, limit + 1, offset, user_id))
     rows = cursor.fetchall()
-    conn.close()
-    return rows
 
+    # One extra row was fetched to tell whether there is another page
+    if len(rows) > limit:
+        return SearchResults(rows[:limit], offset + limit)
+    return SearchResults(rows, None)
 
-def delete_expense(expense_id):
+
+@timed_query
+def delete_expense(user_id, expense_id):
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("""
         DELETE FROM transactions
-        WHERE id = ?
-    """, (expense_id,))
+        WHERE id = ? AND user_id = ?
+    """, (expense_id, user_id))
     conn.commit()
-    conn.close()
 
 
-def get_expense_by_id(expense_id):
-    """Return a single expense row by id: (id, date, amount, category, note)."""
-    conn = get_connection()
-    cursor = conn.cursor()
+@timed_query
+def get_expense_by_id(user_id, expense_id):
+    """Return a single expense by id as a Transaction.
+
+    None if it does not exist or belongs to another user.
+    """
+    cursor = _transaction_cursor()
     cursor.execute("""
         SELECT id, date, amount, category, note
         FROM transactions
-        WHERE id = ?
-    """, (expense_id,))
+        WHERE id = ? AND user_id = ?
+    """, (expense_id, user_id))
     result = cursor.fetchone()
-    conn.close()
     return result
 
 
-def update_expense(expense_id, amount, category, note, date):
-    """Update an expense. Order of args must match how main.py calls it."""
+@timed_query
+def update_expense(user_id, expense_id, amount, category, note, date):
+    """Update an expense. Note the argument order: amount, category, note, date.
+
+    Raises ValueError if date is not 'YYYY-MM-DD'.
+    """
+    check_date(date)
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("""
         UPDATE transactions
         SET amount = ?, category = ?, note = ?, date = ?
-        WHERE id = ?
-    """, (amount, category, note, date, expense_id))
+        WHERE id = ? AND user_id = ?
+    """, (amount, category, note, date, expense_id, user_id))
     conn.commit()
-    conn.close()
 
 
 # ----------------------------
 # ANALYSIS FUNCTIONS
 # ----------------------------
 
-def get_total_spent_today():
-    conn = get_connection()
-    cursor = conn.cursor()
+# These read the daily/monthly rollups, so their cost depends on the number
+# of categories and months, not the number of transactions.
+
+@timed_query
+def get_total_spent_today(user_id):
+    cursor = get_connection().cursor()
     cursor.execute("""
-        SELECT SUM(amount)
-        FROM transactions
-        WHERE date = DATE('now')
-    """)
+        SELECT SUM(total)
+        FROM daily_rollup
+        WHERE user_id = ? AND day = ?
+    """, (user_id, utc_today().isoformat()))
     result = cursor.fetchone()[0]
-    conn.close()
     return result or 0
 
 
-def get_total_spent_this_month():
-    conn = get_connection()
-    cursor = conn.cursor()
+@timed_query
+def get_total_spent_this_month(user_id):
+    cursor = get_connection().cursor()
     cursor.execute("""
-        SELECT SUM(amount)
-        FROM transactions
-        WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now')
-    """)
+        SELECT SUM(total)
+        FROM monthly_rollup
+        WHERE user_id = ? AND month = ?
+    """, (user_id, utc_today().strftime("%Y-%m")))
     result = cursor.fetchone()[0]
-    conn.close()
     return result or 0
 
 
-def get_total_by_category(category):
-    conn = get_connection()
-    cursor = conn.cursor()
+@timed_query
+def get_total_by_category(user_id, category):
+    cursor = get_connection().cursor()
     cursor.execute("""
-        SELECT SUM(amount)
-        FROM transactions
-        WHERE category = ?
-    """, (category,))
+        SELECT SUM(total)
+        FROM monthly_rollup
+        WHERE user_id = ? AND category = ?
+    """, (user_id, category))
     result = cursor.fetchone()[0]
-    conn.close()
     return result or 0
 
 
-def get_highest_spending_category():
-    conn = get_connection()
-    cursor = conn.cursor()
+@timed_query
+def get_highest_spending_category(user_id):
+    cursor = get_connection().cursor()
     cursor.execute("""
-        SELECT category, SUM(amount) AS total
-        FROM transactions
+        SELECT category, SUM(total) AS total
+        FROM monthly_rollup
+        WHERE user_id = ?
         GROUP BY category
         ORDER BY total DESC
         LIMIT 1
-    """)
+    """, (user_id,))
     result = cursor.fetchone()
-    conn.close()
     return result  # (category, total) or None
 
 
-def get_average_daily_spend_this_month():
-    import calendar
+@timed_query
+def get_average_daily_spend_this_month(user_id):
+    today = utc_today()
+    days_in_month = calendar.monthrange(today.year, today.month)[1]
+    # Undecorated, so the query's time is recorded under this call only
+    return get_total_spent_this_month.__wrapped__(user_id) / days_in_month
+
+
+@timed_query
+def get_transaction_count(user_id):
+    cursor = get_connection().cursor()
+    cursor.execute("SELECT SUM(count) FROM monthly_rollup WHERE user_id = ?", (user_id,))
+    result = cursor.fetchone()[0]
+    return result or 0
+
+
+@timed_query
+def get_category_wise_spending(user_id):
+    cursor = get_connection().cursor()
+    cursor.execute("""
+        SELECT category, SUM(total)
+        FROM monthly_rollup
+        WHERE user_id = ?
+        GROUP BY category
+        ORDER BY SUM(total) DESC
+    """, (user_id,))
+    rows = cursor.fetchall()
+    return rows
+
+
+class DashboardSnapshot(NamedTuple):
+    """Everything the analytics dashboard shows."""
+    total_today: float
+    total_month: float
+    avg_daily: float
+    highest: Optional[tuple]  # (category, total) or None
+    count: int
+    categories: list  # [(category, total), ...] highest first
+
+
+@timed_query
+def get_dashboard_snapshot(user_id):
+    """Compute all of a user's dashboard metrics from the rollup tables.
+
+    "Today" and "this month" use UTC, same as SQLite's DATE('now').
+    """
+    today = utc_today()
+    days_in_month = calendar.monthrange(today.year, today.month)[1]
+
+    cursor = get_connection().cursor()
+    cursor.execute("""
+        SELECT category,
+               SUM(total),
+               SUM(count),
+               SUM(CASE WHEN month = ? THEN total ELSE 0 END)
+        FROM monthly_rollup
+        WHERE user_id = ?
+        GROUP BY category
+        ORDER BY SUM(total) DESC
+    """, (today.strftime("%Y-%m"), user_id))
+    rows = cursor.fetchall()
+
+    categories = [(r[0], r[1]) for r in rows]
+    total_month = sum(r[3] for r in rows)
+
+    return DashboardSnapshot(
+        total_today=get_total_spent_today.__wrapped__(user_id),  # timed as part of this call
+        total_month=total_month,
+        avg_daily=total_month / days_in_month,
+        highest=categories[0] if categories else None,
+        count=sum(r[2] for r in rows),
+        categories=categories,
+    )
 
+
+def rebuild_rollups():
+    """Recompute daily_rollup and monthly_rollup from transactions."""
     conn = get_connection()
-    cursor = conn.cursor()
+    with conn:
+        _rebuild_rollups(conn)
+
+
+def _rebuild_rollups(conn):
+    conn.execute("DELETE FROM daily_rollup")
+    conn.execute("DELETE FROM monthly_rollup")
+    conn.execute("""
+        INSERT INTO daily_rollup (user_id, day, category, total, count)
+        SELECT user_id, date, category, SUM(amount), COUNT(*)
+        FROM transactions
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id, date, category
+    """)
+    conn.execute("""
+        INSERT INTO monthly_rollup (user_id, month, category, total, count)
+        SELECT user_id, substr(day, 1, 7), category, SUM(total), SUM(count)
+        FROM daily_rollup
+        GROUP BY user_id, substr(day, 1, 7), category
+    """)
+
+
+def verify_rollups(tolerance=0.005):
+    """Compare the rollups with a fresh aggregate of transactions.
 
-    # Total for this month
+    Returns a list of (table, user_id, period, category, expected, found)
+    for each row that differs, where expected/found are (total, count) or
+    None. An empty list means the rollups are correct.
+    """
+    cursor = get_connection().cursor()
+
+    expected_daily = {}
+    expected_monthly = {}
     cursor.execute("""
-        SELECT SUM(amount)
+        SELECT user_id, date, category, SUM(amount), COUNT(*)
         FROM transactions
-        WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now')
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id, date, category
     """)
-    total = cursor.fetchone()[0] or 0
+    for user_id, day, category, total, count in cursor:
+        expected_daily[(user_id, day, category)] = (total, count)
+        month_key = (user_id, day[:7], category)
+        month_total, month_count = expected_monthly.get(month_key, (0.0, 0))
+        expected_monthly[month_key] = (month_total + total, month_count + count)
 
-    # Days in current month
-    cursor.execute("SELECT strftime('%Y', 'now'), strftime('%m', 'now')")
-    year, month = cursor.fetchone()
-    year = int(year)
-    month = int(month)
-    days_in_month = calendar.monthrange(year, month)[1]
+    cursor.execute("SELECT user_id, day, category, total, count FROM daily_rollup")
+    found_daily = {tuple(row[:3]): (row[3], row[4]) for row in cursor}
+    cursor.execute("SELECT user_id, month, category, total, count FROM monthly_rollup")
+    found_monthly = {tuple(row[:3]): (row[3], row[4]) for row in cursor}
 
-    conn.close()
-    return total / days_in_month if days_in_month > 0 else 0
+    return (_diff_rollup("daily_rollup", expected_daily, found_daily, tolerance)
+            + _diff_rollup("monthly_rollup", expected_monthly, found_monthly, tolerance))
 
 
-def get_transaction_count():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM transactions")
-    result = cursor.fetchone()[0]
-    conn.close()
-    return result or 0
+def _diff_rollup(table, expected, found, tolerance):
+    mismatches = []
+    for key in expected.keys() | found.keys():
+        want = expected.get(key)
+        have = found.get(key)
+        if (want is None or have is None or want[1] != have[1]
+                or abs(want[0] - have[0]) > tolerance):
+            mismatches.append((table, *key, want, have))
+    return sorted(mismatches)
 
 
-def get_category_wise_spending():
-    conn = get_connection()
-    cursor = conn.cursor()
+# Largest possible rowid, used as an open upper bound for id ranges
+MAX_ID = 2 ** 63 - 1
+
+
+class DataVersion(NamedTuple):
+    """Identifies the current state of one user's transactions.
+
+    max_id grows on every insert; rewrites grows on every update/delete.
+    """
+    max_id: int
+    rewrites: int
+
+
+@timed_query
+def get_data_version(user_id):
+    cursor = get_connection().cursor()
+    cursor.execute("""
+        SELECT (SELECT MAX(id) FROM transactions WHERE user_id = ?),
+               (SELECT value FROM meta WHERE key = 'rewrites:' || ?)
+    """, (user_id, user_id))
+    max_id, rewrites = cursor.fetchone()
+    return DataVersion(max_id or 0, rewrites or 0)
+
+
+@timed_query
+def get_category_stats(user_id, after_id=0, up_to_id=None):
+    """Per-category (category, count, total, sum of squares) for ids in (after_id, up_to_id]."""
+    cursor = get_connection().cursor()
     cursor.execute("""
-        SELECT category, SUM(amount)
+        SELECT category, COUNT(*), SUM(amount), SUM(amount * amount)
         FROM transactions
+        WHERE user_id = ? AND id > ? AND id <= ?
         GROUP BY category
-        ORDER BY SUM(amount) DESC
-    """)
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
+    """, (user_id, after_id, up_to_id if up_to_id is not None else MAX_ID))
+    return cursor.fetchall()
 
 
-def get_all_transactions_for_export():
-    """Used by /export route. Keep same order as UI expects."""
-    conn = get_connection()
-    cursor = conn.cursor()
+@timed_query
+def get_daily_totals(user_id, after_id=0, up_to_id=None):
+    """Per-day (date, total) for ids in (after_id, up_to_id]."""
+    cursor = get_connection().cursor()
+    cursor.execute("""
+        SELECT date, SUM(amount)
+        FROM transactions
+        WHERE user_id = ? AND id > ? AND id <= ?
+        GROUP BY date
+    """, (user_id, after_id, up_to_id if up_to_id is not None else MAX_ID))
+    return cursor.fetchall()
+
+
+@timed_query
+def get_largest_transaction(user_id, after_id=0, up_to_id=None):
+    """The largest Transaction with an id in (after_id, up_to_id], or None."""
+    cursor = _transaction_cursor()
     cursor.execute("""
         SELECT id, date, amount, category, note
         FROM transactions
-        ORDER BY date DESC
-    """)
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
+        WHERE user_id = ? AND id > ? AND id <= ?
+        ORDER BY amount DESC
+        LIMIT 1
+    """, (user_id, after_id, up_to_id if up_to_id is not None else MAX_ID))
+    return cursor.fetchone()
+
+
+@timed_query
+def get_transactions_after(user_id, after_id=0, up_to_id=None):
+    """A user's Transactions with ids in (after_id, up_to_id], oldest
+    first. Streams from the cursor."""
+    cursor = _transaction_cursor()
+    cursor.execute("""
+        SELECT id, date, amount, category, note
+        FROM transactions
+        WHERE user_id = ? AND id > ? AND id <= ?
+        ORDER BY id
+    """, (user_id, after_id, up_to_id if up_to_id is not None else MAX_ID))
+    return cursor
+
+
+@timed_query
+def get_transaction_columns(user_id, after_id=0, up_to_id=None):
+    """(epoch day, amount, category) for a user's transactions with ids in (after_id, up_to_id].
+
+    Epoch day is days since 1970-01-01, computed by SQLite so the caller
+    gets plain integers to load into arrays (see analysis.TransactionFrame).
+    Rows whose date SQLite cannot parse (written before dates were
+    checked) are left out.
+    """
+    cursor = get_connection().cursor()
+    cursor.execute("""
+        SELECT CAST(julianday(date) - 2440587.5 AS INTEGER), amount, category
+        FROM transactions
+        WHERE user_id = ? AND id > ? AND id <= ?
+          AND julianday(date) IS NOT NULL
+    """, (user_id, after_id, up_to_id if up_to_id is not None else MAX_ID))
+    return cursor.fetchall()
+
+
+EXPORT_BATCH_SIZE = 1000
+
+def iter_transactions_for_export(user_id, batch_size=EXPORT_BATCH_SIZE):
+    """Yield every one of a user's transactions for the CSV export, newest first.
+
+    Rows are plain (id, date, amount, category, note) tuples, pulled from
+    the cursor `batch_size` at a time, so memory use does not grow with
+    the size of the table. The generator uses a
+    connection of its own, returned to the pool when it finishes.
+    """
+    conn = _detach_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT id, date, amount, category, note
+            FROM transactions
+            WHERE user_id = ?
+            ORDER BY date DESC, id DESC
+        """, (user_id,))
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            yield from batch
+    finally:
+        cursor.close()
+        _return_connection(conn)
+
+
+# ----------------------------
+# CATEGORY CACHE (category_cache table)
+# ----------------------------
+
+@timed_query
+def get_cached_category(key, created_after):
+    """Return (category, created_at) for key, or None if missing or expired."""
+    conn = get_connection()
+    return conn.execute("""
+        SELECT category, created_at FROM category_cache
+        WHERE key = ? AND created_at >= ?
+    """, (key, created_after)).fetchone()
+
+
+@timed_query
+def touch_cached_category(key, now):
+    conn = get_connection()
+    conn.execute("UPDATE category_cache SET last_used_at = ? WHERE key = ?", (now, key))
+    conn.commit()
+
+
+@timed_query
+def put_cached_category(key, category, now):
+    conn = get_connection()
+    conn.execute("""
+        INSERT INTO category_cache (key, category, created_at, last_used_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (key) DO UPDATE
+        SET category = excluded.category,
+            created_at = excluded.created_at,
+            last_used_at = excluded.last_used_at
+    """, (key, category, now, now))
+    conn.commit()
+
+
+@timed_query
+def evict_cached_categories(created_before, max_entries):
+    """Drop expired entries, then the least recently used beyond max_entries.
+
+    Returns the number of rows removed.
+    """
+    conn = get_connection()
+    before = conn.total_changes
+
+    with conn:
+        conn.execute("DELETE FROM category_cache WHERE created_at < ?", (created_before,))
+        conn.execute("""
+            DELETE FROM category_cache
+            WHERE key IN (
+                SELECT key FROM category_cache
+                ORDER BY last_used_at DESC
+                LIMIT -1 OFFSET ?
+            )
+        """, (max_entries,))
+
+    return conn.total_changes - before
+
+
+@timed_query
+def clear_cached_categories():
+    conn = get_connection()
+    conn.execute("DELETE FROM category_cache")
+    conn.commit()
 
 
 # ----------------------------
-# AUTH FUNCTIONS (users table)
+# BACKGROUND JOBS (jobs table)
 # ----------------------------
 
-def create_user(username, password):
-    """Create a new user with a hashed password."""
+# Rows are (id, kind, key, status, result, error, created_at, updated_at)
+
+@timed_query
+def create_job(kind, key, now):
     conn = get_connection()
     cursor = conn.cursor()
-    hashed_password = generate_password_hash(password)
+    cursor.execute("""
+        INSERT INTO jobs (kind, key, status, created_at, updated_at)
+        VALUES (?, ?, 'pending', ?, ?)
+    """, (kind, key, now, now))
+    conn.commit()
+    return cursor.lastrowid
 
+
+@timed_query
+def get_job(job_id):
+    cursor = get_connection().cursor()
     cursor.execute("""
-        INSERT INTO users (username, password)
-        VALUES (?, ?)
-    """, (username, hashed_password))
+        SELECT id, kind, key, status, result, error, created_at, updated_at
+        FROM jobs
+        WHERE id = ?
+    """, (job_id,))
+    return cursor.fetchone()
+
+
+@timed_query
+def find_job(kind, key, statuses):
+    """Newest job for (kind, key) whose status is one of statuses, or None."""
+    placeholders = ", ".join("?" for _ in statuses)
+    cursor = get_connection().cursor()
+    cursor.execute(f"""
+        SELECT id, kind, key, status, result, error, created_at, updated_at
+        FROM jobs
+        WHERE kind = ? AND key = ? AND status IN ({placeholders})
+        ORDER BY id DESC
+        LIMIT 1
+    """, (kind, key, *statuses))
+    return cursor.fetchone()
+
 
+@timed_query
+def update_job(job_id, status, now, result=None, error=None):
+    conn = get_connection()
+    conn.execute("""
+        UPDATE jobs
+        SET status = ?, result = ?, error = ?, updated_at = ?
+        WHERE id = ?
+    """, (status, result, error, now, job_id))
     conn.commit()
-    conn.close()
 
 
-def verify_user(username, password):
-    """Check if username exists and password is correct."""
+@timed_query
+def delete_finished_jobs(kind, key_prefix, keep_id):
+    """Drop finished jobs of this kind whose key starts with key_prefix,
+    except job keep_id."""
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT password FROM users WHERE username = ?", (username,))
-    row = cursor.fetchone()
-    conn.close()
+    conn.execute("""
+        DELETE FROM jobs
+        WHERE kind = ? AND substr(key, 1, ?) = ? AND id != ?
+          AND status IN ('done', 'failed')
+    """, (kind, len(key_prefix), key_prefix, keep_id))
+    conn.commit()
 
-    if row is None:
-        return False
 
-    hashed_password = row[0]
-    return check_password_hash(hashed_password, password)
+# ----------------------------
+# USERS TABLE
+# ----------------------------
 
+# Storage only: hashing, rate limiting and caching live in auth.py.
+# username is UNIQUE, so lookups by name use its implicit index.
 
-def update_user_password(username, new_password):
-    """Update password for a user, with hashing."""
+def insert_user(username, password_hash):
+    """Add a user with an already hashed password. Returns the new id."""
     conn = get_connection()
     cursor = conn.cursor()
-    hashed = generate_password_hash(new_password)
     cursor.execute("""
-        UPDATE users
-        SET password = ?
-        WHERE username = ?
-    """, (hashed, username))
+        INSERT INTO users (username, password)
+        VALUES (?, ?)
+    """, (username, password_hash))
+    conn.commit()
+    return cursor.lastrowid
+
+
+@timed_query
+def get_user_credentials(username):
+    """Return (id, password hash) of the user with this username, or None."""
+    cursor = get_connection().cursor()
+    cursor.execute("SELECT id, password FROM users WHERE username = ?", (username,))
+    return cursor.fetchone()
+
+
+@timed_query
+def get_user_id(username):
+    """Return the id of the user with this username, or None."""
+    cursor = get_connection().cursor()
+    cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def set_password_hash(user_id, password_hash):
+    """Replace a user's stored password hash."""
+    conn = get_connection()
+    conn.execute("UPDATE users SET password = ? WHERE id = ?", (password_hash, user_id))
     conn.commit()
-    conn.close()
@@ -0,0 +1,327 @@
+"""Run the eval sets in this folder against the AI functions.
+
+category_eval.json goes through ai_service.get_category_from_ai() and
+insights_eval.json through ai_service.request_insights(). All cases from
+both files run concurrently on a worker pool.
+
+Model responses are cached on disk by a hash of the full request (model,
+messages and prompt text), so a re-run with unchanged prompts makes no
+model calls. Change a prompt and only the affected requests are sent again.
+
+Reports pass/fail, latency, tokens and cost per case, then accuracy,
+p50/p95 latency, token totals and cost per eval set, and the rendered
+size of each prompt template.
+
+Usage:
+    python evals/run_evals.py                 # real OpenAI client
+    python evals/run_evals.py --fake          # offline, ai_stub.StubClient
+    python evals/run_evals.py --client mymodule:make_client
+"""
+import argparse
+import hashlib
+import importlib
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+EVALS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(EVALS_DIR)
+sys.path.append(ROOT)
+
+CATEGORY_EVAL = os.path.join(EVALS_DIR, "category_eval.json")
+INSIGHTS_EVAL = os.path.join(EVALS_DIR, "insights_eval.json")
+CACHE_PATH = os.path.join(EVALS_DIR, ".cache", "responses.json")
+
+WORKERS = 8
+
+# USD per 1M tokens (input, output)
+PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+
+class CachingClient:
+    """Wraps a model client: answers repeat requests from a JSON file and
+    records token usage for the calls made on each thread.
+
+    With path=None nothing is read from or written to disk.
+    """
+
+    def __init__(self, client, path=CACHE_PATH):
+        self.client = client
+        self.path = path
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._dirty = False
+        self._responses = {}
+        if path is not None:
+            try:
+                with open(path, "r") as f:
+                    self._responses = json.load(f)
+            except (OSError, ValueError):
+                pass
+
+    def _create(self, model, messages, **kwargs):
+        request = json.dumps({"model": model, "messages": messages, **kwargs}, sort_keys=True)
+        key = hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+        with self._lock:
+            cached = self._responses.get(key)
+
+        if cached is None:
+            completion = self.client.chat.completions.create(model=model, messages=messages, **kwargs)
+            usage = getattr(completion, "usage", None)
+            cached = {
+                "model": model,
+                "content": completion.choices[0].message.content,
+                "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+                "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+            }
+            with self._lock:
+                self._responses[key] = cached
+                self._dirty = True
+            self._record(cached, hit=False)
+        else:
+            self._record(cached, hit=True)
+
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=cached["content"]))],
+            usage=SimpleNamespace(
+                prompt_tokens=cached["prompt_tokens"],
+                completion_tokens=cached["completion_tokens"],
+                total_tokens=cached["prompt_tokens"] + cached["completion_tokens"],
+            ),
+        )
+
+    def _record(self, response, hit):
+        calls = getattr(self._local, "calls", None)
+        if calls is not None:
+            calls.append((response, hit))
+
+    def start_case(self):
+        self._local.calls = []
+
+    def finish_case(self):
+        calls, self._local.calls = self._local.calls, None
+        return calls
+
+    def save(self):
+        with self._lock:
+            if self.path is None or not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self._responses, f)
+            os.replace(tmp, self.path)
+            self._dirty = False
+
+
+def cost(model, prompt_tokens, completion_tokens):
+    input_price, output_price = PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+# ----------------------------
+# EVAL CASES
+# ----------------------------
+
+def run_category_case(test):
+    import ai_service
+
+    item = test["input"]
+    category = ai_service.get_category_from_ai(
+        item.get("note", ""), item.get("amount", ""), item.get("date", ""), item.get("description", "")
+    )
+    expected = test["expected_category"]
+    return category == expected, f"got {category}, expected {expected}"
+
+
+def run_insights_case(test):
+    import ai_service
+    from analysis import summarise_transactions
+
+    expected = test["expected"]
+    result = ai_service.request_insights(summarise_transactions(test["input_transactions"]))
+
+    failures = []
+    top = result.get("top_categories") or []
+    missing = [c for c in expected.get("top_categories_include", []) if c not in top]
+    if missing:
+        failures.append(f"top_categories missing {missing}")
+
+    if "highest_transaction_amount" in expected:
+        amount = (result.get("highest_transaction") or {}).get("amount")
+        try:
+            matches = abs(float(amount) - expected["highest_transaction_amount"]) < 0.01
+        except (TypeError, ValueError):
+            matches = False
+        if not matches:
+            failures.append(f"highest amount {amount!r}, expected {expected['highest_transaction_amount']}")
+
+    word = expected.get("summary_should_mention")
+    if word and word.lower() not in (result.get("summary") or "").lower():
+        failures.append(f"summary does not mention {word!r}")
+
+    return not failures, "; ".join(failures)
+
+
+SUITES = [
+    ("category", CATEGORY_EVAL, run_category_case),
+    ("insights", INSIGHTS_EVAL, run_insights_case),
+]
+
+
+def run_case(client, suite, test, run):
+    client.start_case()
+    started = time.perf_counter()
+    try:
+        passed, detail = run(test)
+    except Exception as e:
+        passed, detail = False, f"error: {e}"
+    latency = time.perf_counter() - started
+    calls = client.finish_case()
+
+    prompt_tokens = sum(r["prompt_tokens"] for r, _ in calls)
+    completion_tokens = sum(r["completion_tokens"] for r, _ in calls)
+    costs = [(cost(r["model"], r["prompt_tokens"], r["completion_tokens"]), hit) for r, hit in calls]
+    return {
+        "suite": suite,
+        "id": test.get("id"),
+        "passed": passed,
+        "detail": "" if passed else detail,
+        "latency": latency,
+        "model_calls": len(calls),
+        "cached_calls": sum(1 for _, hit in calls if hit),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost": sum(c for c, _ in costs),
+        "spent": sum(c for c, hit in costs if not hit),  # excludes cached responses
+    }
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    index = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarise(results):
+    latencies = [r["latency"] for r in results]
+    return {
+        "cases": len(results),
+        "passed": sum(r["passed"] for r in results),
+        "accuracy": sum(r["passed"] for r in results) / len(results) if results else None,
+        "p50_ms": percentile(latencies, 50) * 1000 if results else None,
+        "p95_ms": percentile(latencies, 95) * 1000 if results else None,
+        "prompt_tokens": sum(r["prompt_tokens"] for r in results),
+        "completion_tokens": sum(r["completion_tokens"] for r in results),
+        "cost": sum(r["cost"] for r in results),
+        "spent": sum(r["spent"] for r in results),
+    }
+
+
+def print_report(results, summaries):
+    print(f"{'suite':9} {'id':>4}  {'result':6} {'ms':>8} {'calls':>5} {'cached':>6} "
+          f"{'in tok':>7} {'out tok':>7} {'cost $':>9}")
+    for r in results:
+        print(f"{r['suite']:9} {r['id']!s:>4}  {'pass' if r['passed'] else 'FAIL':6} "
+              f"{r['latency'] * 1000:8.1f} {r['model_calls']:5} {r['cached_calls']:6} "
+              f"{r['prompt_tokens']:7} {r['completion_tokens']:7} {r['cost']:9.6f}"
+              + (f"  {r['detail']}" if r["detail"] else ""))
+
+    print()
+    for suite, s in summaries.items():
+        if not s["cases"]:
+            continue
+        print(f"{suite}: {s['passed']}/{s['cases']} passed ({s['accuracy']:.0%}), "
+              f"p50 {s['p50_ms']:.1f} ms, p95 {s['p95_ms']:.1f} ms, "
+              f"tokens {s['prompt_tokens']} in / {s['completion_tokens']} out, "
+              f"cost ${s['cost']:.6f} (${s['spent']:.6f} not cached)")
+
+
+def load_client(spec):
+    """'module:factory' -> factory(), e.g. 'ai_stub:StubClient'."""
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr or "client")()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the WAIST eval sets.")
+    parser.add_argument("--fake", action="store_true",
+                        help="use the offline ai_stub.StubClient instead of OpenAI")
+    parser.add_argument("--client", help="model client factory as module:callable")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--suite", choices=[name for name, _, _ in SUITES], action="append",
+                        help="run only this eval set (repeatable)")
+    parser.add_argument("--no-cache", action="store_true", help="ignore and do not update the response cache")
+    parser.add_argument("--model-only", action="store_true",
+                        help="skip the local category classifier so every case reaches the model")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    import db
+    import ai_service
+    import analysis  # noqa: F401  imported up front so the first case is not timed with it
+    import local_classifier
+    import prompt_registry
+
+    # A throwaway database so the category cache starts empty each run
+    db.configure(db_name=os.path.join(tempfile.mkdtemp(), "evals.db"))
+    db.migrate()
+
+    if args.client:
+        inner = load_client(args.client)
+    elif args.fake:
+        inner = load_client("ai_stub:StubClient")
+    else:
+        inner = ai_service.get_client()
+    client = CachingClient(inner, path=None if args.no_cache else CACHE_PATH)
+    ai_service.set_client(client)
+    local_classifier.ENABLED = not args.model_only
+
+    jobs = []
+    for suite, path, run in SUITES:
+        if args.suite and suite not in args.suite:
+            continue
+        with open(path, "r") as f:
+            for test in json.load(f)["tests"]:
+                jobs.append((suite, test, run))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(lambda job: run_case(client, *job), jobs))
+    elapsed = time.perf_counter() - started
+
+    client.save()
+
+    summaries = {
+        suite: summarise([r for r in results if r["suite"] == suite])
+        for suite, _, _ in SUITES
+    }
+    print_report(results, summaries)
+    print(f"\n{len(results)} cases in {elapsed:.2f} s")
+
+    prompts = prompt_registry.prompt_stats()
+    for name, s in prompts.items():
+        print(f"{name}: {s['renders']} renders, mean {s['mean_chars']:.0f} chars, "
+              f"~{s['mean_tokens']:.0f} tokens (max ~{s['max_tokens']})")
+
+    if args.json:
+        with open(os.path.join(ROOT, args.json) if not os.path.isabs(args.json) else args.json, "w") as f:
+            json.dump({"results": results, "summary": summaries, "prompts": prompts}, f, indent=2)
+
+    db.close_all_connections()
+    return 0 if all(r["passed"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+import csv
+import io
+import zlib
+
+EXPORT_HEADER = ["ID", "Date", "Amount", "Category", "Note"]
+
+# Rows written to the buffer before it is flushed out as one chunk
+CHUNK_ROWS = 500
+
+
+def iter_csv(rows, header=EXPORT_HEADER, chunk_rows=CHUNK_ROWS):
+    """Turn an iterable of rows into CSV text chunks.
+
+    The header is yielded straight away, before any rows are read, so a
+    streamed response can start immediately. Only one chunk of rows is
+    ever held in memory.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(header)
+    yield _drain(buffer)
+
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_rows:
+            yield _drain(buffer)
+            pending = 0
+
+    if pending:
+        yield _drain(buffer)
+
+
+def iter_gzip(chunks, level=6):
+    """Gzip-compress a stream of text chunks, yielding bytes as they are ready."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = gzip container
+
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+
+    yield compressor.flush()
+
+
+def _drain(buffer):
+    text = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate(0)
+    return text
@@ -0,0 +1,220 @@
+"""Bulk import of bank statement CSVs.
+
+Expected columns (any order, case-insensitive): ID, Date, Category, Amount,
+Notes. ID is optional; "Note" and "Description" are accepted for Notes.
+
+Usage: python importer.py statement.csv --user USERNAME [--source NAME] [--batch-size N] [--rebuild-indexes]
+"""
+import argparse
+import csv
+import hashlib
+import io
+import os
+import sys
+import time
+from collections import Counter
+from functools import lru_cache
+from itertools import islice
+from typing import NamedTuple
+
+from app import validate_date, validate_amount
+from db import import_transactions, get_user_id, migrate
+
+BATCH_SIZE = 50_000
+
+# Keep at most this many rejected-row messages; the rest are only counted
+MAX_ERRORS = 50
+
+COLUMN_ALIASES = {
+    "id": "id",
+    "date": "date",
+    "category": "category",
+    "amount": "amount",
+    "note": "note",
+    "notes": "note",
+    "description": "note",
+}
+
+
+class ImportResult(NamedTuple):
+    read: int
+    written: int  # inserted or updated; unchanged duplicates are not counted
+    rejected: int
+    errors: list  # ["line 12: invalid date '2025-13-01'", ...]
+    seconds: float
+
+
+# Statements repeat the same dates thousands of times, so only parse each once
+_valid_date = lru_cache(maxsize=4096)(validate_date)
+
+
+def make_import_id(source, line_id, date, amount, note, occurrence=1):
+    """Natural key for a statement line.
+
+    Uses the statement's own ID when there is one. Otherwise falls back to
+    a hash of date/amount/note and occurrence, the line's count among
+    identical lines earlier in the same file, so two coffees for the same
+    price on the same day stay two rows. The first occurrence hashes as
+    it always has, keeping ids from earlier imports.
+    """
+    if line_id:
+        return f"{source}:{line_id}"
+    text = f"{date}|{amount}|{note}"
+    if occurrence > 1:
+        text += f"|{occurrence}"
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    return f"{source}:{digest}"
+
+
+def parse_statement(fileobj, source, errors):
+    """Yield validated (import_id, date, category, amount, note) tuples.
+
+    Invalid lines are skipped. Each one is appended to errors as
+    (line_number, message).
+    """
+    reader = csv.reader(fileobj)
+    header = next(reader, None)
+    if header is None:
+        return
+
+    columns = {}
+    for index, name in enumerate(header):
+        key = COLUMN_ALIASES.get(name.strip().lower())
+        if key and key not in columns:
+            columns[key] = index
+
+    missing = {"date", "category", "amount"} - columns.keys()
+    if missing:
+        raise ValueError(f"CSV is missing required column(s): {', '.join(sorted(missing))}")
+
+    id_col = columns.get("id")
+    date_col = columns["date"]
+    category_col = columns["category"]
+    amount_col = columns["amount"]
+    note_col = columns.get("note")
+    width = max(columns.values()) + 1
+    seen = Counter()  # (date, amount, note) -> lines so far without an ID
+
+    for line_number, row in enumerate(reader, start=2):
+        if not row:
+            continue
+        if len(row) < width:
+            errors.append((line_number, "too few columns"))
+            continue
+
+        date = row[date_col].strip()
+        category = row[category_col].strip()
+        amount_str = row[amount_col].strip()
+        note = row[note_col].strip() if note_col is not None else ""
+
+        if not _valid_date(date):
+            errors.append((line_number, f"invalid date {date!r}"))
+            continue
+        if not validate_amount(amount_str):
+            errors.append((line_number, f"invalid amount {amount_str!r}"))
+            continue
+        if not category:
+            errors.append((line_number, "empty category"))
+            continue
+
+        amount = float(amount_str)
+        line_id = row[id_col].strip() if id_col is not None else ""
+        occurrence = 1
+        if not line_id:
+            seen[date, amount, note] += 1
+            occurrence = seen[date, amount, note]
+
+        yield make_import_id(source, line_id, date, amount, note, occurrence), date, category, amount, note
+
+
+def import_csv(user_id, fileobj, source, batch_size=BATCH_SIZE, rebuild_indexes=False):
+    """Stream a statement CSV into a user's transactions.
+
+    Rows are parsed lazily and written in batches of batch_size, one
+    executemany and one transaction per batch, so memory stays bounded.
+
+    With rebuild_indexes=True the whole file is loaded in one transaction
+    with the secondary indexes rebuilt at the end (see
+    db.import_transactions). Use it for backfills that are large compared
+    to the existing table.
+    """
+    started = time.perf_counter()
+    errors = []
+    read = 0
+    written = 0
+
+    rows = parse_statement(fileobj, source, errors)
+
+    if rebuild_indexes:
+        counter = Counter()
+        written = import_transactions(user_id, _counted(rows, counter), rebuild_indexes=True)
+        read = counter["rows"]
+    else:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            read += len(batch)
+            written += import_transactions(user_id, batch)
+
+    read += len(errors)
+    messages = [f"line {line}: {message}" for line, message in errors[:MAX_ERRORS]]
+
+    return ImportResult(
+        read=read,
+        written=written,
+        rejected=len(errors),
+        errors=messages,
+        seconds=time.perf_counter() - started,
+    )
+
+
+def _counted(rows, counter):
+    for row in rows:
+        counter["rows"] += 1
+        yield row
+
+
+def import_file(user_id, path, source=None, batch_size=BATCH_SIZE, rebuild_indexes=False):
+    """Import a statement CSV from disk. source defaults to the file name."""
+    source = source or os.path.basename(path)
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return import_csv(user_id, f, source, batch_size, rebuild_indexes)
+
+
+def import_upload(user_id, stream, source, batch_size=BATCH_SIZE):
+    """Import from a binary stream, e.g. a Flask upload (request.files[...].stream)."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    return import_csv(user_id, text, source, batch_size)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import a bank statement CSV into WAIST.")
+    parser.add_argument("path", help="CSV file with ID,Date,Category,Amount,Notes columns")
+    parser.add_argument("--user", required=True, help="username that owns the imported transactions")
+    parser.add_argument("--source", help="name used to de-duplicate lines (default: file name)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--rebuild-indexes", action="store_true",
+                        help="load in one transaction and rebuild indexes at the end "
+                             "(faster for large backfills)")
+    args = parser.parse_args(argv)
+
+    migrate()
+    user_id = get_user_id(args.user)
+    if user_id is None:
+        print(f"No such user: {args.user}")
+        return 2
+    result = import_file(user_id, args.path, args.source, args.batch_size, args.rebuild_indexes)
+
+    rate = result.read / result.seconds if result.seconds else 0
+    print(f"Read {result.read:,} rows in {result.seconds:.2f}s ({rate:,.0f} rows/s)")
+    print(f"Written (new or changed): {result.written:,}")
+    print(f"Rejected: {result.rejected:,}")
+    for message in result.errors:
+        print("  " + message)
+
+    return 0 if result.rejected == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
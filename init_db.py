@@ -1,20 +1,48 @@
-import sqlite3
-
-conn = sqlite3.connect("waist_app.db")
-cursor = conn.cursor()
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS transactions (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    date TEXT NOT NULL,
-    category TEXT NOT NULL,
-    amount REAL NOT NULL,
-    note TEXT
-)
-""")
-
-conn.commit()
-conn.close()
-
-print("transactions table created successfully!")
-print("First expense added successfully!")
\ No newline at end of file
+"""Create or upgrade the database, plus maintenance commands.
+
+Usage:
+    python init_db.py                    # apply pending migrations
+    python init_db.py --verify-rollups   # check rollup tables against transactions
+    python init_db.py --rebuild-rollups  # recompute rollup tables from transactions
+"""
+import argparse
+import sys
+
+from db import migrate, close_all_connections, rebuild_rollups, verify_rollups
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create, upgrade or maintain the WAIST database.")
+    parser.add_argument("--verify-rollups", action="store_true",
+                        help="compare daily/monthly rollups with the transactions table")
+    parser.add_argument("--rebuild-rollups", action="store_true",
+                        help="recompute daily/monthly rollups from the transactions table")
+    args = parser.parse_args(argv)
+
+    version = migrate()
+    print(f"Database schema is up to date (version {version}).")
+
+    status = 0
+
+    if args.rebuild_rollups:
+        rebuild_rollups()
+        print("Rollups rebuilt.")
+
+    if args.verify_rollups:
+        mismatches = verify_rollups()
+        if mismatches:
+            status = 1
+            print(f"❌ {len(mismatches)} rollup row(s) out of date:")
+            for table, user_id, period, category, expected, found in mismatches[:50]:
+                print(f"  {table} user {user_id} {period} {category}: "
+                      f"expected {expected}, found {found}")
+            print("Run with --rebuild-rollups to fix.")
+        else:
+            print("✅ Rollups match transactions.")
+
+    close_all_connections()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""Background jobs backed by the jobs table.
+
+Work is run on a small in-process thread pool, which also caps how many
+model calls run at once. Job state and results live in SQLite, so any
+worker process can serve a finished result.
+
+A job is identified by (kind, key). The key should encode everything the
+result depends on, e.g. the data version for insights. A change in the
+data then gives a new key, and the old cached result is never served again.
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db import (
+    create_job,
+    get_job as _get_job_row,
+    find_job,
+    update_job,
+    delete_finished_jobs,
+    get_data_version,
+    release_connection,
+)
+
+MAX_WORKERS = 2
+
+# A pending/running job not updated for this long is assumed lost
+# (e.g. the process that owned it restarted) and is submitted again.
+STALE_AFTER_SECONDS = 300
+
+# A failed job is returned as is for this long before (kind, key) is tried
+# again, so a failing model is not called on every page load
+RETRY_FAILED_AFTER_SECONDS = 60
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="waist-job")
+_handlers = {}
+
+
+class Job:
+    __slots__ = ("id", "kind", "key", "status", "result", "error")
+
+    def __init__(self, row):
+        self.id, self.kind, self.key, self.status, result, self.error = row[:6]
+        self.result = json.loads(result) if result is not None else None
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+
+def register(kind, handler):
+    """handler(key) -> JSON-serialisable result. Exceptions mark the job failed."""
+    _handlers[kind] = handler
+
+
+def submit(kind, key, key_prefix=""):
+    """Return the job for (kind, key), starting it if needed.
+
+    A finished result is returned as is, a failure only until
+    RETRY_FAILED_AFTER_SECONDS have passed. A pending or running job is
+    shared, not duplicated. When a job finishes, every other finished job
+    of the same kind under key_prefix is deleted.
+    """
+    row = find_job(kind, key, ("done", "failed"))
+    if row is not None and (row[3] == "done" or row[7] > time.time() - RETRY_FAILED_AFTER_SECONDS):
+        return Job(row)
+
+    row = find_job(kind, key, ("pending", "running"))
+    if row is not None and row[7] > time.time() - STALE_AFTER_SECONDS:
+        return Job(row)
+
+    job_id = create_job(kind, key, time.time())
+    _executor.submit(_run, job_id, kind, key, key_prefix)
+    return Job(_get_job_row(job_id))
+
+
+def get_job(job_id):
+    row = _get_job_row(job_id)
+    return Job(row) if row is not None else None
+
+
+def _run(job_id, kind, key, key_prefix):
+    try:
+        try:
+            update_job(job_id, "running", time.time())
+            result = _handlers[kind](key)
+            update_job(job_id, "done", time.time(), result=json.dumps(result))
+        except Exception as e:
+            print(f"Job {job_id} ({kind}) failed:", e)
+            update_job(job_id, "failed", time.time(), error=str(e))
+        # Keep only this outcome: older results and earlier failures go
+        delete_finished_jobs(kind, key_prefix, job_id)
+    finally:
+        release_connection()
+
+
+# ----------------------------
+# JOB HANDLERS
+# ----------------------------
+
+def _insights_job(key):
+    from ai_service import request_insights
+    from analysis import get_insights_summary
+
+    user_id = int(key.split(":", 1)[0])
+    summary = get_insights_summary(user_id)
+    # The version only moves forward, so if it still matches the key the
+    # summary was built from exactly the data the key names
+    if insights_key(user_id) != key:
+        raise RuntimeError("transactions changed since the job was submitted")
+    return request_insights(summary)
+
+
+register("insights", _insights_job)
+
+
+def insights_key(user_id):
+    """Key for the user's current data: changes on every add, edit or delete.
+
+    Submit with key_prefix=f"{user_id}:" so only this user's old results
+    are cleaned up.
+    """
+    version = get_data_version(user_id)
+    return f"{user_id}:{version.max_id}:{version.rewrites}"
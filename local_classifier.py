@@ -0,0 +1,304 @@
+"""Offline category classifier, tried before the model.
+
+Two tiers:
+
+1. A multinomial naive Bayes model over hashed word and character
+   n-grams, trained on the user's own categorised transactions. It
+   answers only when its posterior is at least CONFIDENCE. It goes
+   first because it knows how this user files ambiguous words
+   ("shell", "target", "rent").
+2. A rules index of well-known merchants and keywords ("uber",
+   "woolworths", "netflix"). A note whose matching rules all agree on
+   one category is answered.
+
+Anything else returns None and goes to the model. Each user's naive Bayes
+counts fold forward from an id watermark (see user_state.py), so new
+transactions are learned without retraining from scratch.
+
+Usage: python local_classifier.py [--eval evals/category_eval.json] [--user USERNAME]
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+import zlib
+from typing import NamedTuple
+
+from category_cache import normalise_text
+from db import get_transactions_after, get_user_id
+from user_state import UserStates
+
+# Set to False to send every note to the model
+ENABLED = True
+
+# Naive Bayes answers only above this posterior probability
+CONFIDENCE = 0.9
+
+# ...and only once the user has this many categorised transactions
+MIN_TRAINING = 20
+
+# ...and only when this share of the note's features was seen in training.
+# Naive Bayes is confidently wrong about text it has never seen.
+MIN_KNOWN_FEATURES = 0.6
+
+HASH_BUCKETS = 2 ** 18
+SMOOTHING = 0.5
+
+# Never learned or predicted: it is the "don't know" answer
+FALLBACK_CATEGORY = "Miscellaneous"
+
+EVAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "evals", "category_eval.json")
+
+# Case-folded, letters only (see category_cache.normalise_text). Two-word
+# entries match adjacent words.
+RULES = {
+    "Food": ["pizza", "domino", "dominos", "mcdonald", "mcdonalds", "maccas", "kfc",
+             "hungry jacks", "subway", "cafe", "coffee", "starbucks", "lunch", "dinner",
+             "breakfast", "restaurant", "takeaway", "uber eats", "ubereats", "menulog",
+             "deliveroo", "doordash", "sushi", "burger", "bakery", "snack"],
+    "Groceries": ["coles", "woolworths", "woolies", "aldi", "iga", "costco", "grocery",
+                  "groceries", "supermarket", "harris farm", "foodworks"],
+    "Transport": ["uber", "didi", "taxi", "train", "bus", "tram", "ferry", "opal",
+                  "myki", "petrol", "fuel", "shell", "bp", "caltex", "ampol", "parking",
+                  "toll", "linkt", "etoll"],
+    "Shopping": ["ikea", "kmart", "target", "big w", "amazon", "ebay", "jb hi", "harvey norman",
+                 "officeworks", "bunnings", "myer", "david jones", "uniqlo", "zara"],
+    "Health": ["chemist", "pharmacy", "priceline", "doctor", "gp", "dentist", "dental",
+               "medical", "physio", "hospital", "pathology", "optometrist"],
+    "Entertainment": ["netflix", "spotify", "stan", "disney", "binge", "movie", "movies",
+                      "cinema", "hoyts", "event cinemas", "concert", "ticketek", "ticketmaster",
+                      "steam", "playstation", "xbox"],
+    "Bills": ["electricity", "energy", "gas bill", "water bill", "internet", "nbn", "telstra",
+              "optus", "vodafone", "phone bill", "rent", "insurance", "council rates", "agl",
+              "origin energy"],
+    "Education": ["course", "tuition", "udemy", "coursera", "textbook", "school fees",
+                  "university", "tafe"],
+    "Travel": ["flight", "flights", "hotel", "airbnb", "booking com", "qantas", "jetstar",
+               "virgin australia", "expedia", "hostel"],
+    "Gifts": ["gift", "gifts", "present", "flowers", "florist"],
+    "Kids": ["toy", "toys", "daycare", "childcare", "nappies", "babysitter"],
+    "Fitness": ["gym", "yoga", "pilates", "fitness", "anytime fitness", "crossfit"],
+}
+
+_RULE_INDEX = {
+    keyword: category
+    for category, keywords in RULES.items()
+    for keyword in keywords
+}
+
+
+class Prediction(NamedTuple):
+    category: str
+    confidence: float
+    source: str  # "rules" or "model"
+
+
+def _words(note, description=""):
+    return normalise_text(f"{note or ''} {description or ''}").split()
+
+
+def rule_category(words):
+    """The category every matching rule agrees on, or None (no match or a conflict).
+
+    Two-word rules win over their single words, so "uber eats" is Food
+    rather than Food and Transport.
+    """
+    found = set()
+    i = 0
+    while i < len(words):
+        if i + 1 < len(words):
+            category = _RULE_INDEX.get(f"{words[i]} {words[i + 1]}")
+            if category:
+                found.add(category)
+                i += 2
+                continue
+        category = _RULE_INDEX.get(words[i])
+        if category:
+            found.add(category)
+        i += 1
+    return found.pop() if len(found) == 1 else None
+
+
+def features(words):
+    """Hashed word unigrams, bigrams and character trigrams."""
+    grams = list(words)
+    grams += [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"^{word}$"
+        grams += ["#" + padded[i:i + 3] for i in range(len(padded) - 2)]
+    return [zlib.crc32(g.encode("utf-8")) % HASH_BUCKETS for g in grams]
+
+
+class NaiveBayes:
+    """Multinomial naive Bayes over hashed features, trainable one row at a time."""
+
+    def __init__(self):
+        self.last_id = 0
+        self.rewrites = 0
+        self.documents = 0
+        self.class_documents = {}  # category -> number of training notes
+        self.class_features = {}   # category -> total feature count
+        self.feature_counts = {}   # category -> {bucket: count}
+        self.vocabulary = set()    # every bucket seen in training
+
+    def add(self, words, category):
+        counts = self.feature_counts.setdefault(category, {})
+        buckets = features(words)
+        for bucket in buckets:
+            counts[bucket] = counts.get(bucket, 0) + 1
+        self.vocabulary.update(buckets)
+        self.class_features[category] = self.class_features.get(category, 0) + len(buckets)
+        self.class_documents[category] = self.class_documents.get(category, 0) + 1
+        self.documents += 1
+
+    def predict(self, words):
+        """(category, posterior) for the most likely category, or None if
+        untrained or too little of the text was seen in training."""
+        if not self.documents:
+            return None
+        buckets = features(words)
+        known = sum(1 for bucket in buckets if bucket in self.vocabulary)
+        if known < MIN_KNOWN_FEATURES * len(buckets):
+            return None
+
+        scores = {}
+        for category, documents in self.class_documents.items():
+            counts = self.feature_counts[category]
+            denominator = math.log(self.class_features[category] + SMOOTHING * HASH_BUCKETS)
+            score = math.log(documents / self.documents)
+            for bucket in buckets:
+                score += math.log(counts.get(bucket, 0) + SMOOTHING) - denominator
+            scores[category] = score
+
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        total = sum(math.exp(s - top) for s in scores.values())
+        return best, 1 / total
+
+    def fold_from_db(self, user_id, up_to_id):
+        for row in get_transactions_after(user_id, self.last_id, up_to_id):
+            words = _words(row.note)
+            if words and row.category and row.category != FALLBACK_CATEGORY:
+                self.add(words, row.category)
+        self.last_id = up_to_id
+
+
+_models = UserStates(NaiveBayes)
+
+_stats = {"rules": 0, "model": 0, "unsure": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(tier):
+    with _stats_lock:
+        _stats[tier] += 1
+
+
+def get_model(user_id):
+    """The user's naive Bayes model, brought up to date with their transactions."""
+    return _models.get(user_id)
+
+
+def predict(note, description="", user_id=None, model=None):
+    """Return a confident Prediction, or None if the model should be asked.
+
+    Pass model to reuse one NaiveBayes across many calls (e.g. a batch);
+    otherwise the user's model is looked up when user_id is given.
+    """
+    words = _words(note, description)
+    if not ENABLED or not words:
+        return None
+
+    if model is None and user_id is not None:
+        model = get_model(user_id)
+    if model is not None and model.documents >= MIN_TRAINING:
+        guess = model.predict(words)
+        if guess is not None and guess[1] >= CONFIDENCE:
+            _count("model")
+            return Prediction(guess[0], guess[1], "model")
+
+    category = rule_category(words)
+    if category is not None:
+        _count("rules")
+        return Prediction(category, 1.0, "rules")
+
+    _count("unsure")
+    return None
+
+
+def classify(note, description="", user_id=None, model=None):
+    """The category if the local tiers are confident, else None."""
+    prediction = predict(note, description, user_id, model)
+    return prediction.category if prediction is not None else None
+
+
+def stats():
+    """How many predictions each tier answered, and how many went to the model."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def evaluate(path=EVAL_PATH, user_id=None):
+    """Score the local tiers on an eval file of {"tests": [{"input", "expected_category"}]}.
+
+    Returns counts, coverage (share answered locally), accuracy over the
+    answered items, and mean time per prediction in microseconds.
+    """
+    with open(path, "r") as f:
+        tests = json.load(f)["tests"]
+
+    model = get_model(user_id) if user_id is not None else None
+    answered = correct = 0
+    misses = []
+    started = time.perf_counter()
+    for test in tests:
+        item = test["input"]
+        prediction = predict(item.get("note"), item.get("description"), model=model)
+        if prediction is None:
+            continue
+        answered += 1
+        if prediction.category == test["expected_category"]:
+            correct += 1
+        else:
+            misses.append((test["id"], prediction.category, test["expected_category"]))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "tests": len(tests),
+        "answered": answered,
+        "correct": correct,
+        "coverage": answered / len(tests) if tests else 0,
+        "accuracy": correct / answered if answered else None,
+        "microseconds_per_item": elapsed / len(tests) * 1e6 if tests else 0,
+        "misses": misses,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate the local category classifier.")
+    parser.add_argument("--eval", default=EVAL_PATH, help="eval file (default: evals/category_eval.json)")
+    parser.add_argument("--user", help="also use this user's trained naive Bayes model")
+    args = parser.parse_args(argv)
+
+    user_id = None
+    if args.user:
+        user_id = get_user_id(args.user)
+        if user_id is None:
+            print(f"No such user: {args.user}")
+            return 2
+
+    result = evaluate(args.eval, user_id)
+    accuracy = f"{result['accuracy']:.1%}" if result["accuracy"] is not None else "n/a"
+    print(f"Answered locally: {result['answered']}/{result['tests']} ({result['coverage']:.1%})")
+    print(f"Accuracy on answered: {accuracy}")
+    print(f"Time per item: {result['microseconds_per_item']:.1f} µs")
+    for test_id, got, expected in result["misses"]:
+        print(f"  test {test_id}: got {got}, expected {expected}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
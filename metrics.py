@@ -0,0 +1,201 @@
+"""In-process performance metrics in the Prometheus text format.
+
+Three sources feed it:
+
+- the web app: latency of every request by route, method and status
+  (see init_app())
+- db.py: time and row count of every query function (see timed_query())
+- ai_service.py: latency and token usage of every model call
+
+render() returns the text served on /metrics. Metrics live in the
+process, so under a multi-process server each worker reports its own.
+
+A query slower than SLOW_QUERY_SECONDS (WAIST_SLOW_QUERY_MS, default 100)
+is also printed to stderr.
+"""
+import functools
+import os
+import sys
+import threading
+import time
+
+SLOW_QUERY_SECONDS = float(os.getenv("WAIST_SLOW_QUERY_MS", "100")) / 1000
+
+# Histogram buckets (upper bounds, in seconds)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+MODEL_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}  # label values -> count
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=REQUEST_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, hits in zip(self.buckets, series):
+                    cumulative += hits
+                    le = _labels(self.labels + ("le",), labels + (repr(float(bound)),))
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                le = _labels(self.labels + ("le",), labels + ("+Inf",))
+                lines.append(f"{self.name}_bucket{le} {series[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.labels, labels)} {series[-2]}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {series[-1]:.6f}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "waist_http_request_duration_seconds", "Time to build the response (streamed bodies excluded).",
+    ("route", "method", "status"), REQUEST_BUCKETS,
+)
+QUERY_SECONDS = Histogram(
+    "waist_db_query_duration_seconds", "Time spent in a db.py query function.",
+    ("query",), QUERY_BUCKETS,
+)
+QUERY_ROWS = Counter(
+    "waist_db_query_rows_total", "Rows returned by a db.py query function (list results only).",
+    ("query",),
+)
+SLOW_QUERIES = Counter(
+    "waist_db_slow_queries_total", "Queries slower than the slow-query threshold.",
+    ("query",),
+)
+MODEL_SECONDS = Histogram(
+    "waist_model_call_duration_seconds", "Latency of model API calls.",
+    ("call", "outcome"), MODEL_BUCKETS,
+)
+MODEL_TOKENS = Counter(
+    "waist_model_tokens_total", "Tokens reported by the model API.",
+    ("call", "kind"),
+)
+
+
+def render():
+    """Every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ----------------------------
+# DB QUERIES
+# ----------------------------
+
+def timed_query(fn):
+    """Decorator for db.py functions: records their time, rows and slow calls.
+
+    Rows are counted when the function returns a list. Functions returning
+    a cursor or generator are timed up to the point they return, not while
+    the caller iterates over them.
+    """
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            QUERY_SECONDS.observe(elapsed, name)
+            if elapsed >= SLOW_QUERY_SECONDS:
+                SLOW_QUERIES.inc(name)
+                print(f"Slow query: {name} took {elapsed * 1000:.1f} ms", file=sys.stderr)
+        if isinstance(result, list):
+            QUERY_ROWS.inc(name, amount=len(result))
+        return result
+    return wrapper
+
+
+# ----------------------------
+# MODEL CALLS
+# ----------------------------
+
+def observe_model_call(call, seconds, completion=None):
+    """Record one model API call. completion is None when the call failed."""
+    MODEL_SECONDS.observe(seconds, call, "ok" if completion is not None else "error")
+    usage = getattr(completion, "usage", None)
+    if usage is not None:
+        MODEL_TOKENS.inc(call, "prompt", amount=getattr(usage, "prompt_tokens", 0) or 0)
+        MODEL_TOKENS.inc(call, "completion", amount=getattr(usage, "completion_tokens", 0) or 0)
+
+
+# ----------------------------
+# WEB APP
+# ----------------------------
+
+def init_app(app):
+    """Time every request of a Flask app and serve render() on /metrics."""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - started, route, request.method,
+                                    str(response.status_code))
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,136 @@
+"""Prompt templates, loaded and compiled once.
+
+A template is a text file in prompts/ with <name> placeholders. Compiling
+splits it into literal text and field names, so rendering is one join
+with no repeated str.replace passes. It also means text inside a value
+(a note that happens to contain "<amount>") is never substituted again.
+Placeholders not listed as fields, like "<CategoryName>" in an output
+example, are left as they are.
+
+Paths are resolved against the prompts/ folder next to this file, not
+the current directory. With RELOAD on (WAIST_PROMPT_RELOAD=1), a template
+is re-read when its file changes, which is handy while editing prompts.
+
+Every render is counted, so prompt_stats() shows how large each prompt
+actually is when sent. Token counts are estimated locally with
+estimate_tokens(); no tokenizer or API call is needed.
+"""
+import hashlib
+import os
+import re
+import threading
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+
+# Check file modification times on every get_prompt() call
+RELOAD = os.getenv("WAIST_PROMPT_RELOAD") == "1"
+
+# Roughly how BPE tokenizers split prompt text: a word, up to three
+# digits, or a single symbol per token. Close enough to budget with.
+_TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text):
+    """Approximate model token count of text. Tends to overestimate slightly."""
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+class Prompt:
+    """One compiled template. Read-only once built; a reload builds a new one."""
+
+    def __init__(self, name, text, fields, mtime):
+        self.name = name
+        self.text = text
+        self.fields = tuple(fields)
+        self.mtime = mtime
+        # Short hash of the template, so cached answers expire when it changes
+        self.version = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+        pattern = "<(" + "|".join(re.escape(f) for f in self.fields) + ")>"
+        # Even positions are literal text, odd positions are field names
+        self._parts = re.split(pattern, text) if self.fields else [text]
+        # Estimated tokens of the template itself, without any field values
+        self.base_tokens = estimate_tokens("".join(self._parts[0::2]))
+
+    def render(self, **values):
+        """The template with every field replaced by str(value); None renders as ""."""
+        parts = self._parts[:]
+        for i in range(1, len(parts), 2):
+            value = values[parts[i]]
+            parts[i] = "" if value is None else str(value)
+        prompt = "".join(parts)
+        _record(self.name, len(prompt), estimate_tokens(prompt))
+        return prompt
+
+    def section(self, heading):
+        """Non-blank lines under a "## HEADING" line, up to the next heading."""
+        lines = []
+        in_section = False
+        for line in self.text.splitlines():
+            if line.startswith("## "):
+                in_section = line.startswith(f"## {heading}")
+            elif in_section and line.strip():
+                lines.append(line.strip())
+        return lines
+
+
+_fields = {}   # name -> placeholders to substitute
+_prompts = {}  # name -> Prompt
+_stats = {}    # name -> {"renders", "chars", "tokens", "max_tokens", "last_tokens"}
+_lock = threading.Lock()
+
+
+def register(name, fields):
+    """Declare prompts/<name> and the placeholders it fills. Returns name."""
+    _fields[name] = tuple(fields)
+    return name
+
+
+def _load(name):
+    path = os.path.join(PROMPTS_DIR, name)
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    return Prompt(name, text, _fields.get(name, ()), os.path.getmtime(path))
+
+
+def get_prompt(name):
+    """The compiled Prompt for prompts/<name>, loaded on first use."""
+    prompt = _prompts.get(name)
+    if prompt is not None and not RELOAD:
+        return prompt
+
+    with _lock:
+        prompt = _prompts.get(name)
+        if prompt is None or os.path.getmtime(os.path.join(PROMPTS_DIR, name)) != prompt.mtime:
+            prompt = _prompts[name] = _load(name)
+        return prompt
+
+
+def _record(name, chars, tokens):
+    with _lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = {"renders": 0, "chars": 0, "tokens": 0, "max_tokens": 0, "last_tokens": 0}
+        stats["renders"] += 1
+        stats["chars"] += chars
+        stats["tokens"] += tokens
+        stats["max_tokens"] = max(stats["max_tokens"], tokens)
+        stats["last_tokens"] = tokens
+
+
+def prompt_stats():
+    """Per prompt: renders, mean characters, and mean/max/last estimated tokens."""
+    with _lock:
+        return {
+            name: {
+                **s,
+                "mean_chars": s["chars"] / s["renders"],
+                "mean_tokens": s["tokens"] / s["renders"],
+            }
+            for name, s in _stats.items()
+        }
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+import db
+import user_state
+
+
+@pytest.fixture
+def database(tmp_path):
+    """A fresh, fully migrated database file for one test."""
+    db.configure(db_name=str(tmp_path / "test.db"))
+    db.migrate()
+    user_state.clear_all()
+    yield db.DB_NAME
+    db.close_all_connections()
+
+
+@pytest.fixture
+def user_id(database):
+    return db.insert_user("alice", "hash")
+
+
+def schema_objects():
+    """Names of the indexes and triggers on transactions."""
+    return {name for (name,) in db.get_connection().execute("""
+        SELECT name FROM sqlite_master
+        WHERE tbl_name = 'transactions' AND type IN ('index', 'trigger') AND sql IS NOT NULL
+    """)}
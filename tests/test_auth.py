@@ -0,0 +1,34 @@
+import pytest
+
+import auth
+import db
+
+
+@pytest.fixture
+def plain_scrypt(monkeypatch):
+    """HASH_METHOD given without parameters, as WAIST_PASSWORD_HASH=scrypt would."""
+    monkeypatch.setattr(auth, "HASH_METHOD", "scrypt")
+    monkeypatch.setattr(auth, "_HASH_PREFIX", auth._method_prefix("scrypt"))
+
+
+def test_fresh_hash_from_unparameterised_method_is_current(plain_scrypt):
+    hashed = auth.hash_password("secret")
+
+    assert hashed.startswith("scrypt:32768:8:1$")
+    assert not auth.needs_rehash(hashed)
+
+
+def test_login_does_not_rewrite_a_current_hash(plain_scrypt, database, monkeypatch):
+    user_id = auth.create_user("alice", "secret")
+    writes = []
+    monkeypatch.setattr(db, "set_password_hash", lambda *args: writes.append(args))
+
+    assert auth.verify_user("alice", "secret") == user_id
+    assert writes == []
+
+
+def test_login_upgrades_an_old_hash(database):
+    user_id = db.insert_user("bob", auth.generate_password_hash("secret", method="pbkdf2:sha256:1000"))
+
+    assert auth.verify_user("bob", "secret") == user_id
+    assert not auth.needs_rehash(db.get_user_credentials("bob")[1])
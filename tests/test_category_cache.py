@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+import ai_service
+from ai_stub import StubClient
+from category_cache import make_key, normalise_text
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("  Uber Ride #4821 ", "uber ride"),
+    ("Café Crème", "café crème"),
+    ("Café", "café"),          # decomposed accent
+    ("STRASSE straße", "strasse strasse"),
+    ("寿司 #2", "寿司"),
+    ("Такси_12", "такси"),
+    ("#123 / 2024", ""),
+    (None, ""),
+])
+def test_normalise_text(text, expected):
+    assert normalise_text(text) == expected
+
+
+def test_keys_differ_across_scripts():
+    assert make_key("寿司", "", "v1") != make_key("Такси", "", "v1")
+    assert make_key("Uber #1", "", "v1") == make_key("uber 2", "", "v1")
+
+
+def test_no_key_without_letters():
+    assert make_key("", "", "v1") is None
+    assert make_key("#4821", None, "v1") is None
+
+
+@pytest.fixture
+def stub_client(database):
+    ai_service.category_cache.clear()
+    client = StubClient()
+    ai_service.set_client(client)
+    yield client
+    ai_service.set_client(None)
+    ai_service.category_cache.clear()
+
+
+def test_batch_keeps_non_latin_and_textless_notes_apart(stub_client):
+    expenses = [{"note": "寿司"}, {"note": "Такси"}, {"note": "寿司"}, {"note": "#1"}, {"note": "#2"}]
+
+    categories = ai_service.categorise_batch(expenses)
+
+    assert len(categories) == 5
+    # One entry per script; the notes without letters are not cached at all
+    stats = ai_service.category_cache.stats()
+    assert stats["writes"] == 2
+    assert stats["memory_size"] == 2
+
+
+class FixedAnswer(StubClient):
+    """Answers every single categorisation with the same category."""
+
+    def __init__(self, category):
+        super().__init__()
+        self.category = category
+
+    def _create(self, model, messages, **kwargs):
+        completion = super()._create(model, messages, **kwargs)
+        completion.choices[0].message.content = json.dumps({"category": self.category})
+        return completion
+
+
+@pytest.mark.parametrize("answer", ["Food & Drink", "Groceries ", "", None])
+def test_unapproved_answers_are_not_used_or_cached(stub_client, answer):
+    ai_service.set_client(FixedAnswer(answer))
+    writes = ai_service.category_cache.stats()["writes"]
+
+    assert ai_service.get_category_from_ai("寿司", 12.0, "2024-01-01") == "Miscellaneous"
+    assert ai_service.category_cache.stats()["writes"] == writes
+
+
+def test_approved_answer_is_cached(stub_client):
+    ai_service.set_client(FixedAnswer("Food"))
+    writes = ai_service.category_cache.stats()["writes"]
+
+    assert ai_service.get_category_from_ai("寿司", 12.0, "2024-01-01") == "Food"
+    assert ai_service.category_cache.stats()["writes"] == writes + 1
@@ -0,0 +1,59 @@
+from datetime import date
+
+import pytest
+
+import analysis
+import db
+
+
+def _insert_raw(user_id, day, amount=5.0):
+    """Write a row without the date check, like data from before it existed."""
+    conn = db.get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO transactions (user_id, date, category, amount, note) VALUES (?, ?, 'Food', ?, '')",
+            (user_id, day, amount),
+        )
+
+
+@pytest.mark.parametrize("day", ["2024-13-01", "2024-1-5", "20240105", "05/01/2024", "", None])
+def test_writes_reject_bad_dates(user_id, day):
+    with pytest.raises(ValueError):
+        db.add_transaction(user_id, day, "Food", 5.0, "")
+
+    db.add_transaction(user_id, "2024-01-05", "Food", 5.0, "")
+    expense_id = db.get_data_version(user_id).max_id
+    with pytest.raises(ValueError):
+        db.update_expense(user_id, expense_id, 5.0, "Food", "", day)
+    assert db.get_expense_by_id(user_id, expense_id).date == "2024-01-05"
+
+
+def test_analytics_skip_unparseable_dates(user_id):
+    db.add_transaction(user_id, "2024-01-05", "Food", 5.0, "")
+    _insert_raw(user_id, "05/01/2024")
+
+    report = analysis.get_analytics(user_id, today=date(2024, 1, 31))
+
+    assert report["transaction_count"] == 1
+    assert db.get_transaction_columns(user_id) == [(19727, 5.0, "Food")]
+
+
+def test_insights_summary_skips_unparseable_dates(user_id):
+    db.add_transaction(user_id, "2024-01-05", "Food", 5.0, "")
+    _insert_raw(user_id, "2024/01/06", 7.0)
+
+    summary = analysis.get_insights_summary(user_id, today=date(2024, 1, 31))
+
+    assert summary["monthly_totals"] == {"2024-01": 5.0}
+    assert summary["first_date"] == summary["last_date"] == "2024-01-05"
+    assert summary["transaction_count"] == 2
+
+
+def test_summarise_transactions_skips_unparseable_dates():
+    summary = analysis.summarise_transactions([
+        {"date": "2024-01-05", "amount": 5, "category": "Food"},
+        {"date": "5 Jan", "amount": 7, "category": "Food"},
+    ])
+
+    assert summary["as_of"] == "2024-01-05"
+    assert summary["monthly_totals"] == {"2024-01": 5.0}
@@ -0,0 +1,101 @@
+import io
+
+import pytest
+
+import db
+import importer
+from conftest import schema_objects
+
+
+def _failing_rows():
+    yield ("s:1", "2024-01-01", "Food", 5.0, "coles")
+    raise RuntimeError("source went away")
+
+
+def test_failed_import_keeps_indexes_and_triggers(user_id):
+    before = schema_objects()
+
+    with pytest.raises(RuntimeError):
+        db.import_transactions(user_id, _failing_rows(), rebuild_indexes=True)
+
+    assert schema_objects() == before
+    assert db.get_transaction_count(user_id) == 0
+
+
+def test_failed_bulk_insert_keeps_indexes_and_triggers(user_id):
+    before = schema_objects()
+    rows = [(user_id, "2024-01-01", "Food", 5.0, "a"), (user_id, None, "Food", 5.0, "b")]
+
+    with pytest.raises(Exception):
+        db.bulk_insert_transactions(rows)
+
+    assert schema_objects() == before
+    assert db.get_transaction_count(user_id) == 0
+
+
+def test_csv_missing_column_keeps_indexes(user_id):
+    before = schema_objects()
+
+    with pytest.raises(ValueError):
+        importer.import_csv(user_id, io.StringIO("Date,Amount\n2024-01-01,5\n"), "s",
+                            rebuild_indexes=True)
+
+    assert schema_objects() == before
+
+
+def test_rebuilt_import_is_searchable_and_rolled_up(user_id):
+    csv = io.StringIO("ID,Date,Category,Amount,Notes\n1,2024-01-01,Food,5,Coles\n")
+    result = importer.import_csv(user_id, csv, "s", rebuild_indexes=True)
+
+    assert result.written == 1
+    assert [row.note for row in db.search_transactions(user_id, "coles").rows] == ["Coles"]
+    assert db.verify_rollups() == []
+
+
+def _statement(*lines):
+    return io.StringIO("ID,Date,Category,Amount,Notes\n" + "".join(line + "\n" for line in lines))
+
+
+@pytest.mark.parametrize("rebuild_indexes", [False, True])
+def test_reimport_updates_changed_lines_only(user_id, rebuild_indexes):
+    first = importer.import_csv(user_id, _statement("1,2024-01-01,Food,5,Cafe", "2,2024-01-02,Food,7,Deli"),
+                                "bank.csv", rebuild_indexes=rebuild_indexes)
+    again = importer.import_csv(user_id, _statement("1,2024-01-01,Food,5,Cafe", "2,2024-01-02,Food,9,Deli"),
+                                "bank.csv", rebuild_indexes=rebuild_indexes)
+
+    assert (first.written, again.written) == (2, 1)
+    assert [(row.note, row.amount) for row in db.get_all_transactions(user_id)] == [("Deli", 9.0), ("Cafe", 5.0)]
+    assert db.verify_rollups() == []
+
+
+def test_import_ids_are_per_user_and_per_source(user_id):
+    other = db.insert_user("bob", "hash")
+
+    importer.import_csv(user_id, _statement("1,2024-01-01,Food,5,Cafe"), "bank.csv")
+    importer.import_csv(user_id, _statement("1,2024-01-01,Food,5,Cafe"), "card.csv")
+    importer.import_csv(other, _statement("1,2024-01-01,Food,5,Cafe"), "bank.csv")
+
+    assert db.get_transaction_count(user_id) == 2
+    assert db.get_transaction_count(other) == 1
+
+
+def test_invalid_lines_are_rejected_and_reported(user_id):
+    result = importer.import_csv(user_id, _statement(
+        "1,2024-01-01,Food,5,Cafe", "2,2024-13-01,Food,5,Bad date", "3,2024-01-02,Food,abc,Bad amount",
+        "4,2024-01-02,,5,No category"), "bank.csv")
+
+    assert (result.read, result.written, result.rejected) == (4, 1, 3)
+    assert result.errors[0] == "line 3: invalid date '2024-13-01'"
+
+
+@pytest.mark.parametrize("rebuild_indexes", [False, True])
+def test_identical_lines_without_ids_are_kept(user_id, rebuild_indexes):
+    def statement():
+        return io.StringIO("Date,Category,Amount,Notes\n"
+                           "2024-01-01,Food,4.5,Coffee\n2024-01-01,Food,4.5,Coffee\n2024-01-02,Food,4.5,Coffee\n")
+
+    first = importer.import_csv(user_id, statement(), "bank.csv", rebuild_indexes=rebuild_indexes)
+    again = importer.import_csv(user_id, statement(), "bank.csv", rebuild_indexes=rebuild_indexes)
+
+    assert (first.written, again.written) == (3, 0)
+    assert db.get_transaction_count(user_id) == 3
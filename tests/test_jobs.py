@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+import db
+import jobs
+
+
+def _wait(job):
+    deadline = time.time() + 5
+    while not job.finished and time.time() < deadline:
+        time.sleep(0.01)
+        job = jobs.get_job(job.id)
+    return job
+
+
+@pytest.fixture
+def flaky(database):
+    """A job kind that fails on its first call and succeeds after."""
+    calls = []
+
+    def handler(key):
+        calls.append(key)
+        if len(calls) == 1:
+            raise RuntimeError("model unavailable")
+        return {"key": key}
+
+    jobs.register("flaky", handler)
+    yield calls
+    del jobs._handlers["flaky"]
+
+
+def test_failed_job_is_reused_until_retry_is_due(flaky, monkeypatch):
+    failed = _wait(jobs.submit("flaky", "1:a", key_prefix="1:"))
+
+    assert failed.status == "failed"
+    assert jobs.submit("flaky", "1:a", key_prefix="1:").id == failed.id
+    assert len(flaky) == 1
+
+    monkeypatch.setattr(jobs, "RETRY_FAILED_AFTER_SECONDS", 0)
+    done = _wait(jobs.submit("flaky", "1:a", key_prefix="1:"))
+
+    assert (done.status, done.result) == ("done", {"key": "1:a"})
+    assert jobs.get_job(failed.id) is None
+
+
+def test_insights_job_refuses_a_changed_version(user_id):
+    key = jobs.insights_key(user_id)
+    db.add_transaction(user_id, "2024-01-01", "Food", 5.0, "Cafe")
+
+    with pytest.raises(RuntimeError):
+        jobs._insights_job(key)
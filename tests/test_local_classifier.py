@@ -0,0 +1,23 @@
+import local_classifier
+from local_classifier import NaiveBayes
+
+
+def _model(labelled):
+    model = NaiveBayes()
+    for note, category, times in labelled:
+        for _ in range(times):
+            model.add(note.lower().split(), category)
+    return model
+
+
+def test_users_own_filing_wins_over_rules():
+    model = _model([("Target", "Groceries", 20), ("Netflix", "Entertainment", 5)])
+
+    assert local_classifier.predict("Target") == ("Shopping", 1.0, "rules")
+    assert local_classifier.predict("Target", model=model)[::2] == ("Groceries", "model")
+
+
+def test_rules_answer_what_the_model_has_not_seen():
+    model = _model([("Target", "Groceries", 20), ("Netflix", "Entertainment", 5)])
+
+    assert local_classifier.predict("Uber", model=model) == ("Transport", 1.0, "rules")
@@ -0,0 +1,21 @@
+import pytest
+
+import db
+from metrics import QUERY_SECONDS
+
+
+def _calls(name):
+    series = QUERY_SECONDS._series.get((name,))
+    return series[-2] if series else 0
+
+
+@pytest.mark.parametrize("outer, inner", [
+    (db.get_average_daily_spend_this_month, "get_total_spent_this_month"),
+    (db.get_dashboard_snapshot, "get_total_spent_today"),
+])
+def test_nested_queries_are_timed_once(user_id, outer, inner):
+    before = _calls(outer.__name__), _calls(inner)
+
+    outer(user_id)
+
+    assert (_calls(outer.__name__), _calls(inner)) == (before[0] + 1, before[1])
@@ -0,0 +1,73 @@
+import subprocess
+import sys
+
+import db
+from conftest import ROOT, schema_objects
+
+# Each process waits for the file to appear, then migrates at once
+_MIGRATE = """
+import os, sys, time
+sys.path.append({root!r})
+import db
+db.configure(db_name={path!r})
+while not os.path.exists({start!r}):
+    time.sleep(0.001)
+db.migrate()
+"""
+
+
+def _version():
+    return db.get_connection().execute("PRAGMA user_version").fetchone()[0]
+
+
+def test_migrate_is_idempotent(database):
+    objects = schema_objects()
+    assert _version() == len(db.MIGRATIONS)
+
+    assert db.migrate() == len(db.MIGRATIONS)
+    assert _version() == len(db.MIGRATIONS)
+    assert schema_objects() == objects
+
+
+def test_upgrade_keeps_existing_rows(tmp_path, monkeypatch):
+    db.configure(db_name=str(tmp_path / "old.db"))
+    # A database from before per-user data (version 7)
+    with monkeypatch.context() as m:
+        m.setattr(db, "MIGRATIONS", db.MIGRATIONS[:7])
+        db.migrate()
+    conn = db.get_connection()
+    with conn:
+        conn.execute("INSERT INTO users (username, password) VALUES ('alice', 'hash')")
+        conn.execute("""
+            INSERT INTO transactions (date, category, amount, note)
+            VALUES ('2024-01-01', 'Food', 5.0, 'Coles')
+        """)
+
+    try:
+        db.migrate()
+        user_id = db.get_user_id("alice")
+
+        assert _version() == len(db.MIGRATIONS)
+        assert db.get_transaction_count(user_id) == 1
+        assert [row.note for row in db.search_transactions(user_id, "coles").rows] == ["Coles"]
+        assert db.verify_rollups() == []
+    finally:
+        db.close_all_connections()
+
+
+def test_concurrent_migrations(tmp_path):
+    path = str(tmp_path / "race.db")
+    start = str(tmp_path / "start")
+    script = _MIGRATE.format(root=ROOT, path=path, start=start)
+
+    processes = [subprocess.Popen([sys.executable, "-c", script], stderr=subprocess.PIPE)
+                 for _ in range(6)]
+    open(start, "w").close()
+    errors = [p.communicate(timeout=60)[1].decode() for p in processes]
+
+    assert [p.returncode for p in processes] == [0] * 6, errors
+    db.configure(db_name=path)
+    try:
+        assert _version() == len(db.MIGRATIONS)
+    finally:
+        db.close_all_connections()
@@ -0,0 +1,186 @@
+import random
+import re
+import unicodedata
+
+import pytest
+
+import db
+
+NOTES = ["Coles Express", "Coles", "Woolworths Metro", "Uber Eats", "Uber", "Netflix",
+         "Café Crème", "Shell Coles Express", "", None]
+CATEGORIES = ["Food", "Groceries", "Transport", "Entertainment"]
+
+
+@pytest.fixture
+def rows(user_id):
+    """About 300 rows for the user (many sharing a date) and some for another user."""
+    rng = random.Random(1)
+    other = db.insert_user("bob", "hash")
+    generated = [
+        (owner, f"2024-{rng.randint(1, 3):02d}-{rng.randint(1, 28):02d}", rng.choice(CATEGORIES),
+         round(rng.uniform(1, 300), 2), rng.choice(NOTES))
+        for owner in [user_id] * 300 + [other] * 50
+    ]
+    for row in generated:
+        db.add_transaction(*row)
+    return db.get_all_transactions(user_id)
+
+
+def _newest_first(rows):
+    return sorted(rows, key=lambda row: (row.date, row.id), reverse=True)
+
+
+def _walk(fetch_page):
+    """Every row of a paged query, following next_cursor to the end."""
+    found, after = [], None
+    while True:
+        page = fetch_page(after)
+        found.extend(page)
+        if page.next_cursor is None:
+            return found
+        after = page.next_cursor
+
+
+def _matches_text(note, text):
+    # The index ignores accents (remove_diacritics), so 'cafe' finds 'Café'
+    plain = "".join(c for c in unicodedata.normalize("NFKD", note or "") if not unicodedata.combining(c))
+    words = re.findall(r"\w+", plain.lower())
+    return all(any(w.startswith(term) for w in words) for term in re.findall(r"\w+", text.lower()))
+
+
+# ----------------------------
+# KEYSET PAGINATION
+# ----------------------------
+
+def test_pages_cover_every_row_once_in_order(user_id, rows):
+    found = _walk(lambda after: db.get_transactions_page(user_id, 7, after))
+
+    assert found == _newest_first(rows)
+
+
+def test_last_page_has_no_cursor(user_id, rows):
+    page = db.get_transactions_page(user_id, len(rows))
+
+    assert len(list(page)) == len(rows)
+    assert page.next_cursor is None
+
+
+# ----------------------------
+# COMBINED FILTERS
+# ----------------------------
+
+FILTERS = [
+    db.TransactionFilter(),
+    db.TransactionFilter(category="Food"),
+    db.TransactionFilter(start="2024-02-01", end="2024-03-01"),
+    db.TransactionFilter(min_amount=250),
+    db.TransactionFilter(max_amount=20),
+    db.TransactionFilter(min_amount=50, max_amount=60),
+    db.TransactionFilter(category="Groceries", start="2024-01-10", end="2024-02-20", min_amount=100),
+    db.TransactionFilter(text="coles"),
+    db.TransactionFilter(text="col exp"),
+    db.TransactionFilter(text="cafe", max_amount=150),
+    db.TransactionFilter(text="uber", category="Transport", start="2024-02-01"),
+    db.TransactionFilter(text="#!"),  # nothing searchable: no text condition
+]
+
+
+def _expected(rows, f):
+    return _newest_first([
+        row for row in rows
+        if (f.category is None or row.category == f.category)
+        and (f.start is None or row.date >= f.start)
+        and (f.end is None or row.date < f.end)
+        and (f.min_amount is None or row.amount >= f.min_amount)
+        and (f.max_amount is None or row.amount <= f.max_amount)
+        and (f.text is None or _matches_text(row.note, f.text))
+    ])
+
+
+@pytest.mark.parametrize("filters", FILTERS, ids=lambda f: ",".join(f.shape) or "none")
+def test_query_matches_every_condition(user_id, rows, filters):
+    found = _walk(lambda after: db.query_transactions(user_id, filters, 9, after))
+
+    assert found == _expected(rows, filters)
+
+
+def test_selective_amount_range_uses_amount_index(user_id, rows):
+    plan = " ".join(db.explain_transactions(user_id, db.TransactionFilter(min_amount=290)))
+
+    assert "idx_transactions_user_amount" in plan
+
+
+def test_sql_is_built_once_per_shape(user_id, rows):
+    first, _ = db._filter_statement(user_id, db.TransactionFilter(category="Food"), 10, None)
+    second, params = db._filter_statement(user_id, db.TransactionFilter(category="Kids"), 10, None)
+
+    assert first is second
+    assert params == [user_id, "Kids", 11]
+
+
+def test_narrow_combines_conditions():
+    f = db.TransactionFilter(start="2024-01-01", min_amount=10, text="coles")
+
+    narrowed = f.narrow(start="2024-02-01", end="2024-03-01", min_amount=5, text="express")
+
+    assert narrowed == db.TransactionFilter(start="2024-02-01", end="2024-03-01",
+                                            min_amount=10, text="coles express")
+    assert narrowed.shape == ("start", "end", "min_amount", "text")
+    with pytest.raises(ValueError):
+        f.narrow(category="Food").narrow(category="Kids")
+
+
+# ----------------------------
+# ROLLUPS
+# ----------------------------
+
+def _rollup(table, user_id):
+    key = "day" if table == "daily_rollup" else "month"
+    return {
+        (period, category): (round(total, 2), count)
+        for period, category, total, count in db.get_connection().execute(
+            f"SELECT {key}, category, total, count FROM {table} WHERE user_id = ?", (user_id,))
+    }
+
+
+def test_rollups_follow_inserts_updates_and_deletes(user_id, rows):
+    assert db.verify_rollups() == []
+
+    first, second = rows[0], rows[1]
+    db.update_expense(user_id, first.id, 999.0, "Travel", first.note, "2023-12-31")
+    db.delete_expense(user_id, second.id)
+
+    assert db.verify_rollups() == []
+    assert _rollup("monthly_rollup", user_id)[("2023-12", "Travel")] == (999.0, 1)
+    assert _rollup("daily_rollup", user_id)[("2023-12-31", "Travel")] == (999.0, 1)
+
+    db.delete_expense(user_id, first.id)
+
+    assert ("2023-12", "Travel") not in _rollup("monthly_rollup", user_id)
+    assert db.verify_rollups() == []
+
+
+# ----------------------------
+# FULL-TEXT INDEX
+# ----------------------------
+
+def _search(user_id, text):
+    return [row.id for row in db.search_transactions(user_id, text, 100).rows]
+
+
+def test_search_index_follows_writes(user_id):
+    other = db.insert_user("bob", "hash")
+    db.add_transaction(user_id, "2024-01-01", "Groceries", 10.0, "Coles Central")
+    db.add_transaction(other, "2024-01-01", "Groceries", 10.0, "Coles Central")
+    expense_id = db.get_data_version(user_id).max_id
+
+    assert _search(user_id, "coles") == [expense_id]
+    assert _search(user_id, "cen") == [expense_id]
+
+    db.update_expense(user_id, expense_id, 10.0, "Groceries", "Aldi", "2024-01-01")
+    assert _search(user_id, "coles") == []
+    assert _search(user_id, "aldi") == [expense_id]
+
+    db.delete_expense(user_id, expense_id)
+    assert _search(user_id, "aldi") == []
+    assert len(_search(other, "coles")) == 1
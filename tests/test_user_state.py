@@ -0,0 +1,109 @@
+import threading
+
+import analysis
+import anomalies
+import db
+import local_classifier
+from user_state import UserStates
+
+
+class Recorder:
+    """A state that records which id ranges it was asked to read."""
+
+    def __init__(self):
+        self.last_id = 0
+        self.rewrites = 0
+        self.reads = []
+
+    def fold_from_db(self, user_id, up_to_id):
+        self.reads.append((self.last_id, up_to_id))
+        self.last_id = up_to_id
+
+
+def _add(user_id, amount=5.0, note="coles", category="Groceries"):
+    db.add_transaction(user_id, "2024-01-05", category, amount, note)
+    return db.get_data_version(user_id).max_id
+
+
+def test_new_rows_are_folded_in(user_id):
+    states = UserStates(Recorder)
+    first = _add(user_id)
+    state = states.get(user_id)
+    second = _add(user_id)
+
+    assert states.get(user_id) is state
+    assert state.reads == [(0, first), (first, second)]
+
+
+def test_edit_rebuilds(user_id):
+    states = UserStates(Recorder)
+    expense_id = _add(user_id)
+    state = states.get(user_id)
+
+    db.update_expense(user_id, expense_id, 6.0, "Groceries", "coles", "2024-01-05")
+    rebuilt = states.get(user_id)
+
+    assert rebuilt is not state
+    assert rebuilt.reads == [(0, expense_id)]
+
+
+def test_states_are_per_user(user_id):
+    other = db.insert_user("bob", "hash")
+    states = UserStates(Recorder)
+    _add(user_id)
+
+    assert states.get(user_id).last_id == 1
+    assert states.get(other).last_id == 0
+
+
+def test_consumers_see_new_rows(user_id):
+    for _ in range(6):
+        _add(user_id, 10.0, "coffee", "Food")
+    assert anomalies.get_anomalies(user_id) == []
+    assert analysis.get_insights_summary(user_id)["transaction_count"] == 6
+    assert local_classifier.get_model(user_id).documents == 6
+
+    _add(user_id, 500.0, "coffee", "Food")
+
+    assert [a["amount"] for a in anomalies.get_anomalies(user_id)] == [500.0]
+    assert analysis.get_insights_summary(user_id)["transaction_count"] == 7
+    assert local_classifier.get_model(user_id).documents == 7
+
+
+def test_slow_build_does_not_block_other_users():
+    started, release = threading.Event(), threading.Event()
+
+    class Slow(Recorder):
+        def fold_from_db(self, user_id, up_to_id):
+            if user_id == 1:
+                started.set()
+                release.wait(5)
+            super().fold_from_db(user_id, up_to_id)
+
+    states = UserStates(Slow)
+    version = db.DataVersion(max_id=10, rewrites=0)
+    builder = threading.Thread(target=states.get, args=(1, version))
+    builder.start()
+    try:
+        assert started.wait(5)
+        done = threading.Thread(target=states.get, args=(2, version))
+        done.start()
+        done.join(1)
+        assert not done.is_alive()
+    finally:
+        release.set()
+        builder.join()
+    assert states.get(1, version).reads == [(0, 10)]
+
+
+def test_least_recently_used_user_is_dropped():
+    states = UserStates(Recorder, max_users=2)
+    version = db.DataVersion(max_id=3, rewrites=0)
+    first = states.get(1, version)
+    states.get(2, version)
+    states.get(1, version)
+    states.get(3, version)
+
+    assert len(states) == 2
+    assert states.get(1, version) is first   # used more recently than user 2
+    assert states.get(2, version).reads == [(0, 3)]
@@ -0,0 +1,100 @@
+"""Per-user state folded forward from an id watermark.
+
+The insights summary, the analytics frame, anomaly detection and the
+local classifier each keep something per user that is computed from all
+of that user's transactions. Ids only grow (AUTOINCREMENT), so a state
+remembers the highest id it has read and later reads only the rows after
+it. An edit or delete anywhere moves the user's rewrites counter, and the
+state is then rebuilt from scratch.
+"""
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from db import get_data_version
+
+# Users whose state is kept, per kind of state; the least recently used go first
+MAX_USERS = int(os.getenv("WAIST_CACHED_USERS", "256"))
+
+# Every UserStates, for clear_all()
+_instances = weakref.WeakSet()
+
+
+class UserStates:
+    """One state per user, kept current with their transactions.
+
+    factory() returns an empty state. A state has last_id and rewrites
+    attributes (both 0 when new) and a fold_from_db(user_id, up_to_id)
+    method that reads the user's rows with last_id < id <= up_to_id and
+    then sets last_id to up_to_id.
+
+    At most max_users states are kept, least recently used dropped
+    first. The table of users is locked only to look a user up. Building
+    or folding a state holds that user's own lock, so a cold load of one
+    long history does not hold up any other user.
+    """
+
+    def __init__(self, factory, max_users=None):
+        self.factory = factory
+        self.max_users = MAX_USERS if max_users is None else max_users
+        self._slots = OrderedDict()  # user_id -> _Slot, least recently used first
+        self._lock = threading.Lock()
+        _instances.add(self)
+
+    @contextmanager
+    def current(self, user_id, version=None):
+        """Hold the user's state, brought up to date, for a with block.
+
+        No other thread folds rows into it until the block ends. version
+        is the user's db.DataVersion; it is read here if not given.
+        """
+        with self._lock:
+            slot = self._slots.get(user_id)
+            if slot is None:
+                slot = self._slots[user_id] = _Slot()
+                while len(self._slots) > self.max_users:
+                    # A thread still holding the dropped state finishes with it
+                    self._slots.popitem(last=False)
+            else:
+                self._slots.move_to_end(user_id)
+
+        with slot.lock:
+            # Read under the user's lock, so a version read before another
+            # thread's fold cannot look older than the state and force a rebuild
+            if version is None:
+                version = get_data_version(user_id)
+            state = slot.state
+            if state is None or state.rewrites != version.rewrites or state.last_id > version.max_id:
+                state = slot.state = self.factory()
+                state.rewrites = version.rewrites
+            if state.last_id < version.max_id:
+                state.fold_from_db(user_id, version.max_id)
+            yield state
+
+    def get(self, user_id, version=None):
+        """The user's state, brought up to date."""
+        with self.current(user_id, version) as state:
+            return state
+
+    def __len__(self):
+        return len(self._slots)
+
+    def clear(self):
+        with self._lock:
+            self._slots.clear()
+
+
+class _Slot:
+    __slots__ = ("lock", "state")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = None
+
+
+def clear_all():
+    """Drop every cached state, e.g. after switching to another database."""
+    for states in list(_instances):
+        states.clear()
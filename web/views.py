@@ -0,0 +1,384 @@
+"""Routes of the WAIST web app, registered on the app by main.create_app().
+
+Everything a route needs is imported here once, when the blueprint is
+loaded, rather than inside each route. The OpenAI client is still only
+built when insights or a categorisation first need it (see
+ai_service.get_client()).
+"""
+import sqlite3
+
+from flask import (Blueprint, Response, abort, current_app, jsonify, redirect, render_template,
+                   request, session, stream_template, stream_with_context, url_for)
+
+import auth
+import jobs
+from analysis import get_analytics
+from anomalies import MAX_FLAGGED, get_anomalies
+from db import (add_transaction, delete_expense, get_dashboard_snapshot, get_expense_by_id,
+                explain_transactions, iter_transactions_for_export, period_range,
+                query_transactions, search_transactions, update_expense, TransactionFilter)
+from export import iter_csv, iter_gzip
+from importer import import_upload
+
+bp = Blueprint("waist", __name__)
+
+
+def login_required(route_function):
+    """Simple decorator to protect routes that require login.
+
+    Logged-in sessions carry user_id, which scopes every data query.
+    """
+    def wrapper(*args, **kwargs):
+        if "user_id" not in session:
+            return redirect(url_for(".login"))
+        return route_function(*args, **kwargs)
+    wrapper.__name__ = route_function.__name__
+    return wrapper
+
+
+@bp.errorhandler(auth.RateLimited)
+def rate_limited(e):
+    return str(e), 429, {"Retry-After": str(e.retry_after)}
+
+
+# ----------------------------
+# PUBLIC / AUTH ROUTES
+# ----------------------------
+
+@bp.route("/signup", methods=["GET", "POST"])
+def signup():
+    if request.method == "POST":
+        username = request.form["username"]
+        password = request.form["password"]
+
+        try:
+            auth.create_user(username, password)
+            return redirect(url_for(".login"))
+        except sqlite3.IntegrityError:
+            return "Username already exists"
+
+    return render_template("signup.html")
+
+
+@bp.route("/login", methods=["GET", "POST"])
+def login():
+    if request.method == "POST":
+        username = request.form["username"]
+        password = request.form["password"]
+
+        user_id = auth.verify_user(username, password, ip=request.remote_addr)
+        if user_id is not None:
+            session["username"] = username
+            session["user_id"] = user_id
+            return redirect(url_for(".home"))
+        else:
+            return "Invalid username or password"
+
+    return render_template("login.html")
+
+
+@bp.route("/logout")
+def logout():
+    session.pop("username", None)
+    session.pop("user_id", None)
+    return redirect(url_for(".login"))
+
+
+@bp.route("/forgot-password", methods=["GET", "POST"])
+def forgot_password():
+    if request.method == "POST":
+        username = request.form["username"]
+        auth.check_rate(ip=request.remote_addr)
+
+        if auth.get_user_id(username) is not None:
+            return redirect(url_for(".reset_password", username=username))
+        else:
+            return "No such user found."
+
+    return render_template("forgot_password.html")
+
+
+@bp.route("/reset-password/<username>", methods=["GET", "POST"])
+def reset_password(username):
+    if request.method == "POST":
+        new_password = request.form["password"]
+        auth.check_rate(ip=request.remote_addr)
+        auth.update_password(username, new_password)
+        return redirect(url_for(".login"))
+
+    return render_template("reset_password.html", username=username)
+
+
+@bp.route("/change-password", methods=["GET", "POST"])
+@login_required
+def change_password():
+    username = session["username"]
+
+    if request.method == "POST":
+        current_password = request.form["current_password"]
+        new_password = request.form["new_password"]
+
+        # 1. Verify current password
+        if auth.verify_user(username, current_password, ip=request.remote_addr) is None:
+            return "Current password is incorrect."
+
+        # 2. Update new password
+        auth.update_password(username, new_password)
+
+        return "Password changed successfully!"
+
+    return render_template("change_password.html", username=username)
+
+
+# ----------------------------
+# PROTECTED APP ROUTES
+# ----------------------------
+
+@bp.route("/")
+@login_required
+def home():
+    return render_template("index.html")
+
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_page_cursor(cursor):
+    """(date, id) -> 'date_id' for use in a query string."""
+    return f"{cursor[0]}_{cursor[1]}"
+
+
+def decode_page_cursor(value):
+    """'date_id' -> (date, id), or None if missing/invalid."""
+    if not value:
+        return None
+    date, _, expense_id = value.rpartition("_")
+    if not date or not expense_id.isdigit():
+        return None
+    return date, int(expense_id)
+
+
+def parse_filters(args):
+    """TransactionFilter from the filter controls' query string.
+
+    'to' is inclusive in the form. Values that do not parse are ignored.
+    """
+    values = {
+        "category": args.get("category", "").strip() or None,
+        "min_amount": args.get("min", type=float),
+        "max_amount": args.get("max", type=float),
+        "text": args.get("q", "").strip() or None,
+    }
+    for name, bound, field in (("from", 0, "start"), ("to", 1, "end")):
+        try:
+            values[field] = period_range(args.get(name, ""))[bound]
+        except ValueError:
+            values[field] = None
+    return TransactionFilter(**values)
+
+
+# Query string keys of the filter controls, carried over to the next page
+FILTER_ARGS = ("q", "category", "from", "to", "min", "max", "sort")
+
+
+@bp.route("/transactions")
+@login_required
+def transactions():
+    size = request.args.get("size", PAGE_SIZE, type=int)
+    size = max(1, min(size, MAX_PAGE_SIZE))
+
+    filters = parse_filters(request.args)
+    filter_args = {name: request.args[name] for name in FILTER_ARGS if request.args.get(name)}
+    sort = "newest" if request.args.get("sort") == "newest" else "best"
+
+    # Text alone can be ranked by relevance; combined filters list newest first
+    if filters.shape == ("text",) and sort == "best":
+        offset = max(0, request.args.get("offset", 0, type=int))
+        results = search_transactions(session["user_id"], filters.text, limit=size, offset=offset)
+        return render_template(
+            "transactions.html",
+            rows=results.rows,
+            size=size,
+            filters=filters,
+            filter_args=filter_args,
+            ranked=True,
+            offset=offset,
+            next_offset=results.next_offset,
+        )
+
+    after = decode_page_cursor(request.args.get("after"))
+
+    plan = None
+    if current_app.debug and filters.shape:
+        plan = explain_transactions(session["user_id"], filters, size, after)
+
+    # Rows are streamed to the client as the template renders them
+    page = query_transactions(session["user_id"], filters, limit=size, after=after)
+    return stream_template(
+        "transactions.html",
+        rows=page,
+        size=size,
+        filters=filters,
+        filter_args=filter_args,
+        ranked=False,
+        plan=plan,
+        is_first_page=after is None,
+        encode_page_cursor=encode_page_cursor,
+    )
+
+
+@bp.route("/add", methods=["GET", "POST"])
+@login_required
+def add_expense():
+    if request.method == "POST":
+        date = request.form["date"]
+        category = request.form["category"]
+        note = request.form["note"]
+
+        try:
+            amount = float(request.form["amount"])
+            # IMPORTANT: match db.py signature (user_id, date, category, amount, note)
+            add_transaction(session["user_id"], date, category, amount, note)
+        except ValueError as e:
+            return render_template("add_expense.html", error=str(e)), 400
+
+        return redirect(url_for(".transactions"))
+
+    return render_template("add_expense.html")
+
+
+@bp.route("/import", methods=["GET", "POST"])
+@login_required
+def import_statement():
+    if request.method == "POST":
+        upload = request.files.get("file")
+        if not upload or not upload.filename:
+            return render_template("import.html", error="Choose a CSV file to import.")
+
+        source = request.form.get("source", "").strip() or upload.filename
+
+        try:
+            result = import_upload(session["user_id"], upload.stream, source)
+        except (ValueError, UnicodeDecodeError) as e:
+            return render_template("import.html", error=f"Could not import file: {e}")
+
+        return render_template("import.html", result=result)
+
+    return render_template("import.html")
+
+
+@bp.route("/edit/<int:expense_id>", methods=["GET", "POST"])
+@login_required
+def edit_expense(expense_id):
+    error = None
+    if request.method == "POST":
+        date = request.form["date"]
+        category = request.form["category"]
+        note = request.form["note"]
+
+        try:
+            amount = float(request.form["amount"])
+            # match db.py: update_expense(user_id, expense_id, amount, category, note, date)
+            update_expense(session["user_id"], expense_id, amount, category, note, date)
+            return redirect(url_for(".transactions"))
+        except ValueError as e:
+            error = str(e)
+
+    # GET (or a rejected edit) → show existing expense
+    expense = get_expense_by_id(session["user_id"], expense_id)
+    if expense is None:
+        abort(404)
+    return render_template("edit_expense.html", expense=expense, error=error), 400 if error else 200
+
+
+@bp.route("/delete/<int:expense_id>")
+@login_required
+def delete(expense_id):
+    delete_expense(session["user_id"], expense_id)
+    return redirect(url_for(".transactions"))
+
+
+@bp.route("/analysis")
+@login_required
+def analysis_page():
+    snapshot = get_dashboard_snapshot(session["user_id"])
+
+    budget = request.args.get("budget", type=float)
+    analytics = get_analytics(session["user_id"], budget=budget if budget and budget > 0 else None)
+
+    # Convert to chart-friendly lists
+    category_labels = [c[0] for c in snapshot.categories]
+    category_amounts = [c[1] for c in snapshot.categories]
+
+    return render_template(
+        "analysis.html",
+        total_month=snapshot.total_month,
+        total_today=snapshot.total_today,
+        highest=snapshot.highest,
+        avg_daily=snapshot.avg_daily,
+        count=snapshot.count,
+        categories=snapshot.categories,
+        category_labels=category_labels,
+        category_amounts=category_amounts,
+        analytics=analytics,
+    )
+
+
+@bp.route("/export")
+@login_required
+def export_csv():
+    # Stream the CSV as it is generated instead of building it in memory
+    chunks = iter_csv(iter_transactions_for_export(session["user_id"]))
+
+    if request.args.get("gzip") == "1":
+        body = iter_gzip(chunks)
+        mimetype = "application/gzip"
+        filename = "waist_export.csv.gz"
+    else:
+        body = chunks
+        mimetype = "text/csv"
+        filename = "waist_export.csv"
+
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+
+    return response
+
+
+@bp.route("/insights")
+@login_required
+def insights():
+    user_id = session["user_id"]
+
+    # Served from the jobs table if already generated for this data version,
+    # otherwise generated in the background while the page polls for it
+    job = jobs.submit("insights", jobs.insights_key(user_id), key_prefix=f"{user_id}:")
+
+    # Unusual transactions come from the local detector, not the model,
+    # so they are shown straight away even while insights are pending
+    anomalies = get_anomalies(user_id)
+
+    if job.status == "done":
+        return render_template("insights.html", insights=job.result, anomalies=anomalies)
+
+    return render_template("insights_pending.html", job_id=job.id, anomalies=anomalies)
+
+
+@bp.route("/insights/anomalies")
+@login_required
+def insights_anomalies():
+    limit = request.args.get("limit", 20, type=int)
+    limit = max(1, min(limit, MAX_FLAGGED))
+    return jsonify({"anomalies": get_anomalies(session["user_id"], limit)})
+
+
+@bp.route("/insights/status/<int:job_id>")
+@login_required
+def insights_status(job_id):
+    job = jobs.get_job(job_id)
+    # Insights keys start with the owner's user id
+    if job is None or not job.key.startswith(f"{session['user_id']}:"):
+        return jsonify({"status": "missing"}), 404
+
+    return jsonify({"status": job.status})